@@ -0,0 +1,108 @@
+import json
+import logging
+
+from shared_state import STATE_FIELDS
+from speed_map import POT_TABLES
+
+# Every axis the machine drives, in the order the motion processes set them
+# up. Speeds (us) are the defaults, the config store's CALIBRATION_SPEED_<axis>
+# and HOMING_SPEED_<axis> override them where it has them. An axis without
+# buffer keys keeps ``buffer_low``/``buffer_high`` steps from its switches.
+# ``pot`` and ``switch`` are the shared state fields its speed and direction
+# come from in bounce mode, ``labels`` name its negative and positive sides.
+AXES = {
+    'X': {
+        'dir_pin': 23,
+        'step_pin': 24,
+        'limit_neg': 10,
+        'limit_pos': 9,
+        'labels': ('Left', 'Right'),
+        'calibration_speed': 1000,
+        'homing_speed': 250,
+        'buffer_low_key': 'MOVEMENT_BUFFER_LEFT',
+        'buffer_high_key': 'MOVEMENT_BUFFER_RIGHT',
+        'pot': 'pot_x',
+        'switch': 'switch_x',
+        'canvas_key': 'CANVAS_FRAME_X',
+        'spin_threshold_us': 200,
+    },
+    'Y': {
+        'dir_pin': 27,
+        'step_pin': 22,
+        'limit_neg': 0,
+        'limit_pos': 11,
+        'labels': ('Down', 'Up'),
+        'calibration_speed': 1500,
+        'homing_speed': 375,
+        'buffer_low_key': 'MOVEMENT_BUFFER_BOTTOM',
+        'buffer_high_key': 'MOVEMENT_BUFFER_TOP',
+        'pot': 'pot_y',
+        'switch': 'switch_y',
+        'canvas_key': 'CANVAS_FRAME_Y',
+        'spin_threshold_us': 200,
+    },
+}
+
+# Fields an axis added from a file can leave out
+AXIS_DEFAULTS = {
+    'calibration_speed': 1000,
+    'homing_speed': 250,
+    'buffer_low_key': None,
+    'buffer_high_key': None,
+    'buffer_low': 0,
+    'buffer_high': 0,
+    'canvas_key': None,
+    'spin_threshold_us': 200,
+}
+
+_REQUIRED = ('dir_pin', 'step_pin', 'limit_neg', 'limit_pos', 'labels', 'pot', 'switch')
+
+# Shared state fields every axis publishes, see axis_state
+_STATE_KEYS = ('steps_{key}', 'total_steps_{key}', 'dir_{key}', 'calibrating_{key}', 'last_limit_{key}',
+               '{motor}_speed')
+
+
+def axis_config(motor):
+    try:
+        return AXES[motor]
+    except KeyError:
+        raise ValueError(f"Unknown motor {motor!r}. Axes: {sorted(AXES)}")
+
+
+def direction_label(motor, direction):
+    # Side of ``motor`` that ``direction`` moves toward, 'Right' for X (1, 0)
+    labels = axis_config(motor)['labels']
+    return labels[1] if direction == (1, 0) else labels[0]
+
+
+def load_axes(path):
+    """Add or change axes from a JSON file of {axis: {field: value}}.
+
+    Existing axes only change the fields given, new ones need the fields in
+    _REQUIRED and a slot in the shared state layout (X, Y, Z and A have
+    one). Call it before the motion processes start, they get the table when
+    they are forked.
+    """
+    with open(path) as f:
+        table = json.load(f)
+    state_fields = {name for name, _ in STATE_FIELDS}
+    for motor, fields in table.items():
+        fields = dict(fields)
+        if 'labels' in fields:
+            fields['labels'] = tuple(fields['labels'])
+        if motor in AXES:
+            AXES[motor].update(fields)
+            continue
+        missing = [name for name in _REQUIRED if name not in fields]
+        if missing:
+            raise ValueError(f"Axis {motor} in {path} is missing {missing}")
+        absent = [key.format(key=motor.lower(), motor=motor) for key in _STATE_KEYS
+                  if key.format(key=motor.lower(), motor=motor) not in state_fields]
+        if absent:
+            raise ValueError(f"Axis {motor} in {path} has no shared state fields {absent}")
+        if fields['pot'] not in POT_TABLES or fields['switch'] not in state_fields:
+            raise ValueError(f"Axis {motor} in {path} follows an unknown pot or switch: "
+                             f"{fields['pot']!r}, {fields['switch']!r}")
+        AXES[motor] = dict(AXIS_DEFAULTS, **fields)
+    logging.info(f"Axes from {path}: {', '.join(AXES)}")
+    return AXES
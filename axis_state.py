@@ -0,0 +1,91 @@
+import time
+import queue
+
+# Position, speed and direction are written to the shared state at most this
+# often per axis (Hz), and on every reversal, stop and re-zero
+POSITION_PUBLISH_HZ = 100
+
+# Commands other processes send an axis (see AxisState.commands)
+HOME = 'home'
+
+
+class AxisState:
+    """Position, speed and direction of one axis, owned by its motion process.
+
+    The step loop only changes local attributes. ``publish`` copies them to
+    the shared state in one write, at most ``publish_hz`` times a second
+    unless forced, so the display sees the axis at its refresh rate without
+    a shared state write per block.
+
+    Other processes do not write the position. They put a command on
+    ``commands`` (a multiprocessing Queue) and the step loop picks it up with
+    ``pending_commands`` between two blocks, when no pulses are queued.
+    """
+
+    def __init__(self, motor, shared_data, commands=None, publish_hz=POSITION_PUBLISH_HZ):
+        self.motor = motor
+        self.shared_data = shared_data
+        self.commands = commands
+        self.publish_interval_ns = int(1_000_000_000 / publish_hz) if publish_hz else 0
+        self.key = motor.lower()
+        self.steps = 0
+        self.total_steps = 0
+        self.speed = 0
+        self.direction = (0, 0)
+        self.next_publish_ns = 0
+
+    def reset(self, steps, total_steps):
+        # Known position, after calibration or a re-zero
+        self.steps = steps
+        self.total_steps = total_steps
+        self.publish(force=True)
+
+    def advance(self, delta, speed, direction):
+        # ``delta`` steps made at ``speed`` (the last step interval, us)
+        self.steps += delta
+        self.speed = speed
+        self.direction = direction
+        self.publish()
+
+    def reverse(self, direction):
+        self.direction = direction
+        self.publish(force=True)
+
+    def stop(self):
+        if self.speed or self.direction != (0, 0):
+            self.speed = 0
+            self.direction = (0, 0)
+            self.publish(force=True)
+
+    def publish(self, force=False):
+        now = time.monotonic_ns()
+        if not force and now < self.next_publish_ns:
+            return False
+        self.next_publish_ns = now + self.publish_interval_ns
+        self.shared_data.update({
+            f'steps_{self.key}': self.steps,
+            f'{self.motor}_speed': self.speed,
+            f'dir_{self.key}': self.direction,
+        })
+        return True
+
+    def pending_commands(self):
+        return pending_commands(self.commands)
+
+
+def pending_commands(commands):
+    # Everything sent on the ``commands`` Queue since the last call, in order
+    pending = []
+    while commands is not None:
+        try:
+            pending.append(commands.get_nowait())
+        except queue.Empty:
+            break
+    return pending
+
+
+def send_command(axis_commands, command, motors=None):
+    # Queue ``command`` for the given axes (all of them by default)
+    for motor, commands in axis_commands.items():
+        if motors is None or motor in motors:
+            commands.put(command)
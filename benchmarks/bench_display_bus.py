@@ -0,0 +1,68 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from display_bus import PagedDisplay, BusScheduler
+from fake_i2c import FakeI2C, FakeSSD1306
+from oled_display import Oled1Screen, Oled2Screen, OLED1_ADDRESS, OLED2_ADDRESS
+
+FRAME_INTERVAL = 0.05  # The old display loops pushed a frame every 50 ms
+
+
+def motion_states(seconds):
+    # Both axes bouncing inside their buffers at ~400 steps/s, then idle
+    state = {
+        'total_steps_x': 733, 'total_steps_y': 541, 'steps_x': 200, 'steps_y': 100,
+        'MOVEMENT_BUFFER_LEFT': 100, 'MOVEMENT_BUFFER_RIGHT': 200,
+        'MOVEMENT_BUFFER_TOP': 100, 'MOVEMENT_BUFFER_BOTTOM': 100,
+        'calibrating_x': False, 'calibrating_y': False,
+        'X_speed': 1250, 'Y_speed': 1250, 'pot_x': 30000, 'pot_y': 30000,
+        'dir_x': (1, 0), 'dir_y': (1, 0), 'mode': 0, 'current_mode': 'none',
+    }
+    frames = int(seconds / FRAME_INTERVAL)
+    for frame in range(frames):
+        if frame < frames // 2:
+            for axis, low, high in (('x', 100, 533), ('y', 100, 441)):
+                sign = 1 if state[f'dir_{axis}'] == (1, 0) else -1
+                state[f'steps_{axis}'] += sign * 20
+                if not low < state[f'steps_{axis}'] < high:
+                    state[f'dir_{axis}'] = (0, 1) if sign > 0 else (1, 0)
+        else:
+            state.update({'dir_x': (0, 0), 'dir_y': (0, 0), 'X_speed': 0, 'Y_speed': 0})
+        yield dict(state)
+
+
+def full_frames(seconds):
+    # Old behaviour: both screens rendered and sent in full every frame
+    devices = [FakeSSD1306(FakeI2C(address=OLED1_ADDRESS)), FakeSSD1306(FakeI2C(address=OLED2_ADDRESS))]
+    screens = [Oled1Screen(), Oled2Screen()]
+    images = [None, None]
+    for state in motion_states(seconds):
+        for index, (screen, device) in enumerate(zip(screens, devices)):
+            images[index] = screen.render(state) or images[index]
+            device.display(images[index])
+    return sum(device.serial.bytes for device in devices)
+
+
+def dirty_pages(seconds):
+    devices = [FakeSSD1306(FakeI2C(address=OLED1_ADDRESS)), FakeSSD1306(FakeI2C(address=OLED2_ADDRESS))]
+    screens = [Oled1Screen(), Oled2Screen()]
+    paged = [PagedDisplay(device) for device in devices]
+    bus = BusScheduler(paged)
+    for state in motion_states(seconds):
+        for screen, display in zip(screens, paged):
+            image = screen.render(state)
+            if image is not None:
+                display.set_frame(image)
+        bus.flush()
+    return sum(device.serial.bytes for device in devices)
+
+
+if __name__ == "__main__":
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 20.0
+    # Half of the run moving, half idle
+    before = full_frames(seconds)
+    after = dirty_pages(seconds)
+    print(f"full frames     {before / seconds:10.0f} bytes/s")
+    print(f"dirty pages     {after / seconds:10.0f} bytes/s  ({after / before:.1%} of full frames)")
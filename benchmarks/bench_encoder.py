@@ -0,0 +1,128 @@
+import os
+import sys
+import time
+import argparse
+from multiprocessing import Manager, Pipe, Process
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import simulation
+from buffer_manager import BufferManager, ADJUST_INTERVAL
+from config_store import ConfigStore
+from rotary_encoder import RotaryEncoderHandler
+from shared_state import SharedState
+from step_scheduler import precise_sleep_ns
+
+INITIAL = {
+    'total_steps_x': 10_000_000,
+    'current_mode': 'none',
+}
+
+# Far from total_steps_x, so no detent is clamped and LEFT + RIGHT stays constant
+BUFFERS = {
+    'MOVEMENT_BUFFER_LEFT': 1_000_000,
+    'MOVEMENT_BUFFER_RIGHT': 1_000_000,
+}
+
+# Every clockwise detent in x_position mode moves LEFT by this much
+DETENT_STEPS = 20
+
+
+def reader(state, config, conn, stop):
+    # Stand-in for the motor loop: (time, LEFT) at every new config version,
+    # plus how many LEFT/RIGHT pairs did not add up in a config snapshot and
+    # when read from the shared state mirror with one get per field
+    total = BUFFERS['MOVEMENT_BUFFER_LEFT'] + BUFFERS['MOVEMENT_BUFFER_RIGHT']
+    seen = []
+    version = config.version
+    torn_snapshots = torn_gets = reads = 0
+    while not stop.poll():
+        current = config.current()
+        if current.MOVEMENT_BUFFER_LEFT + current.MOVEMENT_BUFFER_RIGHT != total:
+            torn_snapshots += 1
+        if current.version != version:
+            version = current.version
+            seen.append((time.monotonic_ns(), current.MOVEMENT_BUFFER_LEFT))
+        if state.get('MOVEMENT_BUFFER_LEFT') + state.get('MOVEMENT_BUFFER_RIGHT') != total:
+            torn_gets += 1
+        reads += 1
+    conn.send((seen, torn_snapshots, torn_gets, reads))
+
+
+def run(adjust_interval, rate, seconds):
+    state = SharedState.create(INITIAL)
+    config = ConfigStore.create(BUFFERS, name=None, mirror=state)
+    manager = Manager()
+    encoder_state = manager.dict({'pressed': False, 'last_press_time': 0, 'adjustment_mode': 'none'})
+    buffer_manager = BufferManager(state, encoder_state, config, adjust_interval=adjust_interval)
+    encoder = RotaryEncoderHandler(13, 6, 5, buffer_manager.encoder_callback)
+    encoder_state['last_press_time'] = 0
+    for _ in range(2):  # 'none' -> 'x_scale' -> 'x_position'
+        encoder.button.when_pressed()
+        encoder_state['last_press_time'] = 0
+
+    results_in, results_out = Pipe(duplex=False)
+    stop_in, stop_out = Pipe(duplex=False)
+    process = Process(target=reader, args=(state, config, results_out, stop_in))
+    process.start()
+    time.sleep(0.2)
+
+    # Detents at a fixed rate through the fake encoder's gpiozero callback
+    period_ns = 1_000_000_000 // rate
+    count = int(rate * seconds)
+    sent = []
+    callback_ns = 0
+    start_ns = time.monotonic_ns()
+    for i in range(count):
+        delay = start_ns + i * period_ns - time.monotonic_ns()
+        if delay > 0:
+            precise_sleep_ns(delay)
+        sent.append(time.monotonic_ns())
+        encoder.rotary.when_rotated_clockwise()
+        callback_ns += time.monotonic_ns() - sent[-1]
+    elapsed = (time.monotonic_ns() - start_ns) / 1e9
+    time.sleep((adjust_interval or 0) + 0.2)
+    stop_out.send(None)
+    seen, torn_snapshots, torn_gets, reads = results_in.recv()
+    process.join()
+
+    applied = (config.current().MOVEMENT_BUFFER_LEFT - BUFFERS['MOVEMENT_BUFFER_LEFT']) // DETENT_STEPS
+    # Latency of detent i: until the reader first saw a LEFT that includes it
+    latencies = []
+    index = 0
+    for i, sent_ns in enumerate(sent):
+        while index < len(seen) and (seen[index][1] - BUFFERS['MOVEMENT_BUFFER_LEFT']) // DETENT_STEPS < i + 1:
+            index += 1
+        if index == len(seen):
+            break
+        latencies.append((seen[index][0] - sent_ns) / 1e6)
+    latencies.sort()
+    result = {
+        'detents': count,
+        'detents_per_s': round(count / elapsed),
+        'applied': applied,
+        'updates': buffer_manager.updates,
+        'callback_us': round(callback_ns / count / 1000, 1),
+        'p50_ms': round(latencies[len(latencies) // 2], 2) if latencies else None,
+        'p99_ms': round(latencies[int(len(latencies) * 0.99)], 2) if latencies else None,
+        'max_ms': round(latencies[-1], 2) if latencies else None,
+        'torn_snapshots': torn_snapshots,
+        'torn_gets': torn_gets,
+        'reads': reads,
+    }
+    config.close()
+    state.close()
+    manager.shutdown()
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Drive encoder detents through BufferManager at a fixed rate")
+    parser.add_argument('--rate', type=int, default=1000, help="detents per second")
+    parser.add_argument('--seconds', type=float, default=3.0)
+    args = parser.parse_args()
+
+    simulation.install()
+    for label, interval in (("coalesced", ADJUST_INTERVAL), ("per detent", None)):
+        result = run(interval, args.rate, args.seconds)
+        print(f"{label:<11} " + "  ".join(f"{key}={value}" for key, value in result.items()))
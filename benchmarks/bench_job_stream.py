@@ -0,0 +1,143 @@
+import os
+import sys
+import math
+import time
+import argparse
+import resource
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config_store import ConfigStore
+from coordinated_motion import run_job, MOTORS
+from job_stream import JobStreamer, JOB_END, RING_MOVES, convert, send
+from motion_planner import planner_limits, movement_window
+from pulse_output import RecordingPulseOutput
+from stepper_motor_control import axis_settings
+
+STATE = {
+    'total_steps_x': 4000, 'total_steps_y': 4000,
+    'MOVEMENT_BUFFER_LEFT': 100, 'MOVEMENT_BUFFER_RIGHT': 100,
+    'MOVEMENT_BUFFER_TOP': 100, 'MOVEMENT_BUFFER_BOTTOM': 100,
+    'ACCELERATION_BUFFER': 20,
+}
+
+# Circle of short chords around the middle of the travel, repeated
+CENTRE = (2000, 2000)
+RADIUS = 1500
+
+
+def chords_per_turn(chord):
+    return int(2 * math.pi * RADIUS / chord)
+
+
+def write_job(path, moves, chord):
+    # G-code job of ``moves`` chords of about ``chord`` steps at the top feed
+    _, _, max_speed = planner_limits(STATE)
+    per_turn = chords_per_turn(chord)
+    with open(path, 'w') as f:
+        f.write(f"; {moves} moves\nG90\nG0 X{CENTRE[0] + RADIUS} Y{CENTRE[1]}\nG1 F{max_speed * 60:.0f}\n")
+        for i in range(1, moves + 1):
+            angle = 2 * math.pi * (i % per_turn) / per_turn
+            f.write(f"X{CENTRE[0] + RADIUS * math.cos(angle):.1f} Y{CENTRE[1] + RADIUS * math.sin(angle):.1f}\n")
+        f.write("M2\n")
+
+
+def max_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def sender(job, path):
+    # Connect once the streamer listens, then push the whole job
+    for _ in range(100):
+        if os.path.exists(path):
+            break
+        time.sleep(0.01)
+    send(job, path)
+
+
+def ingest(source, job=None):
+    # Drain one job as fast as the reader can parse it
+    streamer = JobStreamer(source).start()
+    if job is not None:
+        threading.Thread(target=sender, args=(job, source[len('unix:'):]), daemon=True).start()
+    moves = 0
+    start = time.perf_counter()
+    while True:
+        rows = streamer.ring.get(RING_MOVES, timeout=1.0)
+        moves += len(rows)
+        if len(rows) and rows[-1, 3] == JOB_END:
+            break
+    elapsed = time.perf_counter() - start
+    streamer.stop()
+    return {
+        'moves': moves - 1,
+        'moves_per_s': round((moves - 1) / elapsed),
+        'MB_per_s': round(streamer.bytes_read / elapsed / 1e6, 1),
+        'full_waits': streamer.ring.full_waits,
+    }
+
+
+def run(source, job, chord):
+    # Execute a job streamed through the socket with the real step loop,
+    # timed like hardware, and see whether it ever waited for input
+    config = ConfigStore.local(STATE)
+    shared_data = {key: value for key, value in STATE.items() if key.startswith('total_steps')}
+    settings = {motor: axis_settings(motor) for motor in MOTORS}
+    pulse_output = RecordingPulseOutput(realtime=True, max_steps=1000)
+    streamer = JobStreamer(source).start()
+    threading.Thread(target=sender, args=(job, source[len('unix:'):]), daemon=True).start()
+    while not streamer.ready():
+        time.sleep(0.01)
+    position = [CENTRE[0] + RADIUS, CENTRE[1]]
+    start = time.perf_counter()
+    moves, clamped, starved = run_job(streamer, shared_data, config, pulse_output, settings, position)
+    elapsed = time.perf_counter() - start
+    streamer.stop()
+    _, _, max_speed = planner_limits(STATE)
+    path_steps = moves * 2 * math.pi * RADIUS / chords_per_turn(chord)
+    return {
+        'moves': moves,
+        'seconds': round(elapsed, 2),
+        'moves_per_s': round(moves / elapsed),
+        'path_speed': round(path_steps / elapsed),
+        'max_feed': round(max_speed),
+        'starved': starved,
+        'ring_underruns': streamer.ring.underruns,
+        'ring_low_water': streamer.ring.low_water,
+        'clamped': clamped,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Job ingestion throughput and step loop starvation at the top feed")
+    parser.add_argument('--moves', type=int, default=300_000, help="moves in the ingestion job")
+    parser.add_argument('--seconds', type=float, default=5.0, help="length of the step loop run")
+    parser.add_argument('--chord', type=int, default=4, help="steps per move")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        gcode = os.path.join(directory, 'job.gcode')
+        binary = os.path.join(directory, 'job.mjob')
+        socket_source = 'unix:' + os.path.join(directory, 'job.sock')
+        write_job(gcode, args.moves, args.chord)
+        convert(gcode, binary)
+        print(f"job: {args.moves} moves, G-code {os.path.getsize(gcode) / 1e6:.1f} MB, "
+              f"binary {os.path.getsize(binary) / 1e6:.1f} MB")
+
+        rss = max_rss_mb()
+        for label, source, job in (("G-code file", gcode, None), ("binary file", binary, None),
+                                   ("G-code socket", socket_source, gcode), ("binary socket", socket_source, binary)):
+            result = ingest(source, job)
+            print(f"{label:<14} " + "  ".join(f"{key}={value}" for key, value in result.items()))
+        print(f"peak RSS grew by {max_rss_mb() - rss:.1f} MB while streaming")
+
+        # At the top feed a move of ``chord`` steps takes chord / max_feed seconds
+        _, _, max_speed = planner_limits(STATE)
+        short = os.path.join(directory, 'short.gcode')
+        write_job(short, int(args.seconds * max_speed / args.chord), args.chord)
+        print(f"step loop at {max_speed:.0f} steps/s needs {max_speed / args.chord:.0f} moves/s, "
+              f"window {movement_window(STATE)}")
+        result = run(socket_source, short, args.chord)
+        print("step loop      " + "  ".join(f"{key}={value}" for key, value in result.items()))
@@ -0,0 +1,53 @@
+import math
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from motion_planner import MotionPlanner, planner_limits, movement_window
+
+STATE = {
+    'total_steps_x': 4000, 'total_steps_y': 4000,
+    'MOVEMENT_BUFFER_LEFT': 100, 'MOVEMENT_BUFFER_RIGHT': 100,
+    'MOVEMENT_BUFFER_TOP': 100, 'MOVEMENT_BUFFER_BOTTOM': 100,
+    'ACCELERATION_BUFFER': 20,
+}
+
+
+def polyline(chords=360):
+    # A circle of ``chords`` chords followed by a zig-zag with shallow corners
+    points = []
+    for i in range(chords + 1):
+        angle = 2 * math.pi * i / chords
+        points.append((2000 + 1500 * math.cos(angle), 2000 + 1500 * math.sin(angle)))
+    for i in range(60):
+        points.append((500 + i * 50, 2000 + (200 if i % 2 else -200)))
+    return points
+
+
+def job_time_us(points, lookahead, state=STATE):
+    acceleration, min_speed, max_speed = planner_limits(state)
+    planner = MotionPlanner(acceleration, min_speed, max_speed, movement_window(state),
+                            position=points[0], lookahead=lookahead)
+    total = 0
+    for x, y in points[1:]:
+        if planner.full:
+            total += planner.pop().duration_us()
+        planner.add_line(x, y, max_speed)
+    while len(planner):
+        total += planner.pop().duration_us()
+    return total
+
+
+if __name__ == "__main__":
+    # Depth only matters once the distance to stop from the top speed spans
+    # several segments: fine chords, or a longer ramp (heavier axes)
+    for chords, ramp in ((360, 20), (2000, 20), (360, 200)):
+        points = polyline(chords)
+        state = dict(STATE, ACCELERATION_BUFFER=ramp)
+        without = job_time_us(points, 1, state)
+        print(f"{len(points) - 1} segments, {ramp} step ramp")
+        print(f"  stop at every vertex: {without / 1e6:8.3f} s")
+        for lookahead in (2, 4, 16):
+            with_lookahead = job_time_us(points, lookahead, state)
+            print(f"  look-ahead {lookahead:>2}:        {with_lookahead / 1e6:8.3f} s  ({without / with_lookahead:.2f}x faster)")
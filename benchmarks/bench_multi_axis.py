@@ -0,0 +1,98 @@
+import os
+import sys
+import time
+import argparse
+from multiprocessing import Process, Queue
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from multi_axis import DeadlineScheduler
+from step_scheduler import StepScheduler
+
+BLOCK_STEPS = 2000
+
+_NEVER = bytes(1)
+
+
+def no_output(pins, value):
+    pass
+
+
+class FixedAxis:
+    """Driver that always has another block of ``interval`` us steps."""
+
+    def __init__(self, interval):
+        self.block = np.full(BLOCK_STEPS, interval, dtype=np.uint32)
+        self.steps = 0
+
+    def next_block(self):
+        return (1, 0), self.block, _NEVER
+
+    def block_done(self, emitted):
+        self.steps += emitted
+
+
+def run_heap(axes, interval, seconds):
+    # ``axes`` axes of one process on the deadline heap
+    scheduler = DeadlineScheduler(no_output, StepScheduler())
+    drivers = [FixedAxis(interval) for _ in range(axes)]
+    for pin, driver in enumerate(drivers):
+        scheduler.add(2 * pin, 2 * pin + 1, driver)
+    cpu, start = time.process_time(), time.perf_counter()
+    scheduler.run(until_ns=time.perf_counter_ns() + int(seconds * 1e9))
+    wall, cpu = time.perf_counter() - start, time.process_time() - cpu
+    return scheduler.steps, wall, cpu, scheduler.scheduler.stats()['p99_us']
+
+
+def axis_process(interval, seconds, results):
+    # One axis per process, stepping like GPIOPulseOutput.emit
+    scheduler = StepScheduler()
+    steps = 0
+    cpu = time.process_time()
+    end = time.perf_counter_ns() + int(seconds * 1e9)
+    while time.perf_counter_ns() < end:
+        for _ in range(BLOCK_STEPS):
+            no_output(1, 1)
+            scheduler.wait_us(interval)
+            no_output(1, 0)
+            scheduler.wait_us(interval)
+            steps += 1
+    results.put((steps, time.process_time() - cpu, scheduler.stats()['p99_us']))
+
+
+def run_processes(axes, interval, seconds):
+    results = Queue()
+    processes = [Process(target=axis_process, args=(interval, seconds, results)) for _ in range(axes)]
+    start = time.perf_counter()
+    for process in processes:
+        process.start()
+    done = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    wall = time.perf_counter() - start
+    return sum(r[0] for r in done), wall, sum(r[1] for r in done), max(r[2] for r in done)
+
+
+def report(label, axes, result, lateness=True):
+    steps, wall, cpu, p99 = result
+    # Saturated, every deadline is already due and the lateness only says how far behind the run fell
+    late = f"p99 lateness {p99:7.1f} us  " if lateness else ""
+    print(f"{label:<10} {axes} axes  {steps / wall:9.0f} steps/s  {late}cores {cpu / wall:4.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Aggregate step rate of the deadline heap against one process per axis")
+    parser.add_argument('--axes', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--seconds', type=float, default=2.0)
+    parser.add_argument('--interval', type=int, default=250, help="step half-period of the paced runs (us)")
+    args = parser.parse_args()
+
+    print(f"saturated (0 us intervals), no-op pin output, {os.cpu_count()} CPUs")
+    for axes in args.axes:
+        report("heap", axes, run_heap(axes, 0, args.seconds), lateness=False)
+    print(f"paced at {args.interval} us per edge ({500_000 / args.interval:.0f} steps/s per axis)")
+    for axes in args.axes:
+        report("heap", axes, run_heap(axes, args.interval, args.seconds))
+        report("processes", axes, run_processes(axes, args.interval, args.seconds))
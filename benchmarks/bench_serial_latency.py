@@ -0,0 +1,52 @@
+import os
+import sys
+import time
+from multiprocessing import Process
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data_broker import data_broker
+from fake_controller import FakeController
+from serial_protocol import Sample
+from shared_state import SharedState
+
+
+def measure(controller, shared_data, binary, rounds):
+    # Time from writing a sample until data_broker has published it. The pots
+    # are filtered by the broker, so mode2 carries an unfiltered marker value.
+    latencies = []
+    for i in range(rounds):
+        marker = (i % 255) + 1 if shared_data['mode2'] != (i % 255) + 1 else 0
+        sample = Sample(30000, 30000, (1, 0), (0, 1), 0, marker)
+        start = time.perf_counter()
+        controller.send([sample], binary=binary)
+        deadline = start + 1.0
+        while shared_data['mode2'] != marker and time.perf_counter() < deadline:
+            pass
+        latencies.append((time.perf_counter() - start) * 1000)
+        time.sleep(0.002)
+    latencies.sort()
+    return latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99)], latencies[-1]
+
+
+if __name__ == "__main__":
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    controller = FakeController()
+    shared_data = SharedState.create()
+    broker = Process(target=data_broker, args=(shared_data, controller.port_name), daemon=True)
+    broker.start()
+    time.sleep(0.5)
+    try:
+        for binary in (True, False):
+            p50, p99, worst = measure(controller, shared_data, binary, rounds)
+            label = 'binary' if binary else 'ascii'
+            print(f"{label:<7} input-to-state latency  p50 {p50:6.2f} ms  p99 {p99:6.2f} ms  max {worst:6.2f} ms")
+        # Let the broker publish its counters once more
+        time.sleep(1.1)
+        counters = shared_data.snapshot(['broker_frames_received', 'broker_frames_dropped',
+                                         'broker_writes', 'broker_writes_suppressed'])
+        print(' '.join(f"{key[7:]}={value}" for key, value in counters.items()))
+    finally:
+        broker.terminate()
+        controller.close()
+        shared_data.close()
@@ -0,0 +1,55 @@
+import os
+import sys
+import time
+from multiprocessing import Manager
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared_state import SharedState
+
+# Access pattern of one bounce-mode step in motor_control_thread
+def one_step(shared_data, motor='x'):
+    shared_data[f'switch_{motor}']
+    shared_data[f'pot_{motor}']
+    steps = shared_data[f'steps_{motor}']
+    total_steps = shared_data[f'total_steps_{motor}']
+    shared_data.get('MOVEMENT_BUFFER_LEFT', 100)
+    shared_data.get('MOVEMENT_BUFFER_RIGHT', 200)
+    shared_data.get('ACCELERATION_BUFFER', 20)
+    shared_data['X_speed'] = 1000
+    shared_data.get('MOVEMENT_BUFFER_RIGHT', 200)
+    shared_data.get('MOVEMENT_BUFFER_LEFT', 100)
+    shared_data[f'steps_{motor}'] = steps + 1
+    shared_data[f'dir_{motor}'] = (1, 0)
+    shared_data[f'steps_{motor}']
+    return total_steps
+
+
+def bench(label, shared_data, steps):
+    start = time.perf_counter()
+    for _ in range(steps):
+        one_step(shared_data)
+    elapsed = time.perf_counter() - start
+    per_step_us = elapsed / steps * 1_000_000
+    print(f"{label:<14} {per_step_us:10.2f} us/step  {1_000_000 / per_step_us:12.0f} steps/s max")
+    return per_step_us
+
+
+if __name__ == "__main__":
+    steps = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    initial = {
+        'pot_x': 0, 'switch_x': (1, 0), 'steps_x': 0, 'total_steps_x': 1000,
+        'dir_x': (0, 0), 'X_speed': 0,
+        'MOVEMENT_BUFFER_LEFT': 100, 'MOVEMENT_BUFFER_RIGHT': 200, 'ACCELERATION_BUFFER': 20,
+    }
+
+    manager = Manager()
+    proxy = manager.dict(initial)
+    state = SharedState.create(initial)
+    try:
+        proxy_us = bench("Manager.dict", proxy, steps)
+        shm_us = bench("SharedState", state, steps)
+        print(f"speedup: {proxy_us / shm_us:.1f}x")
+    finally:
+        state.close()
+        manager.shutdown()
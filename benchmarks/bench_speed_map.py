@@ -0,0 +1,82 @@
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config_store import ConfigStore
+from data_broker import ChannelFilter, CHANNEL_FILTERS, same_speed
+from speed_map import SpeedMap, SPEED_CURVES, POT_VALUES
+
+
+def map_value(value, from_low, from_high, to_low, to_high):
+    # The per-step mapping the motor loop used before the speed map
+    return to_low + (to_high - to_low) * (value - from_low) / (from_high - from_low)
+
+
+def per_call_ns(function, pots):
+    start = time.perf_counter_ns()
+    for pot_value in pots:
+        function(pot_value)
+    return (time.perf_counter_ns() - start) / len(pots)
+
+
+def pot_sweep(samples, noise, seed=1):
+    # A slow sweep over the whole pot travel with ADC noise on top
+    rng = np.random.default_rng(seed)
+    sweep = np.linspace(0, POT_VALUES - 1, samples) + rng.normal(0, noise, samples)
+    return np.clip(np.rint(sweep), 0, POT_VALUES - 1).astype(int).tolist()
+
+
+def broker_writes(samples, tables=None):
+    # Pot writes data_broker makes for ``samples``, with and without the speed map
+    channel = ChannelFilter(**CHANNEL_FILTERS['pot_x'])
+    published = None
+    writes = 0
+    for value in samples:
+        value = channel.update(value)
+        if value != published and not same_speed(tables, 'pot_x', published, value):
+            published = value
+            writes += 1
+    return writes
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pot to interval lookups against the per-step float mapping")
+    parser.add_argument('--lookups', type=int, default=200_000)
+    parser.add_argument('--samples', type=int, default=20_000, help="serial samples in the pot sweep")
+    parser.add_argument('--noise', type=float, default=40.0, help="pot noise (raw units, std dev)")
+    args = parser.parse_args()
+
+    pots = np.random.default_rng(0).integers(0, POT_VALUES, args.lookups).tolist()
+    config = ConfigStore.local()
+    speed_map = SpeedMap.local(config.current())
+    config.listeners.append(speed_map.sync)
+
+    # Each includes the same Python call overhead, measured on its own
+    overhead = per_call_ns(lambda pot_value: pot_value, pots)
+    legacy = per_call_ns(lambda pot_value: map_value(pot_value, 300, 65535, 500000, 250), pots) - overhead
+    per_call = per_call_ns(lambda pot_value: speed_map.current().interval('X', pot_value), pots) - overhead
+    # As the step loops do it, once per block
+    lookup = per_call_ns(lambda pot_value: speed_map.lookup('X', pot_value), pots) - overhead
+    table = speed_map.current().table('X')
+    index = per_call_ns(lambda pot_value: table[pot_value], pots) - overhead
+    print(f"map_value {legacy:.0f} ns per call, speed map lookup() {lookup:.0f} ns, "
+          f"current().interval() {per_call:.0f} ns, bare table index {index:.0f} ns")
+
+    sweep = pot_sweep(args.samples, args.noise)
+    print(f"broker pot writes over a {args.samples}-sample sweep without the speed map: {broker_writes(sweep)}")
+    for index, curve in enumerate(SPEED_CURVES):
+        start = time.perf_counter_ns()
+        config.update(SPEED_CURVE_X=index, SPEED_CURVE_Y=index)
+        rebuild_ms = (time.perf_counter_ns() - start) / 1e6
+        tables = speed_map.current()
+        half = tables.interval('X', POT_VALUES // 2)
+        print(f"{curve:<12} rebuild {rebuild_ms:5.1f} ms  half pot {500_000 / half:7.1f} steps/s  "
+              f"broker writes {broker_writes(sweep, tables)}")
+    before = speed_map.rebuilds
+    config.update(MOVEMENT_BUFFER_LEFT=150)
+    print(f"rebuilds after a buffer change: {speed_map.rebuilds - before}")
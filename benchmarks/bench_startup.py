@@ -0,0 +1,78 @@
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from serial_protocol import Sample
+from simulation import Simulation
+from bench_system import RESULTS_DIR, REPO, git_revision
+
+# Modules timed on their own in a fresh interpreter
+IMPORT_MODULES = ('main_script', 'stepper_motor_control', 'coordinated_motion', 'oled_display', 'data_broker')
+
+# Switches on from the start, so bounce motion begins right after calibration
+RUN_SAMPLE = Sample(65535, 65535, (1, 0), (1, 0), 0, 1)
+
+
+def import_time(module):
+    code = f"import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+    output = subprocess.run([sys.executable, '-c', code], cwd=REPO, capture_output=True, text=True, check=True)
+    return float(output.stdout.strip()) * 1000
+
+
+def launch(timeout):
+    # One boot of main_script on simulated hardware: seconds from launch until
+    # the shared state exists, the first (homing) step and bounce motion per axis
+    sim = Simulation(sample=RUN_SAMPLE, log_path=os.devnull)
+    for axis in sim.axes.values():
+        axis.arm()
+    with sim:
+        state = sim.state(timeout)
+        result = {'state_s': time.monotonic() - sim.started, 'first_step_s': {}, 'motion_s': {}}
+        for name, axis in sim.axes.items():
+            sim.wait_for(lambda: axis.first_step_ns, timeout)
+            result['first_step_s'][name] = axis.first_step_ns / 1e9 - sim.started
+        for name, axis in sim.axes.items():
+            key = name.lower()
+            sim.wait_for(lambda: not state[f'calibrating_{key}'] and state[f'total_steps_{key}'] > 0, timeout)
+            axis.arm()
+            sim.wait_for(lambda: axis.first_step_ns, timeout)
+            result['motion_s'][name] = axis.first_step_ns / 1e9 - sim.started
+    return result
+
+
+def median(values):
+    values = sorted(values)
+    return round(values[len(values) // 2], 3)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time from launching main_script.py until motion begins")
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--timeout', type=float, default=30.0)
+    parser.add_argument('--output', help="result file (default benchmarks/results/startup-<commit>.json)")
+    args = parser.parse_args()
+
+    commit, dirty = git_revision()
+    imports = {module: round(median([import_time(module) for _ in range(args.runs)]), 1) for module in IMPORT_MODULES}
+    runs = [launch(args.timeout) for _ in range(args.runs)]
+    results = {
+        'commit': commit,
+        'dirty': dirty,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'runs': args.runs,
+        'import_ms': imports,
+        'state_s': median([run['state_s'] for run in runs]),
+        'first_step_s': {axis: median([run['first_step_s'][axis] for run in runs]) for axis in runs[0]['first_step_s']},
+        'motion_s': {axis: median([run['motion_s'][axis] for run in runs]) for axis in runs[0]['motion_s']},
+    }
+    print(json.dumps(results, indent=2))
+    output = args.output or os.path.join(RESULTS_DIR, f"startup-{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Saved {output}")
@@ -0,0 +1,45 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from step_scheduler import StepScheduler
+
+# Step intervals (us, STEP high and low time as in pulse_output) across the speed range
+INTERVALS_US = [2000, 1000, 500, 250, 125, 60, 30]
+
+
+def run_sleep(interval_us, steps):
+    # What the original sleep() helper did: two time.sleep calls per step
+    seconds = interval_us / 1_000_000.0
+    start = time.perf_counter()
+    for _ in range(steps):
+        time.sleep(seconds)
+        time.sleep(seconds)
+    return steps / (time.perf_counter() - start)
+
+
+def run_scheduler(interval_us, steps, spin_threshold_us):
+    scheduler = StepScheduler(spin_threshold_us)
+    scheduler.start()
+    start = time.perf_counter()
+    for _ in range(steps):
+        scheduler.wait_us(interval_us)
+        scheduler.wait_us(interval_us)
+    return steps / (time.perf_counter() - start), scheduler.stats()
+
+
+if __name__ == "__main__":
+    spin_threshold_us = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    duration_s = 0.25
+    print(f"spin threshold {spin_threshold_us} us")
+    print(f"{'interval':>9} {'commanded':>10} {'time.sleep':>11} {'scheduler':>10} "
+          f"{'late max':>9} {'late p99':>9} {'late mean':>10}")
+    for interval_us in INTERVALS_US:
+        commanded = 1_000_000 / (2 * interval_us)
+        steps = max(10, int(commanded * duration_s))
+        achieved_sleep = run_sleep(interval_us, steps)
+        achieved, stats = run_scheduler(interval_us, steps, spin_threshold_us)
+        print(f"{interval_us:>7}us {commanded:>8.0f}/s {achieved_sleep:>9.0f}/s {achieved:>8.0f}/s "
+              f"{stats['max_us']:>7.1f}us {stats['p99_us']:>7.1f}us {stats['mean_us']:>8.1f}us")
@@ -0,0 +1,202 @@
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from serial_protocol import Sample
+from simulation import Simulation, SIM_TRAVEL
+from metrics import QUANTILES
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(REPO, 'benchmarks', 'results')
+
+# Full speed on both pots, switches in the middle (stopped)
+START_SAMPLE = Sample(65535, 65535, (0, 0), (0, 0), 0, 1)
+
+
+def distribution(values_ms):
+    values = sorted(values_ms)
+    if not values:
+        return None
+    return {
+        'count': len(values),
+        'mean_ms': round(sum(values) / len(values), 3),
+        'p50_ms': round(values[len(values) // 2], 3),
+        'p90_ms': round(values[int(len(values) * 0.9)], 3),
+        'max_ms': round(values[-1], 3),
+    }
+
+
+def calibration_time(sim, timeout):
+    # Seconds from launching main_script until each axis has its travel measured
+    state = sim.state(timeout)
+    done = {}
+    deadline = time.monotonic() + timeout
+    while len(done) < len(sim.axes) and time.monotonic() < deadline:
+        values = state.snapshot()
+        for axis in sim.axes:
+            key = axis.lower()
+            if axis not in done and not values[f'calibrating_{key}'] and values[f'total_steps_{key}'] > 0:
+                done[axis] = round(time.monotonic() - sim.started, 3)
+        time.sleep(0.001)
+    return done
+
+
+def cached_calibration_time(calibration_file, start, timeout, log_path, motion_mode='bounce'):
+    # Second boot with the cache of the first one and the carriages where it
+    # left them: only the touch-off against the negative switch should run
+    with Simulation(motion_mode=motion_mode, sample=START_SAMPLE, log_path=log_path, start=start,
+                    calibration_file=calibration_file) as sim:
+        return calibration_time(sim, timeout)
+
+
+def steady_motion(sim, seconds):
+    # Both axes bouncing between their buffers at full pot: achieved step rate
+    # at the carriages, display frame rates and step timing over the same window
+    sim.set_inputs(switch_x=(1, 0), switch_y=(1, 0))
+    time.sleep(0.5)
+    metrics = sim.metrics()
+    renders_before = {key: value['count'] for key, value in metrics.summaries().items()}
+    steps_before = {name: axis.steps for name, axis in sim.axes.items()}
+    start = time.monotonic()
+    time.sleep(seconds)
+    elapsed = time.monotonic() - start
+    summaries = metrics.summaries()
+    steps_per_s = {name: round((axis.steps - steps_before[name]) / elapsed, 1) for name, axis in sim.axes.items()}
+    fps = {key[len('render_time_'):]: round((summaries[key]['count'] - renders_before[key]) / elapsed, 2)
+           for key in ('render_time_oled1', 'render_time_oled2', 'render_time_bus_flush')}
+    lateness = {key[len('step_lateness_'):].upper(): {f'p{q * 100:g}_us': round(summaries[key][q] / 1000, 2)
+                                                    for q in QUANTILES}
+                for key in summaries if key.startswith('step_lateness_')}
+    return steps_per_s, fps, lateness
+
+
+def input_to_motion(sim, rounds):
+    # Switch flipped on the controller until the first STEP edge at the carriage
+    latencies = {}
+    for name, axis in sim.axes.items():
+        switch = f'switch_{name.lower()}'
+        samples = []
+        for _ in range(rounds):
+            sim.set_inputs(**{switch: (0, 0)})
+            # Stopped once no pulse arrived for a while
+            last = axis.steps
+            quiet_since = time.monotonic()
+            while time.monotonic() - quiet_since < 0.05:
+                time.sleep(0.002)
+                if axis.steps != last:
+                    last, quiet_since = axis.steps, time.monotonic()
+            axis.arm()
+            sent_ns = time.monotonic_ns()
+            sim.set_inputs(**{switch: (1, 0)})
+            if sim.wait_for(lambda: axis.first_step_ns, 1.0) is not None:
+                samples.append((axis.first_step_ns - sent_ns) / 1e6)
+        latencies[name] = distribution(samples)
+    return latencies
+
+
+def encoder_to_buffer(sim, rounds):
+    # Detent on the buffer encoder until the new buffer is in shared state
+    state = sim.state()
+    sim.encoder(0, 'PRESS')  # menu to 'x_scale'
+    sim.encoder(0, 'RELEASE')
+    sim.wait_for(lambda: state['current_mode'] == 'x_scale', 2.0)
+    samples = []
+    for i in range(rounds):
+        version = state['buffer_version']
+        sent = time.monotonic()
+        sim.encoder(0, 'RIGHT' if i % 2 else 'LEFT')
+        if sim.wait_for(lambda: state['buffer_version'] != version, 1.0) is not None:
+            samples.append((time.monotonic() - sent) * 1000)
+        time.sleep(0.005)
+    return distribution(samples)
+
+
+def git_revision():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=REPO,
+                                    capture_output=True, text=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown', False
+    return commit, dirty
+
+
+def run_suite(args):
+    commit, dirty = git_revision()
+    results = {
+        'commit': commit,
+        'dirty': dirty,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'config': {'travel': SIM_TRAVEL, 'motion_mode': args.motion_mode, 'rounds': args.rounds,
+                   'motion_seconds': args.seconds},
+    }
+    sim = Simulation(motion_mode=args.motion_mode, sample=START_SAMPLE, log_path=args.log)
+    with sim:
+        results['calibration_s'] = calibration_time(sim, args.timeout)
+        steps_per_s, fps, lateness = steady_motion(sim, args.seconds)
+        results['steps_per_s'] = steps_per_s
+        results['display_fps'] = fps
+        results['step_lateness'] = lateness
+        results['input_to_motion'] = input_to_motion(sim, args.rounds)
+        results['encoder_to_buffer'] = encoder_to_buffer(sim, args.rounds)
+        # Come to rest so the position is cached for the next boot
+        sim.set_inputs(switch_x=(0, 0), switch_y=(0, 0))
+        time.sleep(0.2)
+    if args.motion_mode in ('bounce', 'multi'):
+        # Coordinated mode does not track parked positions
+        start = {name: axis.position for name, axis in sim.axes.items()}
+        results['calibration_cached_s'] = cached_calibration_time(sim.calibration_file, start, args.timeout, args.log,
+                                                                  args.motion_mode)
+    return results
+
+
+def flatten(results, prefix=''):
+    for key, value in results.items():
+        if isinstance(value, dict):
+            yield from flatten(value, f'{prefix}{key}.')
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield f'{prefix}{key}', value
+
+
+def compare(old, new):
+    old_values = dict(flatten(old))
+    print(f"{'':<40}{old.get('commit', '?'):>12}{new.get('commit', '?'):>12}")
+    for key, value in flatten(new):
+        if key.startswith('config.') or key not in old_values:
+            continue
+        before = old_values[key]
+        change = f"{(value - before) / before * 100:+7.1f}%" if before else ''
+        print(f"{key:<40}{before:>12}{value:>12}  {change}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark main_script.py on simulated hardware")
+    parser.add_argument('--rounds', type=int, default=20, help="latency samples per measurement")
+    parser.add_argument('--seconds', type=float, default=3.0, help="length of the steady motion window")
+    parser.add_argument('--motion-mode', default='bounce', choices=('bounce', 'coordinated', 'multi'),
+                        help="MOTION_MODE of main_script; multi drives every axis from one deadline heap")
+    parser.add_argument('--timeout', type=float, default=30.0, help="calibration timeout")
+    parser.add_argument('--log', default=os.devnull, help="where main_script's log goes")
+    parser.add_argument('--output', help="result file (default benchmarks/results/system-<commit>.json)")
+    parser.add_argument('--compare', metavar='JSON', help="print the change against an earlier result")
+    args = parser.parse_args()
+
+    results = run_suite(args)
+    print(json.dumps(results, indent=2))
+    output = args.output or os.path.join(RESULTS_DIR, f"system-{results['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Saved {output}")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), results)
@@ -0,0 +1,45 @@
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from oled_display import Oled2Screen
+
+
+def workspace_states(frames):
+    # Calibrated workspace with the carriage moving diagonally, buffers changing now and then
+    for frame in range(frames):
+        yield {
+            'calibrating_x': False, 'calibrating_y': False,
+            'total_steps_x': 733, 'total_steps_y': 541,
+            'steps_x': 100 + frame * 7 % 500, 'steps_y': 100 + frame * 5 % 400,
+            'dir_x': (1, 0) if frame % 200 < 100 else (0, 1),
+            'dir_y': (0, 1) if frame % 160 < 80 else (1, 0),
+            'MOVEMENT_BUFFER_LEFT': 100 + frame // 250 * 10, 'MOVEMENT_BUFFER_RIGHT': 200,
+            'MOVEMENT_BUFFER_TOP': 100, 'MOVEMENT_BUFFER_BOTTOM': 100,
+            'current_mode': 'none',
+        }
+
+
+def bench(renderer, frames):
+    screen = Oled2Screen(renderer=renderer)
+    images = []
+    start = time.perf_counter()
+    for state in workspace_states(frames):
+        images.append(screen.render(state))
+    elapsed = time.perf_counter() - start
+    return elapsed / frames * 1e6, images
+
+
+if __name__ == "__main__":
+    frames = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    pil_us, pil_images = bench('pil', frames)
+    numpy_us, numpy_images = bench('numpy', frames)
+    # Pixels that differ between the two paths, both should draw the same frame
+    differing = [int(np.count_nonzero(np.asarray(a) != np.asarray(b))) for a, b in zip(pil_images, numpy_images)]
+    print(f"pil    {pil_us:8.1f} us/frame")
+    print(f"numpy  {numpy_us:8.1f} us/frame  ({pil_us / numpy_us:.1f}x)")
+    print(f"differing pixels per frame  mean {sum(differing) / len(differing):.1f}  max {max(differing)}")
@@ -1,10 +1,38 @@
 import time
 import logging
+import threading
+
+from axis_state import send_command, HOME
+from shared_state import read_fields
+
+
+# The first detent of a turn is applied at once, the ones following it are
+# merged and applied at most once per motion block (20 ms, see
+# stepper_motor_control.BLOCK_DURATION_US): the motor loop only picks up new
+# buffers between blocks anyway. None applies every detent on its own.
+ADJUST_INTERVAL = 0.02
+
+# Encoder 2's button re-homes every axis only when held this long (s), so a
+# stray press never sends the machine back to its switches
+HOME_HOLD_TIME = 3.0
 
 
 class BufferManager:
-    def __init__(self, shared_data, encoder_state):
+    """Turns encoder events into buffer adjustments.
+
+    A detent after a quiet ``adjust_interval`` is applied right away in the
+    encoder's callback thread as a single versioned update
+    (``modify_buffers``). Detents inside the window after it only add to a
+    per-mode count; a background thread applies them as one delta per mode
+    when the window ends, so a fast spin costs one config snapshot per window
+    instead of one per detent.
+    """
+
+    def __init__(self, shared_data, encoder_state, config, axis_commands=None, adjust_interval=ADJUST_INTERVAL):
         self.shared_data = shared_data
+        self.config = config
+        # Motor -> command Queue of that axis, see axis_state
+        self.axis_commands = axis_commands or {}
         self.encoder_state = encoder_state
         self.encoder_state['adjustment_mode'] = 'none'
         self.encoder_state['last_press_time'] = time.time()
@@ -17,9 +45,27 @@ class BufferManager:
         # Define the list of menu states
         self.menu_states = ['none', 'x_scale', 'x_position', 'y_scale', 'y_position']
         self.current_state_index = 0
+        # Local copy of encoder_state['adjustment_mode'], read on every detent
+        self.adjustment_mode = 'none'
+        self.adjusters = {
+            'x_scale': self.adjust_x_scale,
+            'y_scale': self.adjust_y_scale,
+            'x_position': self.adjust_x_position,
+            'y_position': self.adjust_y_position,
+        }
+
+        self.adjust_interval = adjust_interval
+        self.pending = {}
+        self.pending_lock = threading.Lock()
+        self.pending_event = threading.Event()
+        # Detents before this time.monotonic() are merged into the next update
+        self.window_end = 0.0
+        self.updates = 0
+        if adjust_interval:
+            threading.Thread(target=self.apply_loop, name="BufferAdjust", daemon=True).start()
 
     def encoder_callback(self, event, lock_state=None):
-        logging.info(f"Encoder event: {event}, lock_state: {lock_state}")
+        logging.debug("Encoder event: %s, lock_state: %s", event, lock_state)
         if event == "BUTTON":
             self.handle_encoder_press(lock_state)
         elif event == "RIGHT":
@@ -28,7 +74,7 @@ class BufferManager:
             self.handle_encoder_rotation(-1)
 
     def encoder_callback_2(self, event, lock_state=None):
-        logging.info(f"Encoder 2 event: {event}, lock_state: {lock_state}")
+        logging.debug("Encoder 2 event: %s, lock_state: %s", event, lock_state)
         if event == "BUTTON":
             self.handle_encoder_press_2(lock_state)
         elif event == "RIGHT":
@@ -43,81 +89,127 @@ class BufferManager:
                 self.encoder_state['pressed'] = pressed
                 self.encoder_state['last_press_time'] = current_time
                 if pressed:
+                    # Detents of the old mode still go to the old mode
+                    self.apply_pending()
                     self.current_state_index = (self.current_state_index + 1) % len(self.menu_states)
-                    self.encoder_state['adjustment_mode'] = self.menu_states[self.current_state_index]
-                    self.shared_data['current_mode'] = self.encoder_state['adjustment_mode']
-                    logging.info(f"Encoder pressed. Mode: {self.encoder_state['adjustment_mode']}")
+                    self.adjustment_mode = self.menu_states[self.current_state_index]
+                    self.encoder_state['adjustment_mode'] = self.adjustment_mode
+                    self.shared_data['current_mode'] = self.adjustment_mode
+                    logging.info(f"Encoder pressed. Mode: {self.adjustment_mode}")
+
+    def handle_encoder_press_2(self, pressed):
+        current_time = time.time()
+        if pressed:
+            if current_time - self.encoder_state['last_press_time_2'] > 0.5:
+                self.encoder_state['pressed_2'] = True
+                self.encoder_state['last_press_time_2'] = current_time
+            return
+        if not self.encoder_state['pressed_2']:
+            return
+        # Released: only a long press re-homes
+        self.encoder_state['pressed_2'] = False
+        held = current_time - self.encoder_state['last_press_time_2']
+        if held < HOME_HOLD_TIME:
+            logging.info(f"Encoder 2 pressed. Hold it {HOME_HOLD_TIME:.0f} s to re-home all axes.")
+        elif self.axis_commands:
+            # Each axis re-homes between two of its blocks
+            send_command(self.axis_commands, HOME)
+            logging.info(f"Encoder 2 held {held:.1f} s. Re-homing all axes.")
+
+    def handle_encoder_rotation_2(self, rotation_value):
+        # Encoder 2's knob has no setting assigned yet
+        logging.debug("Encoder 2 rotated %d, ignored", rotation_value)
 
     def handle_encoder_rotation(self, rotation_value):
-        if self.encoder_state['adjustment_mode'] == 'x_scale':
-            self.adjust_x_scale(rotation_value)
-        elif self.encoder_state['adjustment_mode'] == 'y_scale':
-            self.adjust_y_scale(rotation_value)
-        elif self.encoder_state['adjustment_mode'] == 'x_position':
-            self.adjust_x_position(rotation_value)
-        elif self.encoder_state['adjustment_mode'] == 'y_position':
-            self.adjust_y_position(rotation_value)
+        mode = self.adjustment_mode
+        if mode not in self.adjusters:
+            return
+        if not self.adjust_interval:
+            self.adjusters[mode](rotation_value)
+            return
+        with self.pending_lock:
+            self.pending[mode] = self.pending.get(mode, 0) + rotation_value
+            now = time.monotonic()
+            immediate = now >= self.window_end
+            if immediate:
+                self.window_end = now + self.adjust_interval
+        if immediate:
+            self.apply_pending()
+        else:
+            self.pending_event.set()
+
+    def apply_loop(self):
+        while True:
+            self.pending_event.wait()
+            self.pending_event.clear()
+            # Detents arriving until the window ends are merged into this update
+            delay = self.window_end - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            self.apply_pending(restart_window=True)
+
+    def apply_pending(self, restart_window=False):
+        with self.pending_lock:
+            pending, self.pending = self.pending, {}
+            if restart_window and pending:
+                self.window_end = time.monotonic() + self.adjust_interval
+        for mode, rotation_value in pending.items():
+            if rotation_value:
+                self.adjusters[mode](rotation_value)
+
+    def modify_buffers(self, adjust):
+        # ``adjust`` maps the current settings plus the measured travel to the
+        # new buffers. They are published as one new config snapshot, so the
+        # motor and display processes never see half of an adjustment.
+        total_steps = read_fields(self.shared_data, {'total_steps_x': 0, 'total_steps_y': 0})
+        self.updates += 1
+        return self.config.modify(lambda values: adjust(dict(values, **total_steps)))
 
     def adjust_x_position(self, rotation_value):
         delta = rotation_value * 20
         delta = -delta
-        new_left_value = self.shared_data['MOVEMENT_BUFFER_LEFT'] - delta
-        self.shared_data['MOVEMENT_BUFFER_LEFT'] = max(0, new_left_value)
-        new_right_value = self.shared_data['MOVEMENT_BUFFER_RIGHT'] + delta
-        self.shared_data['MOVEMENT_BUFFER_RIGHT'] = min(self.shared_data['total_steps_x'], new_right_value)
-        logging.info(f"Adjusted X scale: LEFT = {self.shared_data['MOVEMENT_BUFFER_LEFT']}, RIGHT = {self.shared_data['MOVEMENT_BUFFER_RIGHT']}")
+        new = self.modify_buffers(lambda values: {
+            'MOVEMENT_BUFFER_LEFT': max(0, values['MOVEMENT_BUFFER_LEFT'] - delta),
+            'MOVEMENT_BUFFER_RIGHT': min(values['total_steps_x'], values['MOVEMENT_BUFFER_RIGHT'] + delta),
+        })
+        logging.debug("Adjusted X scale: LEFT = %d, RIGHT = %d", new.MOVEMENT_BUFFER_LEFT, new.MOVEMENT_BUFFER_RIGHT)
 
     def adjust_y_position(self, rotation_value):
         delta = rotation_value * 20
         delta = -delta
-        new_bottom_value = self.shared_data['MOVEMENT_BUFFER_BOTTOM'] - delta
-        self.shared_data['MOVEMENT_BUFFER_BOTTOM'] = max(0, new_bottom_value)
-        new_top_value = self.shared_data['MOVEMENT_BUFFER_TOP'] + delta
-        self.shared_data['MOVEMENT_BUFFER_TOP'] = min(self.shared_data['total_steps_y'], new_top_value)
-        logging.info(f"Adjusted Y scale: BOTTOM = {self.shared_data['MOVEMENT_BUFFER_BOTTOM']}, TOP = {self.shared_data['MOVEMENT_BUFFER_TOP']}")
+        new = self.modify_buffers(lambda values: {
+            'MOVEMENT_BUFFER_BOTTOM': max(0, values['MOVEMENT_BUFFER_BOTTOM'] - delta),
+            'MOVEMENT_BUFFER_TOP': min(values['total_steps_y'], values['MOVEMENT_BUFFER_TOP'] + delta),
+        })
+        logging.debug("Adjusted Y scale: BOTTOM = %d, TOP = %d", new.MOVEMENT_BUFFER_BOTTOM, new.MOVEMENT_BUFFER_TOP)
 
     def adjust_x_scale(self, rotation_value):
         delta = rotation_value * 10  # Adjust the multiplier as needed
         delta = -delta
-        new_left_value = self.shared_data['MOVEMENT_BUFFER_LEFT'] + delta
-        new_right_value = self.shared_data['MOVEMENT_BUFFER_RIGHT'] + delta
-        self.shared_data['MOVEMENT_BUFFER_LEFT'] = max(0, min(new_left_value, self.shared_data['total_steps_x']))
-        self.shared_data['MOVEMENT_BUFFER_RIGHT'] = max(0, min(new_right_value, self.shared_data['total_steps_x']))
-        logging.info(f"Adjusted X position: LEFT = {self.shared_data['MOVEMENT_BUFFER_LEFT']}, RIGHT = {self.shared_data['MOVEMENT_BUFFER_RIGHT']}")
+        new = self.modify_buffers(lambda values: {
+            'MOVEMENT_BUFFER_LEFT': max(0, min(values['MOVEMENT_BUFFER_LEFT'] + delta, values['total_steps_x'])),
+            'MOVEMENT_BUFFER_RIGHT': max(0, min(values['MOVEMENT_BUFFER_RIGHT'] + delta, values['total_steps_x'])),
+        })
+        logging.debug("Adjusted X position: LEFT = %d, RIGHT = %d", new.MOVEMENT_BUFFER_LEFT, new.MOVEMENT_BUFFER_RIGHT)
 
     def adjust_y_scale(self, rotation_value):
         delta = rotation_value * 10  # Adjust the multiplier as needed
         delta = -delta
-        new_top_value = self.shared_data['MOVEMENT_BUFFER_TOP'] + delta
-        new_bottom_value = self.shared_data['MOVEMENT_BUFFER_BOTTOM'] + delta
-        self.shared_data['MOVEMENT_BUFFER_TOP'] = max(0, min(new_top_value, self.shared_data['total_steps_y']))
-        self.shared_data['MOVEMENT_BUFFER_BOTTOM'] = max(0, min(new_bottom_value, self.shared_data['total_steps_y']))
-        logging.info(f"Adjusted Y position: TOP = {self.shared_data['MOVEMENT_BUFFER_TOP']}, BOTTOM = {self.shared_data['MOVEMENT_BUFFER_BOTTOM']}")
-
-def update_shared_data_with_buffers(shared_data):
-    shared_data['MOVEMENT_BUFFER_LEFT'] = 100  # Define left movement limit
-    shared_data['MOVEMENT_BUFFER_RIGHT'] = 200  # Define right movement limit
-    shared_data['MOVEMENT_BUFFER_TOP'] = 100  # Define top movement limit
-    shared_data['MOVEMENT_BUFFER_BOTTOM'] = 100  # Define bottom movement limit
-    shared_data['ACCELERATION_BUFFER'] = 20  # Define acceleration buffer region size
-
-def buffer_update_process(shared_data):
-    while True:
-        update_shared_data_with_buffers(shared_data)
-        time.sleep(1)  # Update the buffers at regular intervals, adjust as necessary
+        new = self.modify_buffers(lambda values: {
+            'MOVEMENT_BUFFER_TOP': max(0, min(values['MOVEMENT_BUFFER_TOP'] + delta, values['total_steps_y'])),
+            'MOVEMENT_BUFFER_BOTTOM': max(0, min(values['MOVEMENT_BUFFER_BOTTOM'] + delta, values['total_steps_y'])),
+        })
+        logging.debug("Adjusted Y position: TOP = %d, BOTTOM = %d", new.MOVEMENT_BUFFER_TOP, new.MOVEMENT_BUFFER_BOTTOM)
 
 if __name__ == "__main__":
-    from multiprocessing import Manager, Process
+    from multiprocessing import Manager
+    from config_store import ConfigStore
     manager = Manager()
     shared_data = manager.dict({
         'steps_x': 0,
         'steps_y': 0,
         'total_steps_x': 1000,
         'total_steps_y': 1000,
-        'MOVEMENT_BUFFER_LEFT': 0,
-        'MOVEMENT_BUFFER_RIGHT': 1000,
-        'MOVEMENT_BUFFER_TOP': 1000,
-        'MOVEMENT_BUFFER_BOTTOM': 0,
         'current_mode': 'none',
     })
     encoder_state = manager.dict({
@@ -126,14 +218,15 @@ if __name__ == "__main__":
         'pressed': False
     })
 
-    # Initialize shared data with buffers
-    update_shared_data_with_buffers(shared_data)
-
-    buffer_manager = BufferManager(shared_data, encoder_state)
+    # The buffers are mirrored into shared_data on every change
+    config = ConfigStore.local({
+        'MOVEMENT_BUFFER_LEFT': 0,
+        'MOVEMENT_BUFFER_RIGHT': 1000,
+        'MOVEMENT_BUFFER_TOP': 1000,
+        'MOVEMENT_BUFFER_BOTTOM': 0,
+    }, mirror=shared_data)
 
-    # Start the buffer update process
-    buffer_process = Process(target=buffer_update_process, args=(shared_data,))
-    buffer_process.start()
+    buffer_manager = BufferManager(shared_data, encoder_state, config)
 
     # Simulate encoder events for testing purposes
     while True:
@@ -148,4 +241,4 @@ if __name__ == "__main__":
         time.sleep(1)
         # Simulate another encoder press event
         buffer_manager.encoder_callback("BUTTON", True)
-        time.sleep(2)
\ No newline at end of file
+        time.sleep(2)
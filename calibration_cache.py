@@ -0,0 +1,103 @@
+import os
+import json
+import time
+import fcntl
+import queue
+import logging
+import threading
+
+# Measured travel of each axis and where it was parked, kept across restarts
+CALIBRATION_CACHE_FILE = os.environ.get('CALIBRATION_CACHE_FILE',
+                                        os.path.join(os.path.expanduser('~'), '.motion_calibration.json'))
+
+
+def load_calibration(path=None):
+    # {axis: {'total_steps': ..., 'position': ..., 'updated': ...}}, empty if missing or unreadable
+    path = path or CALIBRATION_CACHE_FILE
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logging.warning(f"Ignoring calibration cache {path}: {e}")
+        return {}
+
+
+def load_axis(axis, path=None):
+    return load_calibration(path).get(axis)
+
+
+def store_axis(axis, path=None, **fields):
+    """Update the cache entry of one axis.
+
+    Each axis is written by its own motion process, so the file is locked
+    for the read-modify-write and replaced in one rename.
+    """
+    path = path or CALIBRATION_CACHE_FILE
+    try:
+        with open(path + '.lock', 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            calibration = load_calibration(path)
+            entry = calibration.setdefault(axis, {})
+            entry.update(fields)
+            entry['updated'] = time.time()
+            temporary = f"{path}.{os.getpid()}.tmp"
+            with open(temporary, 'w') as f:
+                json.dump(calibration, f, indent=2)
+            os.replace(temporary, path)
+    except OSError as e:
+        logging.warning(f"Could not update calibration cache {path}: {e}")
+
+
+def park(axis, position, path=None):
+    # The axis is at rest at a known position, the next boot can check against it
+    store_later(axis, path, position=int(position))
+
+
+def unpark(axis, path=None):
+    # The axis is moving: if the power goes now its position is unknown
+    store_later(axis, path, position=None)
+
+
+# park/unpark are called from the motion loops on every switch toggle. The
+# locked rewrite of the file runs on a writer thread of that process instead,
+# so a block never waits on the lock or the disk.
+_writes = None
+_writer = None
+_writer_pid = None
+
+
+def store_later(axis, path=None, **fields):
+    # store_axis on the writer thread; updates queued for the same entry are merged
+    global _writes, _writer, _writer_pid
+    if _writer_pid != os.getpid():
+        # A forked process inherits the queue but not the thread
+        _writes = queue.Queue()
+        _writer = threading.Thread(target=_write_loop, args=(_writes,), name="CalibrationCache", daemon=True)
+        _writer.start()
+        _writer_pid = os.getpid()
+    _writes.put((axis, path, fields))
+
+
+def _write_loop(writes):
+    while True:
+        pending = [writes.get()]
+        while True:
+            try:
+                pending.append(writes.get_nowait())
+            except queue.Empty:
+                break
+        merged = {}
+        for axis, path, fields in pending:
+            merged.setdefault((axis, path), {}).update(fields)
+        for (axis, path), fields in merged.items():
+            store_axis(axis, path, **fields)
+        for _ in pending:
+            writes.task_done()
+
+
+def flush():
+    # Wait until every park/unpark of this process is on disk, call before exiting
+    if _writer_pid == os.getpid():
+        _writes.join()
@@ -0,0 +1,342 @@
+import os
+import json
+import time
+import ctypes
+import ctypes.util
+import select
+import struct
+import logging
+import threading
+from collections import namedtuple
+from multiprocessing import Lock
+
+from axes import AXES
+from motion_profiles import SLOW_INTERVAL_US, FAST_INTERVAL_US
+from shared_state import create_block, release_block, attach_untracked
+from speed_map import SPEED_CURVES, DEFAULT_CURVE
+
+# Fixed block name, see shared_state.STATE_SHM_NAME
+CONFIG_SHM_NAME = 'motion_config'
+
+# Motion settings that change at runtime (encoders, config file) but are the
+# same for every step of a block. Names match the shared state keys, so a
+# snapshot can be merged into a state dict with ``_asdict()``.
+CONFIG_KEYS = (
+    'MOVEMENT_BUFFER_LEFT',
+    'MOVEMENT_BUFFER_RIGHT',
+    'MOVEMENT_BUFFER_TOP',
+    'MOVEMENT_BUFFER_BOTTOM',
+    'ACCELERATION_BUFFER',
+    'SLOW_INTERVAL_US',
+    'FAST_INTERVAL_US',
+    'CALIBRATION_SPEED_X',
+    'CALIBRATION_SPEED_Y',
+    'HOMING_SPEED_X',
+    'HOMING_SPEED_Y',
+    'SPEED_CURVE_X',
+    'SPEED_CURVE_Y',
+    'POT_DEADZONE_LOW',
+    'POT_DEADZONE_HIGH',
+)
+
+DEFAULT_CONFIG = {
+    'MOVEMENT_BUFFER_LEFT': 100,
+    'MOVEMENT_BUFFER_RIGHT': 200,
+    'MOVEMENT_BUFFER_TOP': 100,
+    'MOVEMENT_BUFFER_BOTTOM': 100,
+    'ACCELERATION_BUFFER': 20,
+    # Pot range to step interval range (us), see motion_profiles
+    'SLOW_INTERVAL_US': SLOW_INTERVAL_US,
+    'FAST_INTERVAL_US': FAST_INTERVAL_US,
+    # Homing speeds (us), see stepper_motor_control.home_to_switch
+    'CALIBRATION_SPEED_X': AXES['X']['calibration_speed'],
+    'CALIBRATION_SPEED_Y': AXES['Y']['calibration_speed'],
+    'HOMING_SPEED_X': AXES['X']['homing_speed'],
+    'HOMING_SPEED_Y': AXES['Y']['homing_speed'],
+    # Pot response per axis (index into speed_map.SPEED_CURVES) and pot dead zones
+    'SPEED_CURVE_X': DEFAULT_CURVE['SPEED_CURVE_X'],
+    'SPEED_CURVE_Y': DEFAULT_CURVE['SPEED_CURVE_Y'],
+    'POT_DEADZONE_LOW': DEFAULT_CURVE['POT_DEADZONE_LOW'],
+    'POT_DEADZONE_HIGH': DEFAULT_CURVE['POT_DEADZONE_HIGH'],
+}
+
+# Fields stored as an index into a list of names; the config file uses the names
+CONFIG_CHOICES = {
+    'SPEED_CURVE_X': SPEED_CURVES,
+    'SPEED_CURVE_Y': SPEED_CURVES,
+}
+
+# Fields the display and CLI tools read from the shared state, copied there
+# on every publish
+MIRRORED_KEYS = ('MOVEMENT_BUFFER_LEFT', 'MOVEMENT_BUFFER_RIGHT', 'MOVEMENT_BUFFER_TOP', 'MOVEMENT_BUFFER_BOTTOM',
+                 'ACCELERATION_BUFFER')
+
+MotionConfig = namedtuple('MotionConfig', ('version',) + CONFIG_KEYS)
+
+# Layout: published version, then two slots of int64 fields. Version n lives
+# in slot n % 2, so a writer fills the other slot while readers use this one.
+_VERSION = struct.Struct('<Q')
+_SLOT = struct.Struct('<' + 'q' * len(CONFIG_KEYS))
+_SIZE = _VERSION.size + 2 * _SLOT.size
+
+
+class ConfigStore:
+    """Immutable, versioned snapshots of the motion settings.
+
+    Writers publish a complete new snapshot (``publish``, ``update`` or
+    ``modify``) under one lock; the version is stored last. Readers never lock:
+    ``current`` compares the published version with the one it decoded last
+    and only reads the fields again when it changed, so checking for new
+    settings costs one integer compare.
+
+    The creating process can pass a ``mirror`` (the SharedState) that gets
+    the buffers and ``buffer_version`` copied in after each publish, for the
+    display and the CLI tools. Callables in ``listeners`` get every new
+    snapshot of that process, like SpeedMap.sync.
+    """
+
+    def __init__(self, shm, lock, owner=False, buf=None, mirror=None):
+        self._shm = shm
+        self._lock = lock
+        self._owner = owner
+        self._buf = buf if buf is not None else shm.buf
+        self.mirror = mirror
+        self.listeners = []
+        self._current = None
+
+    @classmethod
+    def create(cls, initial=None, name=CONFIG_SHM_NAME, mirror=None):
+        shm = create_block(name, _SIZE)
+        shm.buf[:_SIZE] = bytes(_SIZE)
+        store = cls(shm, Lock(), owner=True, mirror=mirror)
+        store.publish(dict(DEFAULT_CONFIG, **(initial or {})))
+        return store
+
+    @classmethod
+    def attach(cls, name, lock):
+        shm = attach_untracked(name)
+        return cls(shm, lock)
+
+    @classmethod
+    def local(cls, initial=None, mirror=None):
+        # Process-private store, for benchmarks and running a module on its own
+        store = cls(None, threading.Lock(), buf=bytearray(_SIZE), mirror=mirror)
+        store.publish(dict(DEFAULT_CONFIG, **(initial or {})))
+        return store
+
+    def __reduce__(self):
+        # The mirror stays with the creating process
+        return (ConfigStore.attach, (self._shm.name, self._lock))
+
+    @property
+    def version(self):
+        return _VERSION.unpack_from(self._buf)[0]
+
+    def current(self):
+        current = self._current
+        version = _VERSION.unpack_from(self._buf)[0]
+        if current is not None and current.version == version:
+            return current
+        while True:
+            values = _SLOT.unpack_from(self._buf, _VERSION.size + (version % 2) * _SLOT.size)
+            latest = _VERSION.unpack_from(self._buf)[0]
+            # Writing this slot again takes a publish into the other one first,
+            # so an unchanged version means the fields were not touched
+            if latest == version:
+                break
+            version = latest
+        self._current = MotionConfig(version, *values)
+        return self._current
+
+    def publish(self, config):
+        # ``config`` has every key of CONFIG_KEYS
+        with self._lock:
+            return self._publish(config)
+
+    def _publish(self, config):
+        version = _VERSION.unpack_from(self._buf)[0] + 1
+        _SLOT.pack_into(self._buf, _VERSION.size + (version % 2) * _SLOT.size,
+                        *(int(config[key]) for key in CONFIG_KEYS))
+        _VERSION.pack_into(self._buf, 0, version)
+        if self.mirror is not None:
+            mirrored = {key: int(config[key]) for key in MIRRORED_KEYS}
+            mirrored['buffer_version'] = version
+            self.mirror.update(mirrored)
+        current = self.current()
+        for listener in self.listeners:
+            listener(current)
+        return current
+
+    def modify(self, transaction):
+        # ``transaction`` gets the current settings as a dict and returns the
+        # fields to change; the result is published as one new snapshot
+        with self._lock:
+            config = self.current()._asdict()
+            changes = transaction(dict(config))
+            for key in changes:
+                if key not in CONFIG_KEYS:
+                    raise KeyError(key)
+            config.update(changes)
+            return self._publish(config)
+
+    def update(self, **changes):
+        return self.modify(lambda config: changes)
+
+    def close(self):
+        if self._shm is None:
+            return
+        self._buf = None
+        if self._owner:
+            release_block(self._shm)
+        else:
+            self._shm.close()
+
+
+def config_value(key, value):
+    # Field value from the config file, a name for the CONFIG_CHOICES fields
+    names = CONFIG_CHOICES.get(key)
+    if names is not None:
+        if isinstance(value, str):
+            if value not in names:
+                raise ValueError(f"{key} must be one of {names}, not {value!r}")
+            return names.index(value)
+        if not 0 <= int(value) < len(names):
+            raise ValueError(f"{key} must be one of {names}, not {value!r}")
+    return int(value)
+
+
+# inotify(7) constants, from <sys/inotify.h>
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_EVENT = struct.Struct('iIII')
+
+
+def _inotify_watch(directory):
+    # Non-blocking inotify descriptor watching ``directory`` for files that
+    # were written or renamed into place, OSError where inotify is missing
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        init, add_watch = libc.inotify_init1, libc.inotify_add_watch
+    except (OSError, AttributeError, TypeError) as e:
+        raise OSError(f"inotify is not available: {e}")
+    fd = init(os.O_NONBLOCK | os.O_CLOEXEC)
+    if fd < 0:
+        raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+    if add_watch(fd, os.fsencode(directory), _IN_CLOSE_WRITE | _IN_MOVED_TO) < 0:
+        errno = ctypes.get_errno()
+        os.close(fd)
+        raise OSError(errno, f"Cannot watch {directory}")
+    return fd
+
+
+def _changed_names(fd):
+    names = set()
+    try:
+        data = os.read(fd, 4096)
+    except BlockingIOError:
+        return names
+    offset = 0
+    while offset < len(data):
+        _, _, _, length = _IN_EVENT.unpack_from(data, offset)
+        offset += _IN_EVENT.size
+        names.add(data[offset:offset + length].rstrip(b'\0').decode(errors='replace'))
+        offset += length
+    return names
+
+
+class ConfigFile:
+    """Keeps a ConfigStore and a JSON file in step.
+
+    The file is loaded on ``start`` and whenever it is written or replaced
+    (inotify on its directory, or by rereading it every ``interval``
+    where inotify is missing). Settings published by anything else, like the
+    encoders, are saved back at most once per ``interval``.
+    """
+
+    def __init__(self, store, path, interval=1.0):
+        self.store = store
+        self.path = os.path.abspath(path)
+        self.interval = interval
+        self.saved_version = None
+        self._text = None
+        self._thread = None
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                self._text = f.read()
+            data = json.loads(self._text)
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring config file {self.path}: {e}")
+            return False
+        unknown = sorted(set(data) - set(CONFIG_KEYS))
+        if unknown:
+            logging.warning(f"Unknown keys in {self.path}: {unknown}")
+        try:
+            changes = {key: config_value(key, data[key]) for key in CONFIG_KEYS if key in data}
+        except ValueError as e:
+            logging.warning(f"Ignoring config file {self.path}: {e}")
+            return False
+        current = self.store.current()
+        if any(getattr(current, key) != value for key, value in changes.items()):
+            self.saved_version = self.store.update(**changes).version
+            logging.info(f"Loaded motion config version {self.saved_version} from {self.path}")
+        else:
+            # Our own save coming back, or nothing changed
+            self.saved_version = current.version
+        return True
+
+    def save(self):
+        config = self.store.current()
+        values = {key: getattr(config, key) for key in CONFIG_KEYS}
+        for key, names in CONFIG_CHOICES.items():
+            values[key] = names[values[key]] if 0 <= values[key] < len(names) else values[key]
+        text = json.dumps(values, indent=2)
+        temporary = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(temporary, 'w') as f:
+                f.write(text)
+            os.replace(temporary, self.path)
+        except OSError as e:
+            logging.warning(f"Could not save config file {self.path}: {e}")
+            return
+        self._text = text
+        self.saved_version = config.version
+
+    def start(self):
+        # Watch before the first load, so an edit in between is not missed
+        try:
+            fd = _inotify_watch(os.path.dirname(self.path))
+        except OSError as e:
+            logging.info(f"{e}, checking {self.path} every {self.interval} s")
+            fd = None
+        if not self.load():
+            self.save()
+        self._thread = threading.Thread(target=self._run, args=(fd,), name="ConfigFile", daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self, fd):
+        name = os.path.basename(self.path)
+        while True:
+            if fd is not None:
+                ready, _, _ = select.select([fd], [], [], self.interval)
+                changed = bool(ready) and name in _changed_names(fd)
+            else:
+                time.sleep(self.interval)
+                changed = True
+            # Our own saves come back as events too
+            if changed and self._modified():
+                self.load()
+            if self.store.version != self.saved_version:
+                self.save()
+
+    def _modified(self):
+        # Compared by content, two writes within one timestamp tick share an mtime
+        try:
+            with open(self.path) as f:
+                return f.read() != self._text
+        except OSError:
+            return False
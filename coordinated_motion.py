@@ -0,0 +1,384 @@
+import math
+import time
+import logging
+
+import numpy as np
+
+import calibration_cache
+from axis_state import pending_commands, HOME
+from calibration_cache import unpark
+from config_store import ConfigStore
+from job_stream import JobStreamer, RELATIVE, JOB_END
+from motion_recording import MotionRecorder, TraceSinks
+from motion_planner import line_ticks, MotionPlanner, movement_window
+from patterns import PATTERN_MODES, PatternStreamer, scale_to_window
+from pulse_output import create_pulse_output
+from speed_map import SpeedMap
+from stepper_motor_control import (axis_settings, calibrate_axis, init_axis_hardware, rezero_at_switch, PULSE_BACKEND,
+                                   BLOCK_DURATION_US, BLOCK_MAX_STEPS)
+
+logger = logging.getLogger(__name__)
+
+MOTORS = ("X", "Y")
+
+
+class LineSegment:
+    """A straight X/Y move at a single feed rate (steps/s along the path)."""
+
+    def __init__(self, dx, dy, feed):
+        self.dx = dx
+        self.dy = dy
+        self.ticks = max(abs(dx), abs(dy))
+        self.done = 0
+        length = math.hypot(dx, dy)
+        # Half of the tick period, in the same us unit the pulse outputs use
+        self.tick_interval = max(1, int(round(length / self.ticks / feed * 1_000_000 / 2))) if self.ticks else 0
+        self.sign_x = 1 if dx >= 0 else -1
+        self.sign_y = 1 if dy >= 0 else -1
+
+    @property
+    def finished(self):
+        return self.done >= self.ticks
+
+    def axis_interval(self, delta):
+        # Average per-axis step interval along this segment, 0 if the axis is idle
+        return self.tick_interval * self.ticks // abs(delta) if delta else 0
+
+    def next_block(self, max_duration_us=BLOCK_DURATION_US, max_ticks=BLOCK_MAX_STEPS):
+        count = min(self.ticks - self.done, max_ticks, max(1, max_duration_us // (2 * self.tick_interval)))
+        mask = line_ticks(self.dx, self.dy, self.done, self.done + count)
+        self.done += count
+        moved = mask.sum(axis=0)
+        return mask, np.full(count, self.tick_interval, dtype=np.int64), int(moved[0]) * self.sign_x, int(moved[1]) * self.sign_y
+
+
+def bounce_segment(position, velocity, window):
+    """Line from ``position`` along ``velocity`` to the first edge of ``window``.
+
+    Returns (dx, dy, hit) where ``hit`` flags the axes that reached their edge
+    and need to reverse. A zero length segment means the caller should reflect
+    the hit axes before planning again.
+    """
+    times = []
+    for p, v, (low, high) in zip(position, velocity, window):
+        if v > 0:
+            times.append(max(0.0, (high - p) / v))
+        elif v < 0:
+            times.append(max(0.0, (low - p) / v))
+        else:
+            times.append(math.inf)
+    t = min(times)
+    if math.isinf(t):
+        return 0, 0, (False, False)
+    hit = tuple(time_to_edge == t for time_to_edge in times)
+    delta = []
+    for p, v, (low, high), axis_hit in zip(position, velocity, window, hit):
+        target = p + int(round(v * t))
+        if axis_hit:
+            target = high if v > 0 else low
+        delta.append(max(min(target, max(high, p)), min(low, p)) - p)
+    return delta[0], delta[1], hit
+
+
+def direction_tuple(sign):
+    return (1, 0) if sign > 0 else (0, 1)
+
+
+def emit_segment_block(segment, pulse_output, settings, position, shared_data, step_trace=None, limits=None):
+    # Emit the next block of ``segment``, advance ``position`` and publish it.
+    # Works for LineSegment and motion_planner.PlannerBlock alike. With
+    # ``limits`` (LimitSwitches per axis) the block stops at a tripped switch;
+    # the axes whose switch tripped are re-zeroed and returned.
+    axes = [
+        (settings["X"]['dir_pin'], settings["X"]['step_pin'], direction_tuple(segment.sign_x)),
+        (settings["Y"]['dir_pin'], settings["Y"]['step_pin'], direction_tuple(segment.sign_y)),
+    ]
+    stops = []
+    if limits is not None:
+        for motor, delta, (_, _, direction) in zip(MOTORS, (segment.dx, segment.dy), axes):
+            limits[motor].leaving(direction)
+            stops.append(limits[motor].stop_flag(direction) if delta else None)
+    mask, intervals, moved_x, moved_y = segment.next_block()
+    start_ns = time.monotonic_ns()
+    emitted = pulse_output.emit_ticks(axes, mask, intervals, stops)
+    if emitted < len(intervals):
+        mask, intervals = mask[:emitted], intervals[:emitted]
+        moved = mask.sum(axis=0)
+        moved_x, moved_y = int(moved[0]) * segment.sign_x, int(moved[1]) * segment.sign_y
+    if step_trace is not None:
+        step_trace.record_ticks(start_ns, mask, intervals,
+                                [("X", position[0], segment.sign_x), ("Y", position[1], segment.sign_y)])
+    position[0] += moved_x
+    position[1] += moved_y
+
+    shared_data.update({
+        'steps_x': position[0],
+        'steps_y': position[1],
+        'X_speed': segment.axis_interval(segment.dx),
+        'Y_speed': segment.axis_interval(segment.dy),
+        'dir_x': direction_tuple(segment.sign_x) if segment.dx else (0, 0),
+        'dir_y': direction_tuple(segment.sign_y) if segment.dy else (0, 0),
+    })
+
+    tripped = [axis for axis, flag in enumerate(stops) if flag is not None and flag[0]]
+    if tripped:
+        pulse_output.wait()
+        for axis in tripped:
+            position[axis] = rezero_at_switch(MOTORS[axis], shared_data, axes[axis][2], position[axis])
+    return tripped
+
+
+def run_planner(planner, pulse_output, settings, position, shared_data, refill=None, step_trace=None, limits=None):
+    # Execute planned blocks until the planner runs dry. ``refill`` is called
+    # before each block so a producer can keep the look-ahead queue full.
+    # Returns early if a limit switch trips, the planned path is void then.
+    while True:
+        if refill is not None:
+            refill(planner)
+        if not len(planner):
+            break
+        segment = planner.pop()
+        while not segment.finished:
+            if emit_segment_block(segment, pulse_output, settings, position, shared_data, step_trace, limits):
+                return
+
+
+def pot_feed(base_interval):
+    # Path speed in steps/s for the interval the pot selects (see speed_map),
+    # the cruise speed bounce mode would use: half periods of base_interval / 2
+    return 1_000_000 / base_interval
+
+
+def motion_state(shared_data, config):
+    # One snapshot of the motion state with the current settings merged in
+    state = shared_data.copy()
+    state.update(config.current()._asdict())
+    return state
+
+
+def run_pattern(name, variant, shared_data, config, speed_map, pulse_output, settings, position, step_trace=None,
+                limits=None):
+    # Stream a predefined pattern through the look-ahead planner until the
+    # mode changes or both switches go to the middle position
+    mode = shared_data.get('mode', 0)
+    streamer = PatternStreamer(name, variant).start()
+    planner = MotionPlanner.from_state(motion_state(shared_data, config), position)
+    targets = iter(())
+    logger.info(f"Running pattern {name} (variant {variant})")
+
+    def refill(planner):
+        nonlocal targets
+        state = motion_state(shared_data, config)
+        if state.get('mode') != mode or state.get('mode2') != variant:
+            return
+        if state.get('switch_x') == (0, 0) and state.get('switch_y') == (0, 0):
+            return
+        # Follow live buffer changes, the planner clamps every target into the window
+        planner.window = movement_window(state)
+        feed = pot_feed(speed_map.lookup('X', state.get('pot_x', 0)))
+        while not planner.full:
+            target = next(targets, None)
+            if target is None:
+                targets = iter(scale_to_window(streamer.next_chunk(), planner.window).tolist())
+                continue
+            planner.add_line(target[0], target[1], feed)
+
+    try:
+        run_planner(planner, pulse_output, settings, position, shared_data, refill, step_trace, limits)
+    finally:
+        streamer.stop()
+
+
+def run_job(jobs, shared_data, config, pulse_output, settings, position, step_trace=None, limits=None):
+    """Run the next job of ``jobs`` (a JobStreamer) through the look-ahead planner.
+
+    Moves are taken from the ring only as the planner has room, so the reader
+    is held back instead of the job being loaded. The step loop only waits for
+    input when the planner has run empty, ``starved`` counts those waits.
+    Returns (moves, clamped, starved).
+    """
+    planner = MotionPlanner.from_state(motion_state(shared_data, config), position)
+    program = list(position)  # Programmed position, before clamping into the window
+    moves = clamped = starved = 0
+    ended = False
+    logger.info("Running job")
+
+    def refill(planner):
+        nonlocal moves, clamped, starved, ended
+        if ended:
+            return
+        # Follow live buffer changes, the planner clamps every target into the window
+        planner.window = movement_window(motion_state(shared_data, config))
+        while not planner.full and not ended:
+            waiting = not len(planner)
+            rows = jobs.ring.get(planner.lookahead - len(planner), timeout=1.0 if waiting else 0)
+            if not len(rows):
+                if not waiting:
+                    return
+                starved += moves > 0
+                continue
+            for x, y, feed, kind in rows.tolist():
+                if kind == JOB_END:
+                    ended = True
+                    break
+                if kind == RELATIVE:
+                    x, y = program[0] + x, program[1] + y
+                else:
+                    x = program[0] if math.isnan(x) else x
+                    y = program[1] if math.isnan(y) else y
+                program[:] = [x, y]
+                moves += 1
+                if planner.clamp(x, y) != (round(x), round(y)):
+                    clamped += 1
+                planner.add_line(x, y, feed)
+
+    run_planner(planner, pulse_output, settings, position, shared_data, refill, step_trace, limits)
+    if not ended:
+        # A limit switch tripped, the rest of the job is void
+        logger.warning(f"Job aborted after {moves} moves")
+        while not ended:
+            rows = jobs.ring.get(jobs.ring.capacity, timeout=1.0)
+            ended = len(rows) and rows[-1, 3] == JOB_END
+    logger.info(f"Job done: {moves} moves, {clamped} clamped to the movement window, "
+                f"{starved} times waiting for input")
+    return moves, clamped, starved
+
+
+def coordinated_motion_process(shared_data, calibration_event, all_done_event, pulse_backend=PULSE_BACKEND,
+                               step_trace=None, metrics=None, config=None, commands=None, job_source=None,
+                               record_path=None, speed_map=None):
+    # ``commands`` maps each motor to the Queue other processes send it commands
+    # on, ``job_source`` is where jobs are read from (see job_stream). Steps
+    # of both axes are recorded to ``record_path``.
+    config = config if config is not None else ConfigStore.local()
+    speed_map = speed_map if speed_map is not None else SpeedMap.local(config.current())
+    recorder = MotionRecorder(record_path, axes=MOTORS) if record_path else None
+    if recorder is not None:
+        step_trace = TraceSinks(step_trace, recorder)
+    commands = commands or {}
+    jobs = None
+    settings = {motor: axis_settings(motor) for motor in MOTORS}
+    pulse_output = create_pulse_output(pulse_backend,
+                                       spin_threshold_us=min(settings[motor]['spin_threshold_us'] for motor in MOTORS))
+    limits = {motor: init_axis_hardware(motor, on_trip=pulse_output.halt) for motor in MOTORS}
+    scheduler = getattr(pulse_output, 'scheduler', None)
+    if metrics is not None and scheduler is not None:
+        # Both axes share one tick timeline, its timing is recorded under X
+        scheduler.lateness_histogram = metrics['step_lateness_x']
+        scheduler.interval_error_histogram = metrics['step_interval_error_x']
+
+    try:
+        # Both axes are calibrated by this process, one after the other
+        for motor in MOTORS:
+            calibrate_axis(motor, shared_data, pulse_output, limits[motor], config=config.current())
+        shared_data.update({'calibrating_x': False, 'calibrating_y': False})
+        calibration_event.set()
+        all_done_event.wait()
+        # Positions are not tracked for the calibration cache in this mode
+        for motor in MOTORS:
+            unpark(motor)
+        if job_source:
+            jobs = JobStreamer(job_source).start()
+
+        position = [shared_data['steps_x'], shared_data['steps_y']]
+        signs = [1, 1]
+        moving = [False, False]
+        segment = None
+        segment_key = None
+
+        while True:
+            # Commands are applied here, between two blocks
+            for motor in MOTORS:
+                for command in pending_commands(commands.get(motor)):
+                    if command == HOME:
+                        pulse_output.wait()
+                        calibrate_axis(motor, shared_data, pulse_output, limits[motor], config=config.current())
+                        shared_data[f'calibrating_{motor.lower()}'] = False
+                        unpark(motor)
+                        position[MOTORS.index(motor)] = shared_data[f'steps_{motor.lower()}']
+                        shared_data.update({f'{motor}_speed': 0, f'dir_{motor.lower()}': (0, 0)})
+                        segment = None
+                    else:
+                        logger.warning(f"{motor} ignoring unknown command {command!r}")
+
+            if jobs is not None and jobs.ready():
+                # Jobs take priority over the switches and patterns
+                pulse_output.wait()
+                run_job(jobs, shared_data, config, pulse_output, settings, position, step_trace, limits)
+                shared_data.update({'X_speed': 0, 'Y_speed': 0, 'dir_x': (0, 0), 'dir_y': (0, 0)})
+                segment = None
+                continue
+
+            state = motion_state(shared_data, config)
+            pattern = PATTERN_MODES.get(state.get('mode', 0))
+            switches_active = state.get('switch_x', (0, 0)) != (0, 0) or state.get('switch_y', (0, 0)) != (0, 0)
+            if pattern is not None and switches_active:
+                pulse_output.wait()
+                run_pattern(pattern, state.get('mode2', 1), shared_data, config, speed_map, pulse_output, settings,
+                            position, step_trace, limits)
+                segment = None
+                continue
+
+            velocity = [0.0, 0.0]
+            intervals = [None, None]
+            for axis, motor in enumerate(MOTORS):
+                switch_state = state.get(f'switch_{motor.lower()}', (0, 0))
+                if switch_state == (0, 0):  # Middle position, this axis holds still
+                    moving[axis] = False
+                    continue
+                if not moving[axis]:
+                    # Same as bounce mode, the switch only picks the initial direction
+                    signs[axis] = 1 if switch_state == (1, 0) else -1
+                    moving[axis] = True
+                intervals[axis] = speed_map.lookup(motor, state.get(f'pot_{motor.lower()}', 0))
+                velocity[axis] = signs[axis] * pot_feed(intervals[axis])
+
+            window = []
+            for motor in MOTORS:
+                low = state.get(settings[motor]['buffer_low_key'], 0)
+                high = state.get(f'total_steps_{motor.lower()}', 0) - state.get(settings[motor]['buffer_high_key'], 0)
+                window.append((low, high))
+            for axis in range(2):
+                if window[axis][1] <= window[axis][0]:
+                    velocity[axis] = 0.0  # No room between the buffers
+
+            if not any(velocity):
+                pulse_output.wait()
+                if segment is not None:
+                    segment = None
+                    shared_data.update({'X_speed': 0, 'Y_speed': 0, 'dir_x': (0, 0), 'dir_y': (0, 0)})
+                time.sleep(0.01)
+                continue
+
+            key = (tuple(intervals), tuple(signs), tuple(window))
+            if segment is None or segment.finished or key != segment_key:
+                dx, dy, hit = bounce_segment(position, velocity, window)
+                if dx == 0 and dy == 0:
+                    for axis in range(2):
+                        if hit[axis]:
+                            signs[axis] = -signs[axis]
+                            logger.info(f"{MOTORS[axis]} axis reached buffer edge. Reversing direction.")
+                    segment = None
+                    continue
+                segment = LineSegment(dx, dy, math.hypot(*velocity))
+                segment_key = key
+
+            tripped = emit_segment_block(segment, pulse_output, settings, position, shared_data, step_trace, limits)
+            for axis in tripped:
+                # Head back into the window, away from the switch
+                signs[axis] = -signs[axis]
+                segment = None
+
+    except KeyboardInterrupt:
+        logger.info("Coordinated motion process interrupted")
+    except Exception as e:
+        logger.error(f"Error in coordinated_motion_process: {e}")
+    finally:
+        if jobs is not None:
+            jobs.stop()
+        for switches in limits.values():
+            switches.close()
+        pulse_output.close()
+        if recorder is not None:
+            recorder.close()
+        calibration_cache.flush()
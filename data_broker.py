@@ -1,40 +1,133 @@
 import serial
 import time
 import logging
+import selectors
 
-def data_broker(shared_data):
+from serial_protocol import FrameParser, sample_to_state
+from speed_map import POT_TABLES
+
+# EMA weight of a new sample and the dead-band (in raw pot units) the filtered
+# value has to move before it is published
+CHANNEL_FILTERS = {
+    'pot_x': {'alpha': 0.3, 'deadband': 64},
+    'pot_y': {'alpha': 0.3, 'deadband': 64},
+}
+
+# How often the broker counters are written to shared_data
+COUNTER_INTERVAL = 1.0
+
+class ChannelFilter:
+    def __init__(self, alpha, deadband):
+        self.alpha = alpha
+        self.deadband = deadband
+        self.average = None
+        self.published = None
+
+    def update(self, value):
+        if self.average is None:
+            self.average = float(value)
+        else:
+            self.average += self.alpha * (value - self.average)
+        # Only move the published value once the average leaves the dead-band
+        if self.published is None or abs(self.average - self.published) >= self.deadband:
+            self.published = int(round(self.average))
+        return self.published
+
+class BrokerStats:
+    def __init__(self):
+        self.frames_received = 0
+        self.frames_dropped = 0
+        self.writes = 0
+        self.writes_suppressed = 0
+
+    def as_state(self):
+        return {
+            'broker_frames_received': self.frames_received,
+            'broker_frames_dropped': self.frames_dropped,
+            'broker_writes': self.writes,
+            'broker_writes_suppressed': self.writes_suppressed,
+        }
+
+def filter_samples(samples, filters):
+    # Run every sample through the channel filters, return the newest filtered state
+    state = None
+    for sample in samples:
+        state = sample_to_state(sample)
+        for key, channel_filter in filters.items():
+            state[key] = channel_filter.update(state[key])
+    return state
+
+def same_speed(tables, key, published, value):
+    # True if pot channel ``key`` moved between two values the speed map gives
+    # the same interval; the move is not published
+    motor = POT_TABLES.get(key)
+    if tables is None or motor is None or published is None:
+        return False
+    table = tables.table(motor)
+    return table[published] == table[value]
+
+def data_broker(shared_data, serial_port='/dev/ttyACM0', baud_rate=115200, metrics=None, speed_map=None):
     logging.info("Starting data broker...")
+    ser = None
     try:
-        serial_port = '/dev/ttyACM0'
-        baud_rate = 115200
-
-        ser = serial.Serial(serial_port, baud_rate)
+        # Non-blocking port, the selector wakes us up as soon as bytes arrive
+        ser = serial.Serial(serial_port, baud_rate, timeout=0)
         logging.info(f"Serial port {serial_port} opened successfully")
+        parser = FrameParser()
+        filters = {key: ChannelFilter(**settings) for key, settings in CHANNEL_FILTERS.items()}
+        stats = BrokerStats()
+        published = {}
+        tables_version = None
+        last_counters = time.monotonic()
+
+        selector = selectors.DefaultSelector()
+        selector.register(ser.fileno(), selectors.EVENT_READ)
+        latency = metrics['broker_latency_read_to_publish'] if metrics is not None else None
+        state_access = metrics['state_access_broker'] if metrics is not None else None
 
         while True:
-            if ser.in_waiting > 0:
-                line = ser.readline().decode('utf-8').strip()
-                logging.info(f"Serial data received: {line}")
-
-                if line:
-                    values = list(map(int, line.split(' ')))
-                    shared_data.update({
-                        'pot_x': values[0],
-                        'pot_y': values[1],
-                        'switch_x': (values[2], values[3]),  # Adding switch state
-                        'switch_y': (values[6], values[7]),  # Adding switch state
-                        'mode': values[4],
-                        'mode2': values[5]
-                    })
-                    logging.info(f"Updated shared_data: {shared_data}")
-
-            time.sleep(0.05)  # Adjust to ensure faster updates
+            if selector.select(timeout=COUNTER_INTERVAL):
+                ready_ns = time.perf_counter_ns()
+                data = ser.read(max(1, ser.in_waiting))
+                samples = parser.feed(data)
+                stats.frames_received = parser.frames
+                stats.frames_dropped = parser.malformed
+                if samples:
+                    state = filter_samples(samples, filters)
+                    tables = speed_map.current() if speed_map is not None else None
+                    if tables is not None and tables.version != tables_version:
+                        # New curves, the pots are compared afresh
+                        tables_version = tables.version
+                        for key in POT_TABLES:
+                            published.pop(key, None)
+                    # Publish only the fields that changed, in one write
+                    changed = {key: value for key, value in state.items()
+                               if published.get(key) != value and not same_speed(tables, key, published.get(key), value)}
+                    if tables is not None and speed_map.version != tables.version:
+                        # The tables were rebuilt while they were compared, publish every change
+                        changed = {key: value for key, value in state.items() if published.get(key) != value}
+                    stats.writes_suppressed += len(state) - len(changed)
+                    if changed:
+                        write_ns = time.perf_counter_ns()
+                        shared_data.update(changed)
+                        if latency is not None:
+                            done_ns = time.perf_counter_ns()
+                            state_access.record(done_ns - write_ns)
+                            latency.record(done_ns - ready_ns)
+                        published.update(changed)
+                        stats.writes += 1
+                    logging.debug("Serial %s data received: %d samples, changed %s", parser.protocol, len(samples), changed)
+
+            now = time.monotonic()
+            if now - last_counters >= COUNTER_INTERVAL:
+                shared_data.update(stats.as_state())
+                last_counters = now
 
     except serial.SerialException as e:
         logging.error(f"Error opening serial port {serial_port}: {e}")
     except Exception as e:
         logging.error(f"Error in data_broker: {e}")
     finally:
-        if ser.is_open:
+        if ser is not None and ser.is_open:
             ser.close()
         logging.info("Exiting data broker.")
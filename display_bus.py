@@ -0,0 +1,119 @@
+import logging
+
+import numpy as np
+
+# SSD1306 addressing commands, used to open a window of columns on one page
+SET_COLUMN_ADDRESS = 0x21
+SET_PAGE_ADDRESS = 0x22
+
+# Rows per SSD1306 display page, one byte per column holds 8 rows (LSB on top)
+PAGE_ROWS = 8
+
+# Dirty column runs closer than this are written as one transfer, the extra
+# clean bytes are cheaper than the 6 command bytes of a second window
+SPAN_MERGE_GAP = 8
+
+# Upper limit of data bytes written per flush, so a full redraw of one display
+# is spread over several flushes instead of holding the bus. None = no limit.
+MAX_FLUSH_BYTES = None
+
+
+def pack_pages(image, width, height):
+    # 1-bit image -> (pages, width) array of SSD1306 page bytes
+    pixels = np.asarray(image.convert("1"), dtype=np.uint8).reshape(height // PAGE_ROWS, PAGE_ROWS, width)
+    return np.packbits(pixels, axis=1, bitorder="little").reshape(height // PAGE_ROWS, width)
+
+
+def column_spans(dirty, merge_gap=SPAN_MERGE_GAP):
+    # (start, end) column runs of a dirty mask, inclusive at both ends
+    columns = np.flatnonzero(dirty)
+    if not len(columns):
+        return []
+    breaks = np.flatnonzero(np.diff(columns) > merge_gap)
+    starts = np.concatenate(([columns[0]], columns[breaks + 1]))
+    ends = np.concatenate((columns[breaks], [columns[-1]]))
+    return list(zip(starts.tolist(), ends.tolist()))
+
+
+class PagedDisplay:
+    """SSD1306 framebuffer that only sends the pages and columns that changed.
+
+    ``set_frame`` stores the frame the display should show. ``spans`` lists
+    the (page, start, end) windows where it differs from what the display
+    shows right now, and ``write_span`` sends one of them. Until the first
+    frame is written every page counts as dirty.
+    """
+
+    def __init__(self, device, name=None):
+        self.device = device
+        self.name = name or f"oled@{id(device):x}"
+        self.width = device.width
+        self.height = device.height
+        self.target = None
+        self.shown = None
+        self.frames = 0
+        self.bytes_written = 0
+
+    def set_frame(self, image):
+        self.target = pack_pages(self.device.preprocess(image), self.width, self.height)
+        self.frames += 1
+
+    def spans(self):
+        if self.target is None:
+            return []
+        if self.shown is None:
+            return [(page, 0, self.width - 1) for page in range(len(self.target))]
+        spans = []
+        for page in np.flatnonzero((self.target != self.shown).any(axis=1)).tolist():
+            spans.extend((page, start, end) for start, end in column_spans(self.target[page] != self.shown[page]))
+        return spans
+
+    def write_span(self, page, start, end):
+        data = self.target[page, start:end + 1]
+        self.device.command(SET_COLUMN_ADDRESS, start, end, SET_PAGE_ADDRESS, page, page)
+        self.device.data(data.tolist())
+        if self.shown is None:
+            self.shown = np.zeros_like(self.target)
+        self.shown[page, start:end + 1] = data
+        self.bytes_written += len(data)
+        return len(data)
+
+
+class BusScheduler:
+    """Single owner of the I2C bus shared by several displays.
+
+    ``flush`` writes the dirty spans of all displays, one span per display in
+    turn, so a full redraw of one screen cannot hold off the other. With
+    ``max_bytes`` set, whatever does not fit is left for the next flush; spans
+    are recomputed every flush, so a newer frame simply replaces the rest of an
+    older one.
+    """
+
+    def __init__(self, displays, max_bytes=MAX_FLUSH_BYTES):
+        self.displays = list(displays)
+        self.max_bytes = max_bytes
+        self.flushes = 0
+
+    def pending(self):
+        return any(display.spans() for display in self.displays)
+
+    def flush(self):
+        queues = [(display, display.spans()) for display in self.displays]
+        written = 0
+        index = 0
+        while any(spans for _, spans in queues):
+            display, spans = queues[index % len(queues)]
+            index += 1
+            if not spans:
+                continue
+            page, start, end = spans[0]
+            if self.max_bytes is not None and written and written + end - start + 1 > self.max_bytes:
+                break
+            spans.pop(0)
+            written += display.write_span(page, start, end)
+        self.flushes += 1
+        return written
+
+    def log_stats(self):
+        for display in self.displays:
+            logging.info(f"Display {display.name}: {display.frames} frames, {display.bytes_written} data bytes written")
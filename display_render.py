@@ -0,0 +1,66 @@
+import time
+
+from PIL import Image, ImageDraw
+
+# Frame pacing: redraw at 20 fps while anything moves, otherwise only poll the
+# shared state now and then. Nothing is rendered or sent while the displayed
+# values stay the same.
+ACTIVE_FRAME_INTERVAL = 0.05
+IDLE_FRAME_INTERVAL = 0.25
+
+# How long after the last change the display stays at the active rate
+ACTIVE_HOLD = 0.5
+
+class StaticLayer:
+    """Background bitmap drawn once and reused until its key changes.
+
+    ``draw_fn(draw, key)`` draws everything that does not change between
+    frames; ``frame(key)`` returns a fresh copy of the background to draw the
+    dynamic elements on.
+    """
+
+    def __init__(self, size, draw_fn):
+        self.size = size
+        self.draw_fn = draw_fn
+        self.key = None
+        self.image = None
+        self.builds = 0
+
+    def frame(self, key=None):
+        if self.image is None or key != self.key:
+            self.image = Image.new("1", self.size)
+            self.draw_fn(ImageDraw.Draw(self.image), key)
+            self.key = key
+            self.builds += 1
+        return self.image.copy()
+
+class FrameGate:
+    """Decides when a screen needs to be rendered.
+
+    ``due(values)`` is False while the displayed values are unchanged, so the
+    caller skips rendering altogether, and ``interval()`` is the sleep before
+    the next check. Frames that still come out identical are filtered by
+    display_bus.PagedDisplay, which only sends what changed.
+    """
+
+    def __init__(self, active_interval=ACTIVE_FRAME_INTERVAL, idle_interval=IDLE_FRAME_INTERVAL,
+                 active_hold=ACTIVE_HOLD):
+        self.active_interval = active_interval
+        self.idle_interval = idle_interval
+        self.active_hold = active_hold
+        self.values = None
+        self.last_change = 0.0
+        self.frames_rendered = 0
+
+    def due(self, values, animate=False):
+        if values == self.values and not animate:
+            return False
+        self.values = values
+        self.last_change = time.monotonic()
+        self.frames_rendered += 1
+        return True
+
+    def interval(self, moving=False):
+        if moving or time.monotonic() - self.last_change < self.active_hold:
+            return self.active_interval
+        return self.idle_interval
@@ -0,0 +1,51 @@
+import os
+import tty
+import time
+import logging
+
+from serial_protocol import Sample, encode_frame, encode_line
+
+class FakeController:
+    """Stand-in for the pot/switch controller on a pseudo terminal.
+
+    data_broker opens ``port_name`` like the real /dev/ttyACM0 and receives
+    whatever is sent here, as binary frames or ASCII lines.
+    """
+
+    def __init__(self):
+        self.master_fd, self.slave_fd = os.openpty()
+        # Raw mode, so binary frames are not mangled by newline translation
+        tty.setraw(self.slave_fd)
+        self.port_name = os.ttyname(self.slave_fd)
+        self.bytes_sent = 0
+
+    def write(self, data):
+        view = memoryview(data)
+        while view:
+            written = os.write(self.master_fd, view)
+            view = view[written:]
+        self.bytes_sent += len(data)
+
+    def send(self, samples, binary=True):
+        samples = list(samples)
+        if binary:
+            self.write(encode_frame(samples))
+        else:
+            self.write(b''.join(encode_line(sample) for sample in samples))
+
+    def close(self):
+        os.close(self.master_fd)
+        os.close(self.slave_fd)
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    controller = FakeController()
+    print(f"Fake controller on {controller.port_name}, sending a pot sweep")
+    try:
+        pot = 0
+        while True:
+            controller.send([Sample(pot, 65535 - pot, (1, 0), (0, 1), 0, 1)])
+            pot = (pot + 512) % 65536
+            time.sleep(0.02)
+    except KeyboardInterrupt:
+        controller.close()
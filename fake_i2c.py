@@ -0,0 +1,59 @@
+import logging
+
+from display_bus import pack_pages, SET_COLUMN_ADDRESS, SET_PAGE_ADDRESS
+
+# luma writes display data in blocks of this many bytes, each block is its
+# own I2C transaction with an address and a control byte
+I2C_BLOCK_SIZE = 32
+
+class FakeI2C:
+    """Stand-in for luma's i2c serial interface that counts the bytes on the bus.
+
+    Every transaction is counted as the address byte, the control byte and the
+    payload, the same framing luma uses on a real bus.
+    """
+
+    def __init__(self, port=1, address=0x3C):
+        self.port = port
+        self.address = address
+        self.transactions = 0
+        self.bytes = 0
+
+    def command(self, *cmd):
+        self.transactions += 1
+        self.bytes += 2 + len(cmd)
+
+    def data(self, data):
+        for offset in range(0, len(data), I2C_BLOCK_SIZE):
+            self.transactions += 1
+            self.bytes += 2 + len(data[offset:offset + I2C_BLOCK_SIZE])
+
+    def cleanup(self):
+        logging.info(f"Fake I2C 0x{self.address:02X}: {self.transactions} transactions, {self.bytes} bytes")
+
+class FakeSSD1306:
+    """Minimal ssd1306 device on a FakeI2C, with luma's full-frame ``display``."""
+
+    def __init__(self, serial_interface=None, width=128, height=64):
+        self.serial = serial_interface or FakeI2C()
+        self.width = width
+        self.height = height
+        self.size = (width, height)
+        self.mode = "1"
+
+    def command(self, *cmd):
+        self.serial.command(*cmd)
+
+    def data(self, data):
+        self.serial.data(data)
+
+    def preprocess(self, image):
+        return image
+
+    def display(self, image):
+        # Same transfer as luma's ssd1306.display: the whole frame every time
+        self.command(SET_COLUMN_ADDRESS, 0, self.width - 1, SET_PAGE_ADDRESS, 0, self.height // 8 - 1)
+        self.data(pack_pages(image, self.width, self.height).ravel().tolist())
+
+    def cleanup(self):
+        self.serial.cleanup()
@@ -0,0 +1,44 @@
+import logging
+
+# RPi.GPIO is imported and put in BCM mode on first use, by the process that
+# drives the pins. Nothing touches the hardware when a module is imported.
+_GPIO = None
+
+# Pins this process has set up, and as what
+_pin_modes = {}
+
+
+def gpio():
+    global _GPIO
+    if _GPIO is None:
+        import RPi.GPIO as GPIO
+        GPIO.setwarnings(False)
+        GPIO.setmode(GPIO.BCM)
+        _GPIO = GPIO
+    return _GPIO
+
+
+def _claim(pin, mode):
+    # True if the pin still has to be set up as ``mode`` in this process
+    previous = _pin_modes.get(pin)
+    if previous == mode:
+        return False
+    if previous is not None:
+        logging.warning(f"GPIO {pin} was set up as {previous}, now as {mode}")
+    _pin_modes[pin] = mode
+    return True
+
+
+def setup_outputs(*pins):
+    GPIO = gpio()
+    for pin in pins:
+        if _claim(pin, 'output'):
+            GPIO.setup(pin, GPIO.OUT, initial=GPIO.LOW)
+
+
+def setup_inputs(*pins):
+    # Limit switches close to ground, so the inputs are pulled up
+    GPIO = gpio()
+    for pin in pins:
+        if _claim(pin, 'input'):
+            GPIO.setup(pin, GPIO.IN, pull_up_down=GPIO.PUD_UP)
@@ -0,0 +1,358 @@
+import os
+import re
+import sys
+import math
+import socket
+import logging
+import argparse
+import threading
+
+import numpy as np
+
+# Moves buffered between the reader thread and the step loop. The reader
+# waits while the ring is full and stops reading its source meanwhile, so a
+# sender on a pipe or socket is held back by the kernel's buffers.
+RING_MOVES = 4096
+
+# Bytes read from a source at a time
+READ_SIZE = 65536
+
+# Binary jobs start with this magic, followed by MOVE_DTYPE records: flags,
+# x and y in steps, feed in steps/s. MOVE_KEEP_X/Y leave that axis where it is.
+BINARY_MAGIC = b'MJOB'
+MOVE_DTYPE = np.dtype([('flags', 'u1'), ('x', '<i4'), ('y', '<i4'), ('feed', '<f4')])
+MOVE_RELATIVE = 1
+MOVE_RAPID = 2
+MOVE_KEEP_X = 4
+MOVE_KEEP_Y = 8
+
+# Ring columns are x, y, feed (steps/s, inf for rapid moves) and kind
+ABSOLUTE, RELATIVE, JOB_END = 0, 1, 2
+
+# Feed (steps/min) of G1 moves before the first F word of a job
+DEFAULT_FEED = 6000
+
+# Comments and words of a G-code line
+_COMMENT = re.compile(rb'\([^)]*\)|;.*')
+_WORD = re.compile(rb'([A-Za-z])\s*([-+]?(?:\d+\.?\d*|\.\d+))')
+
+
+class GCodeParser:
+    """The G0/G1 subset of G-code, with coordinates in steps.
+
+    X0 Y0 is the calibrated zero at the negative limit switches. Feed rates
+    (F) are in steps/min; G0 moves at the planner's top speed, G1 at the
+    last F, or at DEFAULT_FEED (reported once) before the first one. An F of
+    zero or less is reported and ignored. G90/G91 switch between absolute and
+    relative coordinates, M2/M30 end the job. Anything else is ignored and
+    reported once.
+    """
+
+    def __init__(self):
+        self.motion = 0
+        self.relative = False
+        self.feed = None
+        self.ended = False
+        self.ignored = set()
+
+    def parse(self, data):
+        # Rows for the complete lines in ``data``
+        rows = []
+        for line in data.splitlines():
+            words = _WORD.findall(_COMMENT.sub(b'', line))
+            if not words:
+                continue
+            x = y = None
+            for letter, value in words:
+                letter = letter.upper()
+                if letter == b'G':
+                    code = float(value)
+                    if code in (0, 1):
+                        self.motion = int(code)
+                    elif code == 90:
+                        self.relative = False
+                    elif code == 91:
+                        self.relative = True
+                    else:
+                        self._ignore(b'G' + value)
+                elif letter == b'X':
+                    x = float(value)
+                elif letter == b'Y':
+                    y = float(value)
+                elif letter == b'F':
+                    if float(value) > 0:
+                        self.feed = float(value) / 60
+                    else:
+                        self._ignore(b'F' + value)
+                elif letter == b'M' and float(value) in (2, 30):
+                    self.ended = True
+                    return rows
+                elif letter != b'N':
+                    self._ignore(letter + value)
+            if x is None and y is None:
+                continue
+            if self.motion == 1 and self.feed is None:
+                logging.warning(f"G1 before the first F, moving at the default {DEFAULT_FEED} steps/min")
+                self.feed = DEFAULT_FEED / 60
+            feed = math.inf if self.motion == 0 else self.feed
+            if self.relative:
+                rows.append((x or 0.0, y or 0.0, feed, RELATIVE))
+            else:
+                # An axis left out keeps its position
+                rows.append((math.nan if x is None else x, math.nan if y is None else y, feed, ABSOLUTE))
+        return rows
+
+    def _ignore(self, word):
+        word = word.decode(errors='replace')
+        if word not in self.ignored:
+            self.ignored.add(word)
+            logging.info(f"Ignoring unsupported G-code {word}")
+
+
+def decode_moves(data):
+    # Ring rows for whole MOVE_DTYPE records
+    records = np.frombuffer(data, dtype=MOVE_DTYPE)
+    rows = np.empty((len(records), 4))
+    flags = records['flags']
+    rows[:, 0] = np.where(flags & MOVE_KEEP_X, math.nan, records['x'])
+    rows[:, 1] = np.where(flags & MOVE_KEEP_Y, math.nan, records['y'])
+    rapid = (flags & MOVE_RAPID).astype(bool) | (records['feed'] <= 0)
+    rows[:, 2] = np.where(rapid, math.inf, records['feed'])
+    rows[:, 3] = np.where(flags & MOVE_RELATIVE, RELATIVE, ABSOLUTE)
+    return rows
+
+
+def encode_moves(rows):
+    # Binary records (without the magic) for ring rows of absolute or relative moves
+    rows = np.asarray(rows, dtype=np.float64).reshape(-1, 4)
+    records = np.zeros(len(rows), dtype=MOVE_DTYPE)
+    records['x'] = np.nan_to_num(rows[:, 0])
+    records['y'] = np.nan_to_num(rows[:, 1])
+    rapid = np.isinf(rows[:, 2])
+    records['feed'] = np.where(rapid, 0, rows[:, 2])
+    records['flags'] = (np.where(rows[:, 3] == RELATIVE, MOVE_RELATIVE, 0) | np.where(rapid, MOVE_RAPID, 0)
+                        | np.where(np.isnan(rows[:, 0]), MOVE_KEEP_X, 0) | np.where(np.isnan(rows[:, 1]), MOVE_KEEP_Y, 0))
+    return records.tobytes()
+
+
+class MoveRing:
+    """Fixed-size ring of moves between one reader thread and the step loop.
+
+    ``put`` waits while the ring is full, ``get`` hands out at most one job
+    at a time: it stops after a JOB_END row. ``low_water`` is the fewest
+    moves that were buffered when the step loop asked for more before the
+    end of the job had been read, ``underruns`` the times it found nothing.
+    """
+
+    def __init__(self, capacity=RING_MOVES):
+        self.capacity = capacity
+        self.moves = np.zeros((capacity, 4))
+        self.head = 0
+        self.count = 0
+        self.low_water = capacity
+        self.underruns = 0
+        self.full_waits = 0
+        self.ends = 0  # JOB_END rows in the ring
+        self._ready = threading.Condition()
+
+    def __len__(self):
+        return self.count
+
+    def put(self, rows, stop):
+        rows = np.asarray(rows, dtype=np.float64).reshape(-1, 4)
+        offset = 0
+        with self._ready:
+            while offset < len(rows):
+                if self.count == self.capacity:
+                    self.full_waits += 1
+                while self.count == self.capacity:
+                    if stop.is_set():
+                        return False
+                    self._ready.wait(0.1)
+                count = min(self.capacity - self.count, len(rows) - offset)
+                tail = (self.head + self.count) % self.capacity
+                first = min(count, self.capacity - tail)
+                self.moves[tail:tail + first] = rows[offset:offset + first]
+                self.moves[:count - first] = rows[offset + first:offset + count]
+                self.count += count
+                self.ends += int(np.count_nonzero(rows[offset:offset + count, 3] == JOB_END))
+                offset += count
+                self._ready.notify_all()
+        return True
+
+    def get(self, limit, timeout=0):
+        # Up to ``limit`` moves, waiting up to ``timeout`` seconds for the first
+        with self._ready:
+            if not self.ends:
+                self.low_water = min(self.low_water, self.count)
+            if not self.count:
+                self.underruns += 1
+                if timeout:
+                    self._ready.wait_for(lambda: self.count, timeout)
+            count = min(limit, self.count)
+            index = (self.head + np.arange(count)) % self.capacity
+            rows = self.moves[index]
+            ends = np.flatnonzero(rows[:, 3] == JOB_END)
+            if len(ends):
+                rows = rows[:ends[0] + 1]
+                self.ends -= 1
+            self.head = (self.head + len(rows)) % self.capacity
+            self.count -= len(rows)
+            self._ready.notify_all()
+        return rows
+
+
+def _listen(path):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    server.listen(1)
+    return server
+
+
+class JobStreamer:
+    """Reads jobs from a file, stdin ('-') or a Unix socket ('unix:PATH') into a MoveRing.
+
+    A file or stdin is one job. A socket takes one connection at a time and
+    every connection is a job, so jobs can be sent while the machine runs
+    (``python job_stream.py send``). Each job is G-code, or binary moves if
+    it starts with BINARY_MAGIC. Only READ_SIZE bytes and the ring are held
+    in memory, whatever the size of the job.
+    """
+
+    def __init__(self, source, capacity=RING_MOVES):
+        self.source = source
+        self.ring = MoveRing(capacity)
+        self.jobs = 0
+        self.bytes_read = 0
+        self._stop = threading.Event()
+        self._server = None
+        self._thread = threading.Thread(target=self._produce, name="JobStream", daemon=True)
+
+    def start(self):
+        if self.source.startswith('unix:'):
+            self._server = _listen(self.source[len('unix:'):])
+            self._server.settimeout(0.2)
+        self._thread.start()
+        return self
+
+    def _produce(self):
+        try:
+            if self._server is None:
+                if self.source == '-':
+                    self._read_job(sys.stdin.buffer.raw.read)
+                else:
+                    with open(self.source, 'rb', buffering=0) as f:
+                        self._read_job(f.read)
+                return
+            while not self._stop.is_set():
+                try:
+                    connection, _ = self._server.accept()
+                except socket.timeout:
+                    continue
+                with connection:
+                    connection.settimeout(None)
+                    self._read_job(connection.recv)
+        except OSError as e:
+            logging.error(f"Job source {self.source} failed: {e}")
+
+    def _read_job(self, read):
+        # One job from ``read``. It is ended with a JOB_END row however reading
+        # stops, so the step loop never waits for a job that is gone.
+        try:
+            self._parse_job(read)
+        finally:
+            self.ring.put([(0, 0, 0, JOB_END)], self._stop)
+            self.jobs += 1
+
+    def _parse_job(self, read):
+        data = b''
+        parser = None
+        binary = False
+        while not self._stop.is_set():
+            chunk = read(READ_SIZE)
+            self.bytes_read += len(chunk)
+            data += chunk
+            if parser is None and not binary:
+                if len(data) < len(BINARY_MAGIC) and chunk:
+                    continue
+                binary = data.startswith(BINARY_MAGIC)
+                if binary:
+                    data = data[len(BINARY_MAGIC):]
+                else:
+                    parser = GCodeParser()
+            if binary:
+                whole = len(data) - len(data) % MOVE_DTYPE.itemsize
+                rows, data = decode_moves(data[:whole]), data[whole:]
+            else:
+                # The last line is only complete at the end of the job
+                cut = len(data) if not chunk else data.rfind(b'\n') + 1
+                rows, data = parser.parse(data[:cut]), data[cut:]
+            if len(rows) and not self.ring.put(rows, self._stop):
+                return
+            if not chunk or (parser is not None and parser.ended):
+                return
+
+    def ready(self):
+        # A job is waiting or running
+        return len(self.ring) > 0
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join(timeout=1.0)
+        if self._server is not None:
+            self._server.close()
+            os.unlink(self.source[len('unix:'):])
+        logging.info(f"Job source {self.source} stopped after {self.jobs} jobs, {self.ring.underruns} ring underruns")
+
+
+def send(job, path):
+    # Stream a job file or stdin to the socket of a running JobStreamer. The
+    # send blocks whenever its ring is full.
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.connect(path)
+    source = sys.stdin.buffer if job == '-' else open(job, 'rb')
+    with client, source:
+        while True:
+            chunk = source.read(READ_SIZE)
+            if not chunk:
+                break
+            client.sendall(chunk)
+
+
+def convert(job, output):
+    # G-code to binary moves, streamed
+    streamer = JobStreamer(job, capacity=RING_MOVES).start()
+    moves = 0
+    with open(output, 'wb') as f:
+        f.write(BINARY_MAGIC)
+        while True:
+            rows = streamer.ring.get(RING_MOVES, timeout=1.0)
+            moves += len(rows)
+            if len(rows) and rows[-1, 3] == JOB_END:
+                f.write(encode_moves(rows[:-1]))
+                break
+            f.write(encode_moves(rows))
+    streamer.stop()
+    return moves - 1
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Motion jobs: G-code (G0/G1 in steps) or binary moves")
+    commands = parser.add_subparsers(dest='command', required=True)
+    send_parser = commands.add_parser('send', help="stream a job to main_script's JOB_SOURCE socket")
+    send_parser.add_argument('job', help="job file, - for stdin")
+    send_parser.add_argument('socket', help="path of the socket")
+    convert_parser = commands.add_parser('convert', help="convert G-code to binary moves")
+    convert_parser.add_argument('job', help="G-code file, - for stdin")
+    convert_parser.add_argument('output')
+    args = parser.parse_args()
+
+    if args.command == 'send':
+        send(args.job, args.socket[len('unix:'):] if args.socket.startswith('unix:') else args.socket)
+    else:
+        print(f"{convert(args.job, args.output)} moves written to {args.output}")
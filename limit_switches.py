@@ -0,0 +1,80 @@
+import logging
+
+from hardware import gpio
+
+# Edges closer together than this (ms) are switch bounce and ignored
+LIMIT_BOUNCE_MS = 5
+
+# Index of each switch in LimitSwitches.flags
+NEG, POS = 0, 1
+
+
+class LimitSwitches:
+    """Edge-triggered limit switches of one axis.
+
+    The switches close to ground, so RPi.GPIO calls ``_closed`` from its event
+    thread on the falling edge and it stores 1 in that switch's byte of
+    ``flags``. A single byte store needs no lock. The step loop hands the
+    byte of the switch ahead (``stop_flag``) to the pulse output, which reads
+    it before every step, so a trip stops the motion within one step without
+    polling the pins.
+
+    A flag stays set until ``clear`` re-arms it once the axis has moved off
+    the switch. ``on_trip`` is called from the event thread after the flag is
+    set, for outputs that have pulses queued outside the step loop.
+    """
+
+    def __init__(self, neg_pin, pos_pin, bouncetime=LIMIT_BOUNCE_MS, on_trip=None):
+        self.pins = (neg_pin, pos_pin)
+        self.flags = bytearray(2)
+        self._views = (memoryview(self.flags)[NEG:NEG + 1], memoryview(self.flags)[POS:POS + 1])
+        self.on_trip = on_trip
+        GPIO = gpio()
+        for side, pin in enumerate(self.pins):
+            GPIO.add_event_detect(pin, GPIO.FALLING, callback=self._closed, bouncetime=bouncetime)
+            # A switch that is already closed gives no edge
+            self.clear(side)
+
+    def _closed(self, pin):
+        self.flags[self.pins.index(pin)] = 1
+        if self.on_trip is not None:
+            self.on_trip()
+
+    @staticmethod
+    def side(direction):
+        # Switch ahead when moving ``direction``
+        return POS if direction == (1, 0) else NEG
+
+    def stop_flag(self, direction):
+        # One byte buffer the pulse outputs check before each step
+        return self._views[self.side(direction)]
+
+    def tripped(self, direction):
+        return bool(self.flags[self.side(direction)])
+
+    def clear(self, side):
+        # Re-arm a switch after moving off it. The level is read once in case
+        # it is still closed, that would not give another edge. Clearing first
+        # means an edge during the read is not lost.
+        self.flags[side] = 0
+        if not gpio().input(self.pins[side]):
+            self.flags[side] = 1
+        return not self.flags[side]
+
+    def leaving(self, direction):
+        # Moving ``direction``: re-arm the switch behind if it tripped before
+        side = NEG if self.side(direction) == POS else POS
+        if self.flags[side]:
+            self.clear(side)
+
+    def rearm(self):
+        # Both switches, once the axis is away from them
+        return all([self.clear(NEG), self.clear(POS)])
+
+    def close(self):
+        GPIO = gpio()
+        for pin in self.pins:
+            try:
+                GPIO.remove_event_detect(pin)
+            except RuntimeError as e:
+                logging.warning(f"Could not remove edge detection on GPIO {pin}: {e}")
@@ -0,0 +1,64 @@
+import logging
+from logging.handlers import QueueHandler, QueueListener
+from multiprocessing import Event, Process, Queue
+
+LOG_FORMAT = '%(asctime)s - %(processName)s - %(levelname)s - %(message)s'
+
+# Also append the log to this file, None = stderr only
+LOG_FILE = None
+
+def log_writer_process(log_queue, stop_event, level=logging.INFO, log_file=LOG_FILE):
+    # The only process that formats records and writes them out
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers = [logging.StreamHandler()]
+    if log_file:
+        handlers.append(logging.FileHandler(log_file))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+        handler.setLevel(level)
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    try:
+        stop_event.wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # Drains whatever is still queued before returning
+        listener.stop()
+
+def configure_process_logging(log_queue, level=logging.INFO):
+    # Replace the handlers of this process with one that only enqueues records
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(QueueHandler(log_queue))
+    root.setLevel(level)
+
+def run_logged(log_queue, target, *args, **kwargs):
+    # Process target wrapper, so spawned processes log through the queue as well
+    configure_process_logging(log_queue)
+    return target(*args, **kwargs)
+
+class LogService:
+    """Queue based log shipping from every process to one writer process.
+
+    ``start`` launches the writer and routes this process's records into the
+    queue. Child processes use ``run_logged`` (or inherit the handler when
+    forked); they only pay for putting a record on the queue.
+    """
+
+    def __init__(self, level=logging.INFO, log_file=LOG_FILE):
+        self.level = level
+        self.queue = Queue()
+        self._stop = Event()
+        self._process = Process(target=log_writer_process, args=(self.queue, self._stop, level, log_file),
+                                name="LogWriter", daemon=True)
+
+    def start(self):
+        self._process.start()
+        configure_process_logging(self.queue, self.level)
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._process.join(timeout=2.0)
@@ -1,45 +1,80 @@
+import os
 import threading
 import time
-import RPi.GPIO as GPIO
 import logging
-from multiprocessing import Process, Manager, Event
-from oled_display import update_display_oled1, update_display_oled2
+import multiprocessing
+from multiprocessing import Process, Manager, Event, Queue
+from oled_display import display_service
 from data_broker import data_broker
 from stepper_motor_control import motor_control_thread  # Import motor control function
+from coordinated_motion import coordinated_motion_process
+from multi_axis import multi_axis_process
+from axes import AXES, load_axes
 from rotary_encoder import RotaryEncoderHandler
 from buffer_manager import BufferManager
-
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(processName)s - %(levelname)s - %(message)s')
-
-# GPIO setup
-GPIO.setmode(GPIO.BCM)
-
-# Limit switches setup
-limit_switch_x_left = 17
-limit_switch_x_right = 18
-limit_switch_y_top = 27
-limit_switch_y_bottom = 22
-
-GPIO.setup(limit_switch_x_left, GPIO.IN, pull_up_down=GPIO.PUD_UP)
-GPIO.setup(limit_switch_x_right, GPIO.IN, pull_up_down=GPIO.PUD_UP)
-GPIO.setup(limit_switch_y_top, GPIO.IN, pull_up_down=GPIO.PUD_UP)
-GPIO.setup(limit_switch_y_bottom, GPIO.IN, pull_up_down=GPIO.PUD_UP)
-
-# Motor control setup
-motor_pin_x_dir = 23
-motor_pin_x_step = 24
-motor_pin_y_dir = 27
-motor_pin_y_step = 22
-
-GPIO.setup(motor_pin_x_dir, GPIO.OUT)
-GPIO.setup(motor_pin_x_step, GPIO.OUT)
-GPIO.setup(motor_pin_y_dir, GPIO.OUT)
-GPIO.setup(motor_pin_y_step, GPIO.OUT)
+from shared_state import SharedState, STATE_SHM_NAME
+from config_store import ConfigStore, ConfigFile
+from speed_map import SpeedMap
+from log_service import LogService, run_logged
+from step_trace import StepTrace
+from metrics import Metrics
+from motion_recording import recording_path, find_recording
+
+# Keep the hot-path motion state in a shared memory block instead of the
+# Manager proxy dict. Set to False to fall back to the proxy dict.
+USE_SHARED_STATE = True
+
+# 'bounce' runs one process per axis bouncing between its buffers, 'multi' the
+# same bounce mode for every axis from one process, 'coordinated' drives both
+# axes from one process on a shared timeline
+MOTION_MODE = os.environ.get('MOTION_MODE', 'bounce')
+
+# Every step is recorded in a shared memory ring buffer. If set, the trace is
+# written to this file on exit (decode it with `python step_trace.py decode`).
+STEP_TRACE_FILE = os.environ.get('STEP_TRACE_FILE')
+
+# JSON file of axes to add to or change in axes.AXES (pins, switches, speeds).
+# Loaded at import, so processes started with 'spawn' see the same axes.
+AXES_FILE = os.environ.get('AXES_FILE')
+if AXES_FILE:
+    load_axes(AXES_FILE)
+
+# Serial device of the pot/switch controller (simulation.py points it at a pty)
+SERIAL_PORT = os.environ.get('SERIAL_PORT', '/dev/ttyACM0')
+
+# multiprocessing start method, None keeps the platform default ('fork' on
+# Linux). Nothing touches the hardware at import time, so 'spawn' works too.
+START_METHOD = os.environ.get('START_METHOD')
+
+# JSON file the motion settings (buffers, speeds) are loaded from and saved to.
+# Edits to it are picked up while running.
+CONFIG_FILE = os.environ.get('CONFIG_FILE')
+
+# Where coordinated mode reads motion jobs from: a G-code or binary job file,
+# or 'unix:PATH' to take jobs sent with `python job_stream.py send`
+JOB_SOURCE = os.environ.get('JOB_SOURCE')
+
+# Every step of the motion processes is appended to a recording in this
+# directory, a new file per process and run (`python motion_recording.py summary`).
+# In bounce mode each axis first replays its latest recording from REPLAY_DIR,
+# REPLAY_SPEED times as fast as it was recorded.
+RECORD_DIR = os.environ.get('RECORD_DIR')
+REPLAY_DIR = os.environ.get('REPLAY_DIR')
+REPLAY_SPEED = float(os.environ.get('REPLAY_SPEED', '1.0'))
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(processName)s - %(levelname)s - %(message)s')
+    if START_METHOD:
+        multiprocessing.set_start_method(START_METHOD)
+    # All processes hand their log records to one writer process
+    log_service = LogService().start()
+    step_trace = StepTrace.create(axes=tuple(AXES))
+    logging.info(f"Step trace in shared memory {step_trace.name}")
+    # Timing histograms, read them with `python metrics.py` while running
+    metrics = Metrics.create()
+
     manager = Manager()
-    shared_data = manager.dict({
+    initial_state = {
         'pot_x': 0,
         'pot_y': 0,
         'X_speed': 10000,  # Set initial speed for X motor
@@ -56,12 +91,19 @@ if __name__ == "__main__":
         'calibrating_x': True,
         'calibrating_y': True,
         'mode2': 1,
-        'MOVEMENT_BUFFER_LEFT': 100,  # Default values for buffers
-        'MOVEMENT_BUFFER_RIGHT': 200,
-        'MOVEMENT_BUFFER_TOP': 100,
-        'MOVEMENT_BUFFER_BOTTOM': 100,
         'current_mode': 'none'
-    })
+    }
+    if USE_SHARED_STATE:
+        shared_data = SharedState.create(initial_state, name=STATE_SHM_NAME)
+    else:
+        shared_data = manager.dict(initial_state)
+    # Buffers and speeds, copied into shared_data for the display on every change
+    config = ConfigStore.create(mirror=shared_data)
+    # Pot to step interval tables, rebuilt whenever a publish changes the curves
+    speed_map = SpeedMap.create(config.current())
+    config.listeners.append(speed_map.sync)
+    if CONFIG_FILE:
+        ConfigFile(config, CONFIG_FILE).start()
 
     encoder_state = manager.dict({
         'pressed': False,
@@ -69,37 +111,93 @@ if __name__ == "__main__":
         'adjustment_mode': 'none'
     })
 
-    buffer_manager = BufferManager(shared_data, encoder_state)
+    # Other processes send each axis commands (re-homing) instead of writing its position
+    axis_commands = {motor: Queue() for motor in AXES}
+
+    buffer_manager = BufferManager(shared_data, encoder_state, config, axis_commands)
 
     # Initialize the rotary encoders with the shared data and encoder state
     encoder = RotaryEncoderHandler(13, 6, 5, buffer_manager.encoder_callback)
     encoder_2 = RotaryEncoderHandler(21, 20, 16, buffer_manager.encoder_callback_2)
 
-    display_process1 = Process(target=update_display_oled1, args=(shared_data,))
-    display_process2 = Process(target=update_display_oled2, args=(shared_data, encoder_state))
-    data_broker_process = Process(target=data_broker, args=(shared_data,))
-    calibration_event_x = Event()
-    calibration_event_y = Event()
+    log_queue = log_service.queue
+    # One process owns the I2C bus and drives both OLEDs
+    display_process = Process(target=run_logged, args=(log_queue, display_service, shared_data, encoder_state),
+                              kwargs={'metrics': metrics, 'speed_map': speed_map})
+    data_broker_process = Process(target=run_logged, args=(log_queue, data_broker, shared_data),
+                                  kwargs={'serial_port': SERIAL_PORT, 'metrics': metrics, 'speed_map': speed_map})
     all_done_event = Event()
 
-    motor_control_x_process = Process(target=motor_control_thread, args=("X", shared_data, calibration_event_x, all_done_event))
-    motor_control_y_process = Process(target=motor_control_thread, args=("Y", shared_data, calibration_event_y, all_done_event))
-
-    display_process1.start()
-    display_process2.start()
+    motion_kwargs = {'step_trace': step_trace, 'metrics': metrics, 'config': config, 'speed_map': speed_map}
+    if RECORD_DIR:
+        os.makedirs(RECORD_DIR, exist_ok=True)
+    if MOTION_MODE == 'coordinated':
+        if RECORD_DIR:
+            motion_kwargs['record_path'] = recording_path(RECORD_DIR, ("X", "Y"))
+        if REPLAY_DIR:
+            logging.warning("REPLAY_DIR is only replayed in bounce mode")
+        # One process calibrates and drives both axes, so one event covers both
+        calibration_events = [Event()]
+        motion_processes = [
+            Process(target=run_logged, args=(log_queue, coordinated_motion_process, shared_data, calibration_events[0],
+                                             all_done_event),
+                    kwargs=dict(motion_kwargs, commands=axis_commands, job_source=JOB_SOURCE)),
+        ]
+    elif MOTION_MODE == 'multi':
+        if RECORD_DIR:
+            motion_kwargs['record_path'] = recording_path(RECORD_DIR, tuple(AXES))
+        if JOB_SOURCE or REPLAY_DIR:
+            logging.warning("JOB_SOURCE and REPLAY_DIR are not used in multi-axis mode")
+        # One process calibrates every axis and drives them from one deadline heap
+        calibration_events = [Event()]
+        motion_processes = [
+            Process(target=run_logged, args=(log_queue, multi_axis_process, shared_data, calibration_events[0],
+                                             all_done_event), kwargs=dict(motion_kwargs, commands=axis_commands)),
+        ]
+    else:
+        if JOB_SOURCE:
+            logging.warning("JOB_SOURCE is only read in coordinated mode (MOTION_MODE=coordinated)")
+        axis_kwargs = {}
+        for motor in AXES:
+            axis_kwargs[motor] = dict(motion_kwargs, commands=axis_commands[motor])
+            if RECORD_DIR:
+                axis_kwargs[motor]['record_path'] = recording_path(RECORD_DIR, (motor,))
+            replay_path = find_recording(REPLAY_DIR, motor) if REPLAY_DIR else None
+            if replay_path:
+                axis_kwargs[motor]['replay_path'] = replay_path
+                axis_kwargs[motor]['replay_speed'] = REPLAY_SPEED
+            elif REPLAY_DIR:
+                logging.warning(f"No recording of {motor} in {REPLAY_DIR}")
+        calibration_events = [Event() for _ in AXES]
+        motion_processes = [
+            Process(target=run_logged, args=(log_queue, motor_control_thread, motor, shared_data, calibration_event,
+                                             all_done_event), kwargs=axis_kwargs[motor])
+            for motor, calibration_event in zip(AXES, calibration_events)
+        ]
+
+    display_process.start()
     data_broker_process.start()
-    motor_control_x_process.start()
-    motor_control_y_process.start()
+    for motion_process in motion_processes:
+        motion_process.start()
 
-    # Wait for both calibrations to complete
-    calibration_event_x.wait()
-    calibration_event_y.wait()
+    # Wait for all calibrations to complete
+    for calibration_event in calibration_events:
+        calibration_event.wait()
 
-    # Set the all_done_event to signal motors to start bounce mode
+    # Set the all_done_event to signal motors to start moving
     all_done_event.set()
 
-    display_process1.join()
-    display_process2.join()
+    display_process.join()
     data_broker_process.join()
-    motor_control_x_process.join()
-    motor_control_y_process.join()
+    for motion_process in motion_processes:
+        motion_process.join()
+
+    if USE_SHARED_STATE:
+        shared_data.close()
+    config.close()
+    speed_map.close()
+    if STEP_TRACE_FILE:
+        step_trace.save(STEP_TRACE_FILE)
+    step_trace.close()
+    metrics.close()
+    log_service.stop()
@@ -0,0 +1,310 @@
+import sys
+import time
+import argparse
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import numpy as np
+
+from shared_state import create_block, release_block, attach_untracked
+
+# Fixed block name, see shared_state.STATE_SHM_NAME
+METRICS_SHM_NAME = 'motion_metrics'
+
+# Histograms kept in the block: (family, label name, label value). All values
+# are durations in ns. Every histogram has a single writer process.
+HISTOGRAMS = [
+    ('step_lateness', 'axis', 'X'),
+    ('step_lateness', 'axis', 'Y'),
+    ('step_interval_error', 'axis', 'X'),
+    ('step_interval_error', 'axis', 'Y'),
+    ('state_access', 'process', 'motor_x'),
+    ('state_access', 'process', 'motor_y'),
+    ('state_access', 'process', 'broker'),
+    ('state_access', 'process', 'display'),
+    ('broker_latency', 'stage', 'read_to_publish'),
+    ('render_time', 'display', 'oled1'),
+    ('render_time', 'display', 'oled2'),
+    ('render_time', 'display', 'bus_flush'),
+]
+
+METRIC_HELP = {
+    'step_lateness': "How late each step edge was relative to its deadline",
+    'step_interval_error': "Difference between achieved and commanded step half-period",
+    'state_access': "Time spent reading and writing the shared state per loop iteration",
+    'broker_latency': "Time from serial data being readable to the shared state update",
+    'render_time': "Time to render one display frame or flush the bus",
+}
+
+QUANTILES = (0.5, 0.9, 0.99, 0.999)
+
+# HDR-style log-linear buckets: values below 2**SUB_BUCKET_BITS get one bucket
+# each, above that every power of two is split into 2**(SUB_BUCKET_BITS-1)
+# buckets, so every bucket is within ~3% of the values it holds.
+SUB_BUCKET_BITS = 6
+SUB_BUCKET_HALF = 1 << (SUB_BUCKET_BITS - 1)
+MAX_VALUE_BITS = 40  # ~18 minutes in ns
+BUCKETS = SUB_BUCKET_HALF * (MAX_VALUE_BITS - SUB_BUCKET_BITS + 3)
+
+# Per histogram: count, sum, min, max, then the buckets (all uint64)
+_STATS = 4
+_SLOTS = _STATS + BUCKETS
+
+
+def bucket_index(value):
+    if value < 2 * SUB_BUCKET_HALF:
+        return value if value > 0 else 0
+    shift = value.bit_length() - SUB_BUCKET_BITS
+    return min(SUB_BUCKET_HALF * shift + (value >> shift), BUCKETS - 1)
+
+
+def bucket_bounds(index):
+    # Lowest and highest value that land in bucket ``index``
+    if index < 2 * SUB_BUCKET_HALF:
+        return index, index
+    shift = index // SUB_BUCKET_HALF - 1
+    mantissa = index - SUB_BUCKET_HALF * shift
+    return mantissa << shift, ((mantissa + 1) << shift) - 1
+
+
+def histogram_key(family, label_value):
+    return f"{family}_{label_value.lower()}"
+
+
+class Histogram:
+    """One HDR-style histogram living in the metrics block.
+
+    ``record`` only does integer arithmetic and in-place stores into a
+    memoryview, so the instrumented loops do not allocate. ``record_array``
+    adds a whole NumPy array of values at once.
+    """
+
+    def __init__(self, slots, array):
+        self._slots = slots  # memoryview('Q')
+        self._array = array  # NumPy view of the same memory
+
+    def record(self, value):
+        value = int(value)
+        if value < 0:
+            value = 0
+        slots = self._slots
+        slots[0] += 1
+        slots[1] += value
+        if slots[0] == 1 or value < slots[2]:
+            slots[2] = value
+        if value > slots[3]:
+            slots[3] = value
+        slots[_STATS + bucket_index(value)] += 1
+
+    def record_array(self, values):
+        values = np.maximum(np.asarray(values, dtype=np.int64), 0)
+        if not len(values):
+            return
+        # Same index as bucket_index, vectorised (log2 is exact enough below 2**52)
+        bits = np.floor(np.log2(np.maximum(values, 1))).astype(np.int64) + 1
+        shift = np.maximum(bits - SUB_BUCKET_BITS, 0)
+        index = np.minimum(SUB_BUCKET_HALF * shift + (values >> shift), BUCKETS - 1)
+        array = self._array
+        low, high = int(values.min()), int(values.max())
+        array[2] = low if not array[0] else min(int(array[2]), low)
+        array[3] = max(int(array[3]), high)
+        array[0] += len(values)
+        array[1] += int(values.sum())
+        array[_STATS:] += np.bincount(index, minlength=BUCKETS).astype(np.uint64)
+
+    def timer(self):
+        return _Timer(self)
+
+    # -- reading --------------------------------------------------------------
+
+    def snapshot(self):
+        return np.array(self._array, dtype=np.uint64)
+
+    @staticmethod
+    def summarize(data):
+        count = int(data[0])
+        summary = {'count': count, 'sum': int(data[1]), 'min': int(data[2]) if count else 0, 'max': int(data[3])}
+        buckets = data[_STATS:]
+        cumulative = np.cumsum(buckets)
+        for quantile in QUANTILES:
+            if not count:
+                summary[quantile] = 0
+                continue
+            index = int(np.searchsorted(cumulative, quantile * count))
+            summary[quantile] = min(bucket_bounds(min(index, BUCKETS - 1))[1], summary['max'])
+        return summary
+
+
+class _Timer:
+    # `with histogram.timer():` records the time spent in the block
+    __slots__ = ('histogram', 'start')
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.record(time.perf_counter_ns() - self.start)
+        return False
+
+
+class Metrics:
+    """Fixed set of HDR-style histograms in one shared memory block.
+
+    Created once by main_script and passed to (or attached by) the other
+    processes; ``metrics[key]`` returns the histogram for a key such as
+    'step_lateness_x'.
+    """
+
+    def __init__(self, shm, owner=False, buf=None):
+        self._shm = shm
+        self._owner = owner
+        buf = buf if buf is not None else shm.buf
+        self._array = np.ndarray((len(HISTOGRAMS), _SLOTS), dtype=np.uint64, buffer=buf)
+        slots = memoryview(buf).cast('B')[:self._array.nbytes].cast('Q')
+        self._histograms = {}
+        for index, (family, _, label_value) in enumerate(HISTOGRAMS):
+            self._histograms[histogram_key(family, label_value)] = Histogram(
+                slots[index * _SLOTS:(index + 1) * _SLOTS], self._array[index])
+
+    @staticmethod
+    def size():
+        return len(HISTOGRAMS) * _SLOTS * 8
+
+    @classmethod
+    def create(cls, name=METRICS_SHM_NAME):
+        shm = create_block(name, cls.size())
+        shm.buf[:cls.size()] = bytes(cls.size())
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name=METRICS_SHM_NAME):
+        shm = attach_untracked(name)
+        return cls(shm)
+
+    @classmethod
+    def local(cls):
+        # Process-private metrics, for benchmarks and tools without main_script
+        return cls(None, buf=bytearray(cls.size()))
+
+    def __reduce__(self):
+        return (Metrics.attach, (self._shm.name,))
+
+    def __getitem__(self, key):
+        return self._histograms[key]
+
+    def get(self, key):
+        return self._histograms.get(key)
+
+    def summaries(self):
+        data = np.array(self._array)
+        return {histogram_key(family, label_value): Histogram.summarize(data[index])
+                for index, (family, _, label_value) in enumerate(HISTOGRAMS)}
+
+    def close(self):
+        if self._shm is None:
+            return
+        self._histograms = self._array = None
+        if self._owner:
+            release_block(self._shm)
+        else:
+            self._shm.close()
+
+
+def format_table(metrics):
+    lines = [f"{'histogram':<32}{'count':>10}" + ''.join(f"{'p' + format(q * 100, 'g'):>10}" for q in QUANTILES)
+             + f"{'max':>10}   (us)"]
+    for key, summary in metrics.summaries().items():
+        lines.append(f"{key:<32}{summary['count']:>10}" + ''.join(f"{summary[q] / 1000:>10.1f}" for q in QUANTILES)
+                     + f"{summary['max'] / 1000:>10.1f}")
+    return "\n".join(lines) + "\n"
+
+
+def prometheus_text(metrics):
+    # Prometheus text exposition, each histogram as a summary in seconds
+    lines = []
+    summaries = metrics.summaries()
+    for family in dict.fromkeys(family for family, _, _ in HISTOGRAMS):
+        name = f"motion_{family}_seconds"
+        lines.append(f"# HELP {name} {METRIC_HELP[family]}")
+        lines.append(f"# TYPE {name} summary")
+        for hist_family, label_name, label_value in HISTOGRAMS:
+            if hist_family != family:
+                continue
+            summary = summaries[histogram_key(family, label_value)]
+            labels = f'{label_name}="{label_value}"'
+            for quantile in QUANTILES:
+                lines.append(f'{name}{{{labels},quantile="{quantile}"}} {summary[quantile] / 1e9:.9f}')
+            lines.append(f"{name}_sum{{{labels}}} {summary['sum'] / 1e9:.9f}")
+            lines.append(f"{name}_count{{{labels}}} {summary['count']}")
+        lines.append(f"# TYPE motion_{family}_max_seconds gauge")
+        for hist_family, label_name, label_value in HISTOGRAMS:
+            if hist_family == family:
+                summary = summaries[histogram_key(family, label_value)]
+                lines.append(f'motion_{family}_max_seconds{{{label_name}="{label_value}"}} {summary["max"] / 1e9:.9f}')
+    return "\n".join(lines) + "\n"
+
+
+def serve(metrics, port, host='127.0.0.1'):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path not in ('/', '/metrics'):
+                self.send_error(404)
+                return
+            body = prometheus_text(metrics).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer((host, port), Handler)
+    print(f"Serving metrics on http://{host}:{port}/metrics")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Step loop, broker and display timing histograms")
+    parser.add_argument('--name', default=METRICS_SHM_NAME, help="shared memory block of the running system")
+    parser.add_argument('--watch', type=float, metavar='SECONDS', help="print the table every N seconds")
+    parser.add_argument('--prometheus', metavar='FILE', help="write Prometheus text to FILE ('-' for stdout)")
+    parser.add_argument('--http', type=int, metavar='PORT', help="serve Prometheus text on a local HTTP port")
+    args = parser.parse_args(argv)
+
+    try:
+        metrics = Metrics(attach_untracked(args.name))
+    except FileNotFoundError:
+        sys.exit(f"No metrics block '{args.name}', is main_script.py running?")
+
+    if args.http:
+        serve(metrics, args.http)
+    elif args.prometheus:
+        text = prometheus_text(metrics)
+        if args.prometheus == '-':
+            sys.stdout.write(text)
+        else:
+            with open(args.prometheus, 'w') as f:
+                f.write(text)
+    elif args.watch:
+        try:
+            while True:
+                sys.stdout.write(format_table(metrics) + "\n")
+                time.sleep(args.watch)
+        except KeyboardInterrupt:
+            pass
+    else:
+        sys.stdout.write(format_table(metrics))
+
+
+if __name__ == "__main__":
+    main()
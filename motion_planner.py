@@ -0,0 +1,218 @@
+import math
+from collections import deque
+
+import numpy as np
+
+from motion_profiles import SLOW_INTERVAL_US, FAST_INTERVAL_US
+from stepper_motor_control import BLOCK_DURATION_US, BLOCK_MAX_STEPS
+
+# Number of queued segments the planner looks ahead over
+LOOKAHEAD_SEGMENTS = 16
+
+# How far (in steps) the path may deviate from a sharp corner when carrying
+# speed through it, as in Grbl's junction deviation setting
+JUNCTION_DEVIATION = 2.0
+
+
+def line_ticks(dx, dy, start_tick, end_tick):
+    """Step mask of ticks ``start_tick``..``end_tick`` of the line (0, 0) -> (dx, dy).
+
+    Integer DDA: the major axis steps on every tick and the minor axis position
+    after tick k is round(k * |d_minor| / n), so the line ends exactly on
+    (dx, dy) and never strays more than half a step from the ideal line.
+    """
+    n = max(abs(dx), abs(dy))
+    ticks = np.arange(start_tick, end_tick + 1, dtype=np.int64)
+    pos_x = (2 * ticks * abs(dx) + n) // (2 * n)
+    pos_y = (2 * ticks * abs(dy) + n) // (2 * n)
+    return np.column_stack((np.diff(pos_x), np.diff(pos_y))).astype(bool)
+
+
+def speed_from_interval(interval_us):
+    # Steps/s for an interval in the pulse output unit (half the step period)
+    return 1_000_000 / (2 * interval_us)
+
+
+def planner_limits(state):
+    """(acceleration, min_speed, max_speed) from the bounce-mode speed settings.
+
+    The fastest bounce ramp starts at FAST_INTERVAL_US and cruises at half that
+    interval, reached over ACCELERATION_BUFFER steps; that ramp is the
+    acceleration limit and its cruise speed the top speed. ``min_speed`` is
+    the slowest bounce speed (SLOW_INTERVAL_US), the speed the planner stops,
+    starts and reverses at. It only bounds the ramps, a slower feed is run as
+    commanded.
+    """
+    ramp_steps = max(int(state.get('ACCELERATION_BUFFER', 20)), 1)
+    fast_interval = state.get('FAST_INTERVAL_US', FAST_INTERVAL_US)
+    start_speed = speed_from_interval(fast_interval)
+    max_speed = speed_from_interval(fast_interval / 2)
+    min_speed = min(speed_from_interval(state.get('SLOW_INTERVAL_US', SLOW_INTERVAL_US)), start_speed)
+    acceleration = (max_speed * max_speed - start_speed * start_speed) / (2 * ramp_steps)
+    return acceleration, min_speed, max_speed
+
+
+def movement_window(state):
+    # ((x_low, x_high), (y_low, y_high)) inside the MOVEMENT_BUFFER_* limits
+    return (
+        (state.get('MOVEMENT_BUFFER_LEFT', 0), state.get('total_steps_x', 0) - state.get('MOVEMENT_BUFFER_RIGHT', 0)),
+        (state.get('MOVEMENT_BUFFER_BOTTOM', 0), state.get('total_steps_y', 0) - state.get('MOVEMENT_BUFFER_TOP', 0)),
+    )
+
+
+class PlannerBlock:
+    """One straight X/Y segment with its planned entry, cruise and exit speeds.
+
+    ``next_block`` hands out step masks and intervals in the same form as
+    coordinated_motion.LineSegment, following a trapezoid between the entry
+    and exit speeds.
+    """
+
+    def __init__(self, dx, dy, nominal_speed, acceleration, min_speed):
+        self.dx = dx
+        self.dy = dy
+        self.ticks = max(abs(dx), abs(dy))
+        self.length = math.hypot(dx, dy)
+        self.unit = (dx / self.length, dy / self.length)
+        self.tick_length = self.length / self.ticks
+        self.nominal_speed = nominal_speed
+        self.acceleration = acceleration
+        # Stop speed of this block, never above its feed
+        min_speed = min(min_speed, nominal_speed)
+        self.min_speed = min_speed
+        self.max_entry_speed = min_speed
+        self.entry_speed = min_speed
+        self.exit_speed = min_speed
+        self.sign_x = 1 if dx >= 0 else -1
+        self.sign_y = 1 if dy >= 0 else -1
+        self.done = 0
+        self.last_interval = 0
+
+    @property
+    def finished(self):
+        return self.done >= self.ticks
+
+    def tick_intervals(self, start, end):
+        # Interval of ticks start..end-1 from the speed at the middle of each tick
+        distance = (np.arange(start, end, dtype=np.float64) + 0.5) * self.tick_length
+        accelerating = np.sqrt(self.entry_speed ** 2 + 2 * self.acceleration * distance)
+        decelerating = np.sqrt(self.exit_speed ** 2 + 2 * self.acceleration * (self.length - distance))
+        speed = np.maximum(np.minimum(np.minimum(accelerating, decelerating), self.nominal_speed), self.min_speed)
+        return np.maximum(np.rint(self.tick_length / speed * 1_000_000 / 2), 1).astype(np.int64)
+
+    def duration_us(self):
+        return int(self.tick_intervals(0, self.ticks).sum()) * 2
+
+    def axis_interval(self, delta):
+        return self.last_interval * self.ticks // abs(delta) if delta else 0
+
+    def next_block(self, max_duration_us=BLOCK_DURATION_US, max_ticks=BLOCK_MAX_STEPS):
+        end = min(self.ticks, self.done + max_ticks)
+        intervals = self.tick_intervals(self.done, end)
+        count = int(np.searchsorted(np.cumsum(intervals) * 2, max_duration_us)) + 1
+        intervals = intervals[:count]
+        mask = line_ticks(self.dx, self.dy, self.done, self.done + len(intervals))
+        self.done += len(intervals)
+        self.last_interval = int(intervals[-1])
+        moved = mask.sum(axis=0)
+        return mask, intervals, int(moved[0]) * self.sign_x, int(moved[1]) * self.sign_y
+
+
+class MotionPlanner:
+    """Look-ahead queue of straight segments with Grbl-style junction speeds.
+
+    Every ``add_line`` recomputes entry speeds with a backward pass (each block
+    must be able to slow down to the next block's entry, and the last block to
+    a stop) and a forward pass (each block can only reach what its predecessor
+    allows). Targets are clamped into ``window`` so the planned path never
+    leaves the MOVEMENT_BUFFER_* limits. Feeds are capped at ``max_speed`` and
+    never raised, ``min_speed`` only bounds how slow a junction or stop gets.
+    """
+
+    def __init__(self, acceleration, min_speed, max_speed, window, position=(0, 0),
+                 lookahead=LOOKAHEAD_SEGMENTS, junction_deviation=JUNCTION_DEVIATION):
+        self.acceleration = acceleration
+        self.min_speed = min_speed
+        self.max_speed = max_speed
+        self.window = window
+        self.position = list(position)  # End of the last queued segment
+        self.lookahead = lookahead
+        self.junction_deviation = junction_deviation
+        self.queue = deque()
+        self.current_speed = min_speed  # Exit speed of the last block handed out
+        self.previous_block = None  # Last block handed out, for the next junction
+
+    @classmethod
+    def from_state(cls, state, position, **kwargs):
+        acceleration, min_speed, max_speed = planner_limits(state)
+        return cls(acceleration, min_speed, max_speed, movement_window(state), position, **kwargs)
+
+    def __len__(self):
+        return len(self.queue)
+
+    @property
+    def full(self):
+        return len(self.queue) >= self.lookahead
+
+    def clamp(self, x, y):
+        (x_low, x_high), (y_low, y_high) = self.window
+        return max(x_low, min(x_high, int(round(x)))), max(y_low, min(y_high, int(round(y))))
+
+    def junction_speed(self, previous, block):
+        if previous is None or self.lookahead <= 1:
+            return block.min_speed
+        cos_theta = -(previous.unit[0] * block.unit[0] + previous.unit[1] * block.unit[1])
+        if cos_theta > 0.999999:
+            # Full reversal
+            return block.min_speed
+        if cos_theta < -0.999999:
+            # Straight continuation
+            speed = math.inf
+        else:
+            sin_half = math.sqrt(0.5 * (1.0 - cos_theta))
+            speed = math.sqrt(self.acceleration * self.junction_deviation * sin_half / (1.0 - sin_half))
+        return min(max(self.min_speed, speed), previous.nominal_speed, block.nominal_speed)
+
+    def add_line(self, x, y, feed):
+        x, y = self.clamp(x, y)
+        dx = x - self.position[0]
+        dy = y - self.position[1]
+        if dx == 0 and dy == 0:
+            return None
+        if not feed > 0:
+            raise ValueError(f"Feed must be positive, not {feed!r}")
+        feed = min(self.max_speed, feed)
+        block = PlannerBlock(dx, dy, feed, self.acceleration, self.min_speed)
+        previous = self.queue[-1] if self.queue else self.previous_block
+        block.max_entry_speed = self.junction_speed(previous, block)
+        self.queue.append(block)
+        self.position = [x, y]
+        self.recalculate()
+        return block
+
+    def recalculate(self):
+        blocks = self.queue
+        if not blocks:
+            return
+        acceleration2 = 2 * self.acceleration
+        # Backward pass, the queue has to be able to stop at its end
+        next_entry = self.min_speed
+        for block in reversed(blocks):
+            block.entry_speed = min(block.max_entry_speed, math.sqrt(next_entry ** 2 + acceleration2 * block.length))
+            next_entry = block.entry_speed
+        # Forward pass, the first block starts at the speed the executor is at
+        blocks[0].entry_speed = min(self.current_speed, blocks[0].max_entry_speed)
+        for previous, block in zip(blocks, list(blocks)[1:]):
+            block.entry_speed = min(block.entry_speed,
+                                    math.sqrt(previous.entry_speed ** 2 + acceleration2 * previous.length))
+        for block, following in zip(blocks, list(blocks)[1:]):
+            block.exit_speed = following.entry_speed
+        blocks[-1].exit_speed = blocks[-1].min_speed
+
+    def pop(self):
+        # Hand the first block to the executor. Its exit speed is fixed from here
+        # on, later blocks can only raise the speeds behind it.
+        block = self.queue.popleft()
+        self.current_speed = block.exit_speed
+        self.previous_block = block
+        return block
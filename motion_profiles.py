@@ -0,0 +1,121 @@
+import math
+import logging
+from collections import OrderedDict
+
+import numpy as np
+
+# Default pot dead zone and the step interval range (in us) the pot maps to,
+# same as the original map_value(pot_value, 300, 65535, 500000, 250) call.
+# The range and curve in use come from the config store, through speed_map.
+POT_MIN = 300
+SLOW_INTERVAL_US = 500000
+FAST_INTERVAL_US = 250
+
+PROFILE_SHAPES = ('trapezoid', 'scurve')
+
+# Base intervals are rounded to this many buckets per doubling of the speed
+# (about 2% apart) before they key the profile cache, so pot jitter reuses
+# the profile of its bucket instead of building a new one
+INTERVAL_BUCKETS_PER_OCTAVE = 32
+
+
+def _ramp_fraction(position, ramp_steps, shape):
+    # 0..1 progress of the speed ramp for each position into the ramp
+    u = np.clip(position / ramp_steps, 0.0, 1.0)
+    if shape == 'scurve':
+        # Smootherstep: acceleration and jerk are zero at both ends of the ramp
+        return u * u * u * (u * (u * 6.0 - 15.0) + 10.0)
+    return u
+
+
+def interval_bucket(base_interval):
+    # Interval (us) at the slow edge of the bucket ``base_interval`` falls in,
+    # so rounding never makes a step faster than the speed map asked for
+    bucket = math.ceil(math.log2(max(base_interval, 1)) * INTERVAL_BUCKETS_PER_OCTAVE - 1e-9)
+    return max(round(2 ** (bucket / INTERVAL_BUCKETS_PER_OCTAVE)), 1)
+
+
+def build_profile(travel, base_interval, cruise_interval, ramp_steps, shape='trapezoid'):
+    """Step intervals (us, int64) for every position of a segment of ``travel`` steps.
+
+    The profile is symmetric, so index ``i`` is the distance from either end
+    of the segment and the same array serves both directions.
+    """
+    if shape not in PROFILE_SHAPES:
+        raise ValueError(f"Invalid profile shape {shape!r}. Use one of {PROFILE_SHAPES}.")
+    length = max(int(travel), 0) + 1
+    position = np.arange(length, dtype=np.float64)
+    distance_to_end = np.minimum(position, position[::-1])
+
+    v_start = 1.0 / base_interval
+    v_cruise = 1.0 / cruise_interval
+    ramp_steps = max(int(ramp_steps), 1)
+    ramp = _ramp_fraction(distance_to_end, ramp_steps, shape)
+
+    if shape == 'trapezoid':
+        # Constant acceleration: v^2 grows linearly with distance
+        velocity = np.sqrt(v_start * v_start + (v_cruise * v_cruise - v_start * v_start) * ramp)
+    else:
+        velocity = v_start + (v_cruise - v_start) * ramp
+
+    intervals = np.rint(1.0 / velocity).astype(np.int64)
+    intervals.setflags(write=False)
+    return intervals
+
+
+class ProfileCache:
+    """LRU cache of step interval profiles for bounce segments.
+
+    Entries are keyed on (travel, buffer limits, base interval bucket, ramp
+    length, shape); the base interval comes from the speed map and is
+    rounded with ``interval_bucket``, so only pot moves that change the speed
+    by a bucket build a new profile.
+    ``check_version`` drops everything whenever the config store publishes a
+    new version, which also covers a change of the interval range.
+    """
+
+    def __init__(self, maxsize=32, shape='trapezoid'):
+        self.maxsize = maxsize
+        self.shape = shape
+        self.buffer_version = None
+        self.hits = 0
+        self.misses = 0
+        self._profiles = OrderedDict()
+
+    def check_version(self, buffer_version):
+        if buffer_version != self.buffer_version:
+            if self._profiles:
+                logging.debug(f"Buffer version {self.buffer_version} -> {buffer_version}, dropping {len(self._profiles)} profiles")
+            self.invalidate()
+            self.buffer_version = buffer_version
+
+    def invalidate(self):
+        self._profiles.clear()
+
+    def get(self, total_steps, buffer_low, buffer_high, base_interval, ramp_steps):
+        # ``base_interval`` is the start/stop interval (us) the pot selects
+        travel = max(total_steps - buffer_high - buffer_low, 0)
+        base_interval = interval_bucket(base_interval)
+        key = (travel, buffer_low, buffer_high, base_interval, ramp_steps, self.shape)
+        profile = self._profiles.get(key)
+        if profile is not None:
+            self._profiles.move_to_end(key)
+            self.hits += 1
+            return profile
+
+        self.misses += 1
+        profile = build_profile(travel, base_interval, base_interval / 2, ramp_steps, self.shape)
+        self._profiles[key] = profile
+        if len(self._profiles) > self.maxsize:
+            self._profiles.popitem(last=False)
+        return profile
+
+    def __len__(self):
+        return len(self._profiles)
+
+
+if __name__ == "__main__":
+    cache = ProfileCache(shape='scurve')
+    profile = cache.get(1000, 100, 200, 2000, 20)
+    print(f"{len(profile)} positions, first {profile[:25].tolist()}")
+    print(f"cruise interval {profile[len(profile) // 2]} us")
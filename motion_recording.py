@@ -0,0 +1,285 @@
+import os
+import sys
+import glob
+import mmap
+import time
+import argparse
+
+import numpy as np
+
+from step_trace import step_times
+
+# Records per block. A block stores each column contiguously, so a reader
+# gets one array per column and block without touching the other columns.
+BLOCK_RECORDS = 1 << 16
+
+# Blocks the file grows by at a time; the writer maps each extent once
+EXTENT_BLOCKS = 8
+
+# Replay reproduces a gap between two steps as a pause once it is this much
+# longer than the step interval before it (ns)
+PAUSE_THRESHOLD_NS = 2_000_000
+
+_MAGIC = b'MOTREC01'
+_MAX_AXES = 4
+_HEADER = np.dtype([
+    ('magic', 'S8'),
+    ('block_records', '<u8'),
+    ('records', '<u8'),
+    ('axes', 'S8', (_MAX_AXES,)),
+    ('reserved', '<u8'),
+])
+
+# Columns of a recording: scheduled time of the step (time.monotonic_ns
+# clock), axis position after the step, the step's half-period interval in
+# us, axis index into the header's axes and direction (+1/-1)
+COLUMNS = (
+    ('time_ns', '<i8'),
+    ('position', '<i8'),
+    ('interval_us', '<u4'),
+    ('axis', 'u1'),
+    ('direction', 'i1'),
+)
+
+
+def _block_dtype(block_records):
+    return np.dtype([(name, dtype, (block_records,)) for name, dtype in COLUMNS])
+
+
+def recording_path(directory, motors):
+    # New recording of ``motors``, named after the time it starts so that it
+    # never replaces an older one
+    stem = os.path.join(directory, f"motion-{''.join(motors)}-{time.strftime('%Y%m%d-%H%M%S')}")
+    path, copy = f"{stem}.rec", 1
+    while os.path.exists(path):
+        copy += 1
+        path = f"{stem}-{copy}.rec"
+    return path
+
+
+def find_recording(directory, motor):
+    # Latest recording of ``motor`` in ``directory``: its own (bounce mode) or
+    # the one of both axes (coordinated mode)
+    for motors in (motor, "XY"):
+        paths = glob.glob(os.path.join(directory, f"motion-{motors}-*.rec"))
+        paths += glob.glob(os.path.join(directory, f"motion-{motors}.rec"))
+        if paths:
+            return max(paths, key=os.path.getmtime)
+    return None
+
+
+class MotionRecorder:
+    """Appends every step a motion process makes to a columnar recording file.
+
+    Same ``record``/``record_ticks`` calls as StepTrace. The file grows by
+    EXTENT_BLOCKS blocks at a time and each extent is written through one
+    NumPy memmap, so a block of steps costs a few slice assignments and no
+    system call. The record count in the header is updated after every
+    append, a recording cut short by a crash is readable up to there. An
+    existing file is never overwritten, it may be the one being replayed.
+    """
+
+    def __init__(self, path, axes=("X", "Y"), block_records=BLOCK_RECORDS):
+        if len(axes) > _MAX_AXES:
+            raise ValueError(f"At most {_MAX_AXES} axes per recording")
+        self.path = path
+        self.axes = tuple(axes)
+        self.block_records = block_records
+        self._block_dtype = _block_dtype(block_records)
+        self._index = {axis: i for i, axis in enumerate(self.axes)}
+        with open(path, 'xb') as f:
+            f.write(bytes(_HEADER.itemsize))
+        self._header = np.memmap(path, dtype=_HEADER, mode='r+', shape=())
+        self._header['magic'] = _MAGIC
+        self._header['block_records'] = block_records
+        self._header['axes'] = [axis.encode() for axis in self.axes] + [b''] * (_MAX_AXES - len(self.axes))
+        self.records = 0
+        self._extent = None
+        self._extent_start = 0  # Index of the extent's first block
+
+    def _block(self, number):
+        # (extent, index) of block ``number``, mapping the next extent when needed
+        if self._extent is None or number >= self._extent_start + EXTENT_BLOCKS:
+            if self._extent is not None:
+                self._extent.flush()
+            self._extent_start = number
+            end = _HEADER.itemsize + (number + EXTENT_BLOCKS) * self._block_dtype.itemsize
+            with open(self.path, 'r+b') as f:
+                f.truncate(end)
+            self._extent = np.memmap(self.path, dtype=self._block_dtype, mode='r+', shape=(EXTENT_BLOCKS,),
+                                     offset=_HEADER.itemsize + number * self._block_dtype.itemsize)
+        return self._extent, number - self._extent_start
+
+    def record(self, axis, start_ns, intervals, start_position, direction):
+        count = len(intervals)
+        if not count:
+            return
+        times = step_times(start_ns, intervals)
+        positions = start_position + direction * np.arange(1, count + 1, dtype=np.int64)
+        self._append(self._index[axis], times, positions, np.asarray(intervals), direction)
+
+    def record_ticks(self, start_ns, mask, intervals, axes):
+        tick_times = step_times(start_ns, intervals)
+        for column, (axis, start_position, direction) in enumerate(axes):
+            ticks = np.flatnonzero(mask[:, column])
+            if not len(ticks):
+                continue
+            positions = start_position + direction * np.arange(1, len(ticks) + 1, dtype=np.int64)
+            self._append(self._index[axis], tick_times[ticks], positions, np.asarray(intervals)[ticks], direction)
+
+    def _append(self, axis, times, positions, intervals, direction):
+        done = 0
+        while done < len(times):
+            number, offset = divmod(self.records, self.block_records)
+            extent, index = self._block(number)
+            count = min(len(times) - done, self.block_records - offset)
+            end = offset + count
+            extent['time_ns'][index, offset:end] = times[done:done + count]
+            extent['position'][index, offset:end] = positions[done:done + count]
+            extent['interval_us'][index, offset:end] = intervals[done:done + count]
+            extent['axis'][index, offset:end] = axis
+            extent['direction'][index, offset:end] = direction
+            done += count
+            self.records += count
+        # Published after the records are in place
+        self._header['records'] = self.records
+
+    def close(self):
+        if self._header is None:
+            return
+        if self._extent is not None:
+            self._extent.flush()
+        self._header.flush()
+        self._extent = self._header = None
+        # Drop the unused blocks of the last extent
+        blocks = -(-self.records // self.block_records)
+        with open(self.path, 'r+b') as f:
+            f.truncate(_HEADER.itemsize + blocks * self._block_dtype.itemsize)
+
+
+class MotionRecording:
+    """Read side of a recording, straight from a read-only mapping of the file.
+
+    ``blocks`` hands out column views one block at a time and tells the
+    kernel to drop each block's pages once the caller moves on, so a trace
+    of any length is read with a few MB of memory.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+        if self._map is None or size < _HEADER.itemsize:
+            raise ValueError(f"{path} is not a motion recording")
+        header = np.frombuffer(self._map, dtype=_HEADER, count=1)[0]
+        if header['magic'] != _MAGIC:
+            raise ValueError(f"{path} is not a motion recording")
+        self.block_records = int(header['block_records'])
+        self.records = int(header['records'])
+        self.axes = tuple(axis.decode() for axis in header['axes'] if axis)
+        self._block_dtype = _block_dtype(self.block_records)
+        available = (size - _HEADER.itemsize) // self._block_dtype.itemsize
+        self.records = min(self.records, available * self.block_records)
+        self._blocks = np.frombuffer(self._map, dtype=self._block_dtype, count=available, offset=_HEADER.itemsize)
+        if hasattr(self._map, 'madvise'):
+            self._map.madvise(mmap.MADV_SEQUENTIAL)
+
+    def __len__(self):
+        return self.records
+
+    def blocks(self, axis=None):
+        # Dict of column arrays per block, only the steps of ``axis`` if given
+        index = self.axes.index(axis) if axis is not None else None
+        for number in range((self.records + self.block_records - 1) // self.block_records):
+            count = min(self.block_records, self.records - number * self.block_records)
+            columns = {name: self._blocks[name][number, :count] for name, _ in COLUMNS}
+            if index is not None:
+                selected = columns['axis'] == index
+                columns = {name: values[selected] for name, values in columns.items()}
+            yield columns
+            self._release(number)
+
+    def _release(self, number):
+        if not hasattr(self._map, 'madvise'):
+            return
+        start = _HEADER.itemsize + number * self._block_dtype.itemsize
+        end = start + self._block_dtype.itemsize
+        start -= start % mmap.PAGESIZE
+        end -= end % mmap.PAGESIZE
+        if end > start:
+            self._map.madvise(mmap.MADV_DONTNEED, start, end - start)
+
+    def close(self):
+        self._blocks = None
+        try:
+            self._map.close()
+        except BufferError:
+            pass  # A caller still holds a block, the mapping goes with it
+
+
+class TraceSinks:
+    """Hands every ``record``/``record_ticks`` call to several traces."""
+
+    def __init__(self, *sinks):
+        self.sinks = [sink for sink in sinks if sink is not None]
+
+    def record(self, *args):
+        for sink in self.sinks:
+            sink.record(*args)
+
+    def record_ticks(self, *args):
+        for sink in self.sinks:
+            sink.record_ticks(*args)
+
+
+def summary(recording, out=sys.stdout):
+    out.write(f"{recording.path}: {len(recording)} steps in blocks of {recording.block_records}\n")
+    for axis in recording.axes:
+        steps = 0
+        first = last = None
+        low, high = None, None
+        for columns in recording.blocks(axis):
+            if not len(columns['time_ns']):
+                continue
+            steps += len(columns['time_ns'])
+            first = columns['time_ns'][0] if first is None else first
+            last = columns['time_ns'][-1]
+            low = min(columns['position'].min(), low if low is not None else columns['position'].min())
+            high = max(columns['position'].max(), high if high is not None else columns['position'].max())
+        if not steps:
+            out.write(f"{axis}: no steps\n")
+            continue
+        out.write(f"{axis}: {steps} steps, {(last - first) / 1e9:.3f} s, position {low}..{high}\n")
+
+
+def decode(recording, out=sys.stdout, limit=None):
+    # CSV in recorded order
+    out.write("time_ns,axis,position,interval_us,direction\n")
+    written = 0
+    for columns in recording.blocks():
+        for time_ns, axis, position, interval, direction in zip(
+                columns['time_ns'].tolist(), columns['axis'].tolist(), columns['position'].tolist(),
+                columns['interval_us'].tolist(), columns['direction'].tolist()):
+            if limit is not None and written >= limit:
+                return
+            out.write(f"{time_ns},{recording.axes[axis]},{position},{interval},{direction}\n")
+            written += 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect a motion recording")
+    commands = parser.add_subparsers(dest='command', required=True)
+    for command in ('summary', 'decode'):
+        sub = commands.add_parser(command)
+        sub.add_argument('path')
+        if command == 'decode':
+            sub.add_argument('--limit', type=int, help="first N steps")
+    args = parser.parse_args()
+
+    recording = MotionRecording(args.path)
+    if args.command == 'summary':
+        summary(recording)
+    else:
+        decode(recording, limit=args.limit)
+    recording.close()
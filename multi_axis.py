@@ -0,0 +1,194 @@
+import heapq
+import time
+import logging
+
+from axes import AXES
+import calibration_cache
+from axis_state import AxisState
+from config_store import ConfigStore
+from hardware import gpio
+from motion_recording import MotionRecorder, TraceSinks
+from pulse_output import GPIOPulseOutput, create_pulse_output
+from speed_map import SpeedMap
+from step_scheduler import StepScheduler
+from stepper_motor_control import BounceAxis, axis_settings, calibrate_axis, init_axis_hardware, PULSE_BACKEND
+
+logger = logging.getLogger(__name__)
+
+# An axis with nothing to do is asked for its next block this often (ns)
+IDLE_POLL_NS = 10_000_000
+
+# Edge an axis waits for
+_RISE, _FALL = 0, 1
+
+
+class AxisChannel:
+    """Step and direction pins of one axis and where it is in its current block."""
+
+    def __init__(self, dir_pin, step_pin, driver):
+        self.dir_pin = dir_pin
+        self.step_pin = step_pin
+        self.driver = driver
+        self.intervals = None
+        self.index = 0
+        self.edge = _RISE
+        self.stop = None
+        self.lateness_histogram = None
+
+
+class DeadlineScheduler:
+    """Drives any number of axes from one thread on one heap of edge deadlines.
+
+    Each axis has one entry in a min-heap, the deadline (perf_counter_ns) of
+    its next STEP edge. The loop waits for the earliest one with a
+    StepScheduler, then makes every edge that is due: falling edges first,
+    rising edges second, each as one ``output`` call over a list of pins, and
+    pushes every axis back with its next deadline. The cost per edge is a heap
+    pop and push, so the step rate of the process is shared by the axes
+    instead of each axis needing a process and a core of its own.
+
+    A driver is anything with BounceAxis' ``next_block``/``block_done``. A
+    rising edge checks the block's stop flag first, so a tripped switch ends
+    the block within one step like in the pulse outputs. Drivers that block
+    (homing, trip recovery) hold up every axis; the timeline is re-anchored
+    afterwards instead of catching up.
+    """
+
+    def __init__(self, output=None, scheduler=None):
+        GPIO = gpio() if output is None else None
+        self.output = output or GPIO.output
+        self.scheduler = scheduler or StepScheduler()
+        self.channels = []
+        self._heap = []
+        self._running = False
+        self.steps = 0
+
+    def add(self, dir_pin, step_pin, driver):
+        channel = AxisChannel(dir_pin, step_pin, driver)
+        self.channels.append(channel)
+        # Index breaks deadline ties, channels themselves are not comparable
+        heapq.heappush(self._heap, (time.perf_counter_ns(), len(self.channels) - 1))
+        return channel
+
+    def stop(self):
+        self._running = False
+
+    def run(self, until_ns=None):
+        # Until ``stop`` or until perf_counter_ns reaches ``until_ns``
+        heap, channels, output = self._heap, self.channels, self.output
+        wait_until_ns = self.scheduler.wait_until_ns
+        resync_ns = self.scheduler.resync_ns
+        rising, falling, due = [], [], []
+        self._running = True
+        while self._running and heap:
+            deadline = heap[0][0]
+            if until_ns is not None and deadline >= until_ns:
+                break
+            lateness = wait_until_ns(deadline)
+            now = deadline + lateness
+            while heap and heap[0][0] <= now:
+                due.append(heapq.heappop(heap))
+            for edge_deadline, index in due:
+                channel = channels[index]
+                if channel.lateness_histogram is not None:
+                    channel.lateness_histogram.record(now - edge_deadline)
+                # Far behind, as after a blocking driver: start a new timeline
+                base = now if now - edge_deadline > resync_ns else edge_deadline
+                if channel.edge == _FALL:
+                    falling.append(channel.step_pin)
+                    channel.edge = _RISE
+                    interval = channel.intervals[channel.index]
+                    channel.index += 1
+                    heapq.heappush(heap, (base + interval * 1000, index))
+                    continue
+                intervals = channel.intervals
+                if intervals is None or channel.index >= len(intervals) or channel.stop[0]:
+                    if not self._next_block(channel):
+                        heapq.heappush(heap, (time.perf_counter_ns() + IDLE_POLL_NS, index))
+                        continue
+                    planned = time.perf_counter_ns()
+                    if planned - base > resync_ns:
+                        base = planned
+                rising.append(channel.step_pin)
+                channel.edge = _FALL
+                heapq.heappush(heap, (base + channel.intervals[channel.index] * 1000, index))
+            due.clear()
+            if falling:
+                output(falling, 0)
+                falling.clear()
+            if rising:
+                output(rising, 1)
+                self.steps += len(rising)
+                rising.clear()
+
+    def _next_block(self, channel):
+        # Report the finished block and load the next one, False while the axis holds still
+        if channel.intervals is not None:
+            channel.driver.block_done(channel.index)
+            channel.intervals = None
+        block = channel.driver.next_block()
+        if block is None:
+            return False
+        direction, intervals, stop = block
+        self.output(channel.dir_pin, 1 if direction[0] else 0)
+        channel.intervals = intervals.tolist() if hasattr(intervals, 'tolist') else list(intervals)
+        channel.index = 0
+        channel.stop = stop
+        return True
+
+
+def multi_axis_process(shared_data, calibration_event, all_done_event, pulse_backend=PULSE_BACKEND, step_trace=None,
+                       metrics=None, config=None, commands=None, record_path=None, speed_map=None, axes=None):
+    # Bounce mode for every axis in ``axes`` (all of axes.AXES by default) from
+    # this one process. ``commands`` maps each motor to its command Queue.
+    # Homing and trip recovery still move one axis at a time and stop the others.
+    axes = tuple(axes or AXES)
+    config_store = config if config is not None else ConfigStore.local()
+    speed_map = speed_map if speed_map is not None else SpeedMap.local(config_store.current())
+    commands = commands or {}
+    recorder = MotionRecorder(record_path, axes=axes) if record_path else None
+    if recorder is not None:
+        step_trace = TraceSinks(step_trace, recorder)
+    settings = {motor: axis_settings(motor) for motor in axes}
+    spin_threshold_us = min(settings[motor]['spin_threshold_us'] for motor in axes)
+    pulse_output = create_pulse_output(pulse_backend, spin_threshold_us=spin_threshold_us)
+    if not isinstance(pulse_output, GPIOPulseOutput):
+        pulse_output.close()
+        raise ValueError(f"Multi-axis mode drives the pins itself, it needs the gpio pulse backend, "
+                         f"not {pulse_backend!r}")
+    limits = {motor: init_axis_hardware(motor, on_trip=pulse_output.halt) for motor in axes}
+    scheduler = DeadlineScheduler(pulse_output.GPIO.output, StepScheduler(spin_threshold_us))
+
+    try:
+        axis_states = {}
+        for motor in axes:
+            axis_states[motor] = AxisState(motor, shared_data, commands.get(motor))
+            total_steps = calibrate_axis(motor, shared_data, pulse_output, limits[motor],
+                                         config=config_store.current())
+            axis_states[motor].reset(total_steps // 2, total_steps)
+            shared_data[f'calibrating_{motor.lower()}'] = False
+        calibration_event.set()
+        all_done_event.wait()
+
+        for motor in axes:
+            state_access = metrics.get(f'state_access_motor_{motor.lower()}') if metrics is not None else None
+            bounce = BounceAxis(motor, shared_data, axis_states[motor], pulse_output, limits[motor], config_store,
+                                speed_map, step_trace, state_access)
+            channel = scheduler.add(settings[motor]['dir_pin'], settings[motor]['step_pin'], bounce)
+            if metrics is not None:
+                channel.lateness_histogram = metrics.get(f'step_lateness_{motor.lower()}')
+        logger.info(f"Driving {', '.join(axes)} from one process")
+        scheduler.run()
+
+    except KeyboardInterrupt:
+        logger.info("Multi-axis motion process interrupted")
+    except Exception as e:
+        logger.error(f"Error in multi_axis_process: {e}")
+    finally:
+        logger.info(f"Step lateness: {scheduler.scheduler.stats()}")
+        for motor in axes:
+            limits[motor].close()
+        pulse_output.close()
+        if recorder is not None:
+            recorder.close()
+        calibration_cache.flush()
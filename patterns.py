@@ -0,0 +1,171 @@
+import math
+import queue
+import logging
+import threading
+
+import numpy as np
+
+# Patterns are produced as endless streams of (N, 2) float chunks in
+# normalised coordinates (-1..1 on both axes) and only scaled to steps when
+# they are consumed, so a live buffer change reshapes the pattern right away.
+CHUNK_SIZE = 256
+
+# Chunks generated ahead of the step loop
+PREFETCH_CHUNKS = 4
+
+# Curve resolution: points per full turn of the parameter
+POINTS_PER_TURN = 360
+
+# Pattern selected by the `mode` value from data_broker, 0 keeps bounce mode.
+# `mode2` is the pattern variant (frequency ratio, turns, rows, petals...).
+PATTERN_MODES = {
+    1: 'lissajous',
+    2: 'spiral',
+    3: 'raster',
+    4: 'zigzag',
+    5: 'rose',
+}
+
+
+def _parametric(curve, period, points_per_period, chunk_size):
+    # Sample curve(t) in chunks. t is wrapped at the period so it never loses
+    # precision however long the pattern runs.
+    step = period / points_per_period
+    offsets = np.arange(chunk_size, dtype=np.float64) * step
+    t0 = 0.0
+    while True:
+        yield curve(t0 + offsets)
+        t0 = (t0 + chunk_size * step) % period
+
+
+def _vertices(corners, chunk_size):
+    # Repeat a closed list of corner points forever, in chunks
+    corners = np.asarray(corners, dtype=np.float64)
+    index = np.arange(chunk_size)
+    start = 0
+    while True:
+        yield corners[(start + index) % len(corners)]
+        start = (start + chunk_size) % len(corners)
+
+
+def lissajous(variant, chunk_size=CHUNK_SIZE):
+    a, b = variant + 1, max(variant, 1)
+
+    def curve(t):
+        return np.column_stack((np.sin(a * t + math.pi / 2), np.sin(b * t)))
+    return _parametric(curve, 2 * math.pi, POINTS_PER_TURN * max(a, b), chunk_size)
+
+
+def spiral(variant, chunk_size=CHUNK_SIZE):
+    # Spiral out over ``turns`` turns and back in again
+    turns = 3 + max(variant, 1)
+
+    def curve(t):
+        radius = 1.0 - np.abs(1.0 - t)
+        angle = 2 * math.pi * turns * t
+        return np.column_stack((radius * np.cos(angle), radius * np.sin(angle)))
+    return _parametric(curve, 2.0, 2 * turns * POINTS_PER_TURN, chunk_size)
+
+
+def raster(variant, chunk_size=CHUNK_SIZE):
+    # Horizontal lines, alternating direction, down the window and back up
+    rows = 2 + 2 * max(variant, 1)
+    corners = []
+    for row in list(range(rows)) + list(range(rows - 2, 0, -1)):
+        y = 1.0 - 2.0 * row / (rows - 1)
+        left_to_right = len(corners) // 2 % 2 == 0
+        corners.extend([(-1.0, y), (1.0, y)] if left_to_right else [(1.0, y), (-1.0, y)])
+    return _vertices(corners, chunk_size)
+
+
+def zigzag(variant, chunk_size=CHUNK_SIZE):
+    # Teeth between the bottom and top edge, across the window and back
+    teeth = 4 * max(variant, 1)
+    forward = [(-1.0 + 2.0 * i / teeth, 1.0 if i % 2 else -1.0) for i in range(teeth + 1)]
+    return _vertices(forward + forward[-2:0:-1], chunk_size)
+
+
+def rose(variant, chunk_size=CHUNK_SIZE):
+    k = variant + 1
+
+    def curve(t):
+        radius = np.cos(k * t)
+        return np.column_stack((radius * np.cos(t), radius * np.sin(t)))
+    return _parametric(curve, 2 * math.pi, POINTS_PER_TURN * k, chunk_size)
+
+
+PATTERNS = {
+    'lissajous': lissajous,
+    'spiral': spiral,
+    'raster': raster,
+    'zigzag': zigzag,
+    'rose': rose,
+}
+
+
+def make_pattern(name, variant=1, chunk_size=CHUNK_SIZE):
+    try:
+        return PATTERNS[name](int(variant), chunk_size)
+    except KeyError:
+        raise ValueError(f"Invalid pattern {name!r}. Use one of {sorted(PATTERNS)}.")
+
+
+def scale_to_window(chunk, window):
+    # Normalised chunk -> integer step targets inside ((x_low, x_high), (y_low, y_high))
+    (x_low, x_high), (y_low, y_high) = window
+    scale = np.array([(x_high - x_low) / 2.0, (y_high - y_low) / 2.0])
+    centre = np.array([(x_high + x_low) / 2.0, (y_high + y_low) / 2.0])
+    return np.rint(chunk * scale + centre).astype(np.int64)
+
+
+class PatternStreamer:
+    """Generates pattern chunks on a background thread, ahead of the step loop.
+
+    The prefetch queue is bounded, so memory use stays flat however long the
+    pattern runs. ``underruns`` counts the times the consumer had to wait.
+    """
+
+    def __init__(self, name, variant=1, chunk_size=CHUNK_SIZE, prefetch=PREFETCH_CHUNKS):
+        self.name = name
+        self.variant = variant
+        self._generator = make_pattern(name, variant, chunk_size)
+        self._chunks = queue.Queue(maxsize=prefetch)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._produce, name=f"pattern-{name}", daemon=True)
+        self.underruns = 0
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _produce(self):
+        for chunk in self._generator:
+            while not self._stop.is_set():
+                try:
+                    self._chunks.put(chunk, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+            if self._stop.is_set():
+                return
+
+    def next_chunk(self, timeout=1.0):
+        try:
+            return self._chunks.get_nowait()
+        except queue.Empty:
+            self.underruns += 1
+        return self._chunks.get(timeout=timeout)
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join(timeout=1.0)
+        logging.info(f"Pattern {self.name} stopped, {self.underruns} prefetch underruns")
+
+
+if __name__ == "__main__":
+    window = ((100, 900), (100, 700))
+    for name in PATTERNS:
+        streamer = PatternStreamer(name, 1).start()
+        targets = scale_to_window(streamer.next_chunk(), window)
+        streamer.stop()
+        print(f"{name:<10} {targets[:4].tolist()}")
@@ -0,0 +1,278 @@
+import time
+import logging
+
+from hardware import gpio
+from step_scheduler import StepScheduler, DEFAULT_SPIN_THRESHOLD_US
+
+# A pulse block is a direction plus a sequence of step intervals in us. Each
+# interval is both the STEP high time and the following low time, so a step
+# takes twice its interval.
+#
+# A tick block drives several axes on one timeline: ``axes`` is a list of
+# (dir_pin, step_pin, direction), ``step_mask`` has one row per tick and one
+# column per axis saying which axes step on that tick, and ``intervals`` holds
+# the interval of every tick.
+#
+# Both take an optional stop flag (``stop``, or ``stops`` with one per axis):
+# a one byte buffer, see limit_switches. The block ends early once a flag
+# reads non-zero and the number of steps (ticks) emitted is returned.
+
+# Stop flag that never trips, so the step loops can always index one
+_NEVER = bytes(1)
+
+
+class PulseOutput:
+    """Base class for step pulse outputs that take whole blocks of steps."""
+
+    name = 'base'
+    # Backends whose pulse timing comes from the Python process get a StepScheduler
+    software_timed = False
+
+    def emit(self, dir_pin, step_pin, direction, intervals, stop=None):
+        raise NotImplementedError
+
+    def emit_ticks(self, axes, step_mask, intervals, stops=None):
+        raise NotImplementedError
+
+    def wait(self):
+        # Block until every emitted pulse has left the pin
+        pass
+
+    def halt(self):
+        # Drop pulses already handed to the hardware, called from the limit
+        # switch event thread. Only needed where emit returns before the pulses are out.
+        pass
+
+    def close(self):
+        pass
+
+
+class GPIOPulseOutput(PulseOutput):
+    """Bit-bangs the block with RPi.GPIO, placing the edges with a StepScheduler."""
+
+    name = 'gpio'
+    software_timed = True
+
+    def __init__(self, scheduler=None):
+        self.GPIO = gpio()
+        self.scheduler = scheduler or StepScheduler()
+
+    def emit(self, dir_pin, step_pin, direction, intervals, stop=None):
+        GPIO = self.GPIO
+        output = GPIO.output
+        wait_us = self.scheduler.wait_us
+        if stop is None:
+            stop = _NEVER
+        output(dir_pin, GPIO.HIGH if direction[0] else GPIO.LOW)
+        for emitted, interval in enumerate(intervals):
+            if stop[0]:
+                return emitted
+            # Edges are placed on absolute deadlines, so overshoot on one edge
+            # is taken out of the next wait instead of adding up
+            output(step_pin, GPIO.HIGH)
+            wait_us(interval)
+            output(step_pin, GPIO.LOW)
+            wait_us(interval)
+        return len(intervals)
+
+    def emit_ticks(self, axes, step_mask, intervals, stops=None):
+        GPIO = self.GPIO
+        output = GPIO.output
+        wait_us = self.scheduler.wait_us
+        stops = [flag for flag in stops or () if flag is not None]
+        for dir_pin, _, direction in axes:
+            output(dir_pin, GPIO.HIGH if direction[0] else GPIO.LOW)
+        step_pins = [step_pin for _, step_pin, _ in axes]
+        for tick, (row, interval) in enumerate(zip(step_mask.tolist(), intervals.tolist())):
+            if any(flag[0] for flag in stops):
+                return tick
+            pins = [pin for pin, step in zip(step_pins, row) if step]
+            output(pins, GPIO.HIGH)
+            wait_us(interval)
+            output(pins, GPIO.LOW)
+            wait_us(interval)
+        return len(intervals)
+
+
+class PigpioWaveOutput(PulseOutput):
+    """Turns each block into pigpio waveforms that the daemon clocks out with DMA.
+
+    Waves are chained with WAVE_MODE_ONE_SHOT_SYNC so there is no gap between
+    blocks, and at most ``max_in_flight`` waves are queued at a time. pigpio
+    transmits a single wave at a time, so only one process may own this backend.
+
+    The daemon clocks the pulses out after emit has returned, so stop flags
+    are only checked between waves. A limit switch trip ends the motion
+    through ``halt`` instead, which stops the wave being transmitted.
+    """
+
+    name = 'pigpio'
+
+    def __init__(self, host='localhost', port=8888, max_in_flight=2):
+        import pigpio
+        self.pigpio = pigpio
+        self.pi = pigpio.pi(host, port)
+        if not self.pi.connected:
+            raise RuntimeError(f"Cannot connect to pigpiod on {host}:{port}")
+        # Every step needs two pulses (rising and falling edge)
+        self.max_steps_per_wave = max(1, self.pi.wave_get_max_pulses() // 2 - 1)
+        self.max_in_flight = max_in_flight
+        self.last_direction = {}
+        self.in_flight = []
+
+    def _reap(self):
+        # Delete the waves the daemon has already finished sending
+        if not self.pi.wave_tx_busy():
+            done, self.in_flight = self.in_flight, []
+        else:
+            current = self.pi.wave_tx_at()
+            if current not in self.in_flight:
+                return
+            index = self.in_flight.index(current)
+            done, self.in_flight = self.in_flight[:index], self.in_flight[index:]
+        for wave_id in done:
+            self.pi.wave_delete(wave_id)
+
+    def _send(self, masks, intervals):
+        pigpio = self.pigpio
+        pulses = []
+        for mask, interval in zip(masks, intervals):
+            interval = int(interval)
+            pulses.append(pigpio.pulse(mask, 0, interval))
+            pulses.append(pigpio.pulse(0, mask, interval))
+        self.pi.wave_add_generic(pulses)
+        wave_id = self.pi.wave_create()
+        while len(self.in_flight) >= self.max_in_flight:
+            time.sleep(0.0005)
+            self._reap()
+        self.pi.wave_send_using_mode(wave_id, pigpio.WAVE_MODE_ONE_SHOT_SYNC)
+        self.in_flight.append(wave_id)
+
+    def _set_directions(self, axes):
+        changed = [(dir_pin, 1 if direction[0] else 0) for dir_pin, _, direction in axes
+                   if self.last_direction.get(dir_pin) != (1 if direction[0] else 0)]
+        if changed:
+            # DIR must not change under pulses that are still queued
+            self.wait()
+            for dir_pin, level in changed:
+                self.pi.write(dir_pin, level)
+                self.last_direction[dir_pin] = level
+
+    def _send_all(self, masks, intervals, stops):
+        # Queue the block wave by wave, returns the number of steps queued
+        for start in range(0, len(intervals), self.max_steps_per_wave):
+            if any(flag[0] for flag in stops):
+                self._reap()
+                return start
+            end = start + self.max_steps_per_wave
+            self._send(masks[start:end], intervals[start:end])
+        self._reap()
+        return len(intervals)
+
+    def emit(self, dir_pin, step_pin, direction, intervals, stop=None):
+        self._set_directions(((dir_pin, step_pin, direction),))
+        masks = [1 << step_pin] * len(intervals)
+        return self._send_all(masks, intervals, () if stop is None else (stop,))
+
+    def emit_ticks(self, axes, step_mask, intervals, stops=None):
+        self._set_directions(axes)
+        pin_masks = [1 << step_pin for _, step_pin, _ in axes]
+        masks = [sum(mask for mask, step in zip(pin_masks, row) if step) for row in step_mask.tolist()]
+        return self._send_all(masks, intervals, [flag for flag in stops or () if flag is not None])
+
+    def halt(self):
+        # Only the daemon is told to stop here, the waves are deleted by the
+        # next _reap in the step loop's thread
+        self.pi.wave_tx_stop()
+
+    def wait(self):
+        while self.pi.wave_tx_busy():
+            time.sleep(0.0005)
+        self._reap()
+
+    def close(self):
+        try:
+            self.wait()
+            self.pi.wave_clear()
+        finally:
+            self.pi.stop()
+
+
+class RecordingPulseOutput(PulseOutput):
+    """Keeps every emitted step in memory instead of driving pins.
+
+    With ``realtime=True`` it sleeps for the duration of each block so that
+    the step loop runs at the speed it would on hardware.
+    """
+
+    name = 'recording'
+    software_timed = True
+
+    def __init__(self, realtime=False, max_steps=None, scheduler=None):
+        self.realtime = realtime
+        self.scheduler = scheduler or StepScheduler()
+        self.max_steps = max_steps
+        self.steps = []
+        self.total_time_us = 0
+
+    def emit(self, dir_pin, step_pin, direction, intervals, stop=None):
+        if stop is None:
+            stop = _NEVER
+        block_time_us = 0
+        emitted = 0
+        for interval in intervals:
+            if stop[0]:
+                break
+            interval = int(interval)
+            emitted += 1
+            self.steps.append((step_pin, dir_pin, 1 if direction[0] else 0, interval))
+            block_time_us += 2 * interval
+        self.total_time_us += block_time_us
+        if self.max_steps is not None and len(self.steps) > self.max_steps:
+            del self.steps[:len(self.steps) - self.max_steps]
+        if self.realtime:
+            self.scheduler.wait_us(block_time_us)
+        return emitted
+
+    def emit_ticks(self, axes, step_mask, intervals, stops=None):
+        stops = [flag for flag in stops or () if flag is not None]
+        block_time_us = 0
+        emitted = 0
+        for row, interval in zip(step_mask.tolist(), intervals.tolist()):
+            if any(flag[0] for flag in stops):
+                break
+            interval = int(interval)
+            emitted += 1
+            for (dir_pin, step_pin, direction), step in zip(axes, row):
+                if step:
+                    self.steps.append((step_pin, dir_pin, 1 if direction[0] else 0, interval))
+            block_time_us += 2 * interval
+        self.total_time_us += block_time_us
+        if self.max_steps is not None and len(self.steps) > self.max_steps:
+            del self.steps[:len(self.steps) - self.max_steps]
+        if self.realtime:
+            self.scheduler.wait_us(block_time_us)
+        return emitted
+
+    def clear(self):
+        self.steps.clear()
+        self.total_time_us = 0
+
+
+PULSE_BACKENDS = {
+    'gpio': GPIOPulseOutput,
+    'pigpio': PigpioWaveOutput,
+    'recording': RecordingPulseOutput,
+}
+
+
+def create_pulse_output(backend='gpio', spin_threshold_us=DEFAULT_SPIN_THRESHOLD_US, **kwargs):
+    try:
+        backend_class = PULSE_BACKENDS[backend]
+    except KeyError:
+        raise ValueError(f"Invalid pulse backend {backend!r}. Use one of {sorted(PULSE_BACKENDS)}.")
+    if backend_class.software_timed:
+        kwargs.setdefault('scheduler', StepScheduler(spin_threshold_us))
+    output = backend_class(**kwargs)
+    logging.info(f"Using {output.name} pulse output")
+    return output
@@ -0,0 +1,26 @@
+import logging
+import functools
+
+# Fonts of the OLED screens by role, loaded once per process on first use
+FONT_PATH = "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"
+FONT_SIZES = {
+    'regular': 12,
+    'small': 10,
+    'large': 25,
+}
+
+
+@functools.lru_cache(maxsize=None)
+def load_font(role='regular'):
+    from PIL import ImageFont
+    try:
+        return ImageFont.truetype(FONT_PATH, FONT_SIZES[role])
+    except OSError as e:
+        logging.warning(f"Font {FONT_PATH} not available ({e}), using the default font")
+        return ImageFont.load_default()
+
+
+def preload_fonts():
+    # Load every font up front, so the first frame is not delayed by it
+    for role in FONT_SIZES:
+        load_font(role)
@@ -1,9 +1,10 @@
-from gpiozero import RotaryEncoder, Button
 from signal import pause
 import logging
 
 class RotaryEncoderHandler:
     def __init__(self, clk_pin, dt_pin, sw_pin, callback):
+        # gpiozero claims the pins, so it is only imported by the process that reads them
+        from gpiozero import RotaryEncoder, Button
         self.rotary = RotaryEncoder(clk_pin, dt_pin)
         self.button = Button(sw_pin)
         self.callback = callback
@@ -19,12 +20,12 @@ class RotaryEncoderHandler:
     def rotated_clockwise(self):
         self.count += 1
         self.callback("RIGHT")
-        logging.info(f"Rotary Encoder rotated clockwise, count: {self.count}")
+        logging.debug("Rotary Encoder rotated clockwise, count: %d", self.count)
 
     def rotated_counter_clockwise(self):
         self.count -= 1
         self.callback("LEFT")
-        logging.info(f"Rotary Encoder rotated counter-clockwise, count: {self.count}")
+        logging.debug("Rotary Encoder rotated counter-clockwise, count: %d", self.count)
 
     def button_pressed(self):
         self.callback("BUTTON", True)
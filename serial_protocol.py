@@ -0,0 +1,151 @@
+import struct
+import binascii
+import logging
+from collections import namedtuple
+
+# Binary frame sent by the controller:
+#
+#   0xA5 0x5A | length (u16 LE) | payload | CRC-16/CCITT of length + payload (u16 LE)
+#
+# The payload is a sample count (u8) followed by that many samples. Each
+# sample is pot_x, pot_y (u16), a switch bit field (bit 0/1: switch_x,
+# bit 2/3: switch_y), mode and mode2 (u8).
+#
+# The original ASCII lines "pot_x pot_y sx0 sx1 mode mode2 sy0 sy1\n" are still
+# accepted. ASCII never contains the 0xA5 sync byte, so both can be told apart
+# byte by byte and the parser switches between them on its own.
+SYNC = b'\xa5\x5a'
+HEADER = struct.Struct('<2sH')
+CRC = struct.Struct('<H')
+SAMPLE = struct.Struct('<HHBBB')
+MAX_SAMPLES = 32
+MAX_PAYLOAD = 1 + MAX_SAMPLES * SAMPLE.size
+MAX_LINE = 128
+
+# Pot range of a binary sample (u16). ASCII pots are clamped into it, the
+# speed tables are indexed with the raw value.
+POT_MAX = 0xFFFF
+
+Sample = namedtuple('Sample', 'pot_x pot_y switch_x switch_y mode mode2')
+
+
+def crc16(data):
+    return binascii.crc_hqx(data, 0xFFFF)
+
+
+def encode_frame(samples):
+    samples = list(samples)
+    if not 0 < len(samples) <= MAX_SAMPLES:
+        raise ValueError(f"A frame carries 1 to {MAX_SAMPLES} samples, got {len(samples)}")
+    payload = bytearray([len(samples)])
+    for sample in samples:
+        switches = (sample.switch_x[0] | sample.switch_x[1] << 1 |
+                    sample.switch_y[0] << 2 | sample.switch_y[1] << 3)
+        payload += SAMPLE.pack(sample.pot_x, sample.pot_y, switches, sample.mode, sample.mode2)
+    body = struct.pack('<H', len(payload)) + payload
+    return SYNC + body + CRC.pack(crc16(body))
+
+
+def encode_line(sample):
+    values = (sample.pot_x, sample.pot_y, sample.switch_x[0], sample.switch_x[1],
+              sample.mode, sample.mode2, sample.switch_y[0], sample.switch_y[1])
+    return (' '.join(str(value) for value in values) + '\n').encode('ascii')
+
+
+def sample_to_state(sample):
+    # The shared_data fields a sample updates
+    return {
+        'pot_x': sample.pot_x,
+        'pot_y': sample.pot_y,
+        'switch_x': sample.switch_x,
+        'switch_y': sample.switch_y,
+        'mode': sample.mode,
+        'mode2': sample.mode2,
+    }
+
+
+class FrameParser:
+    """Incremental parser for the controller stream, binary frames or ASCII lines.
+
+    ``feed`` takes whatever bytes were read and returns every complete sample
+    in them; partial frames and lines are kept for the next call.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.protocol = None
+        self.frames = 0
+        self.malformed = 0
+
+    def feed(self, data):
+        buffer = self.buffer
+        buffer += data
+        samples = []
+        while buffer:
+            sync = buffer.find(SYNC)
+            if sync != 0:
+                text_end = len(buffer) if sync < 0 else sync
+                newline = buffer.rfind(b'\n', 0, text_end)
+                if newline >= 0:
+                    for line in bytes(buffer[:newline + 1]).splitlines():
+                        self._parse_line(line, samples)
+                    del buffer[:newline + 1]
+                elif sync > 0:
+                    # Partial line cut off by a frame, nothing to recover
+                    self.malformed += 1
+                    del buffer[:sync]
+                elif len(buffer) > MAX_LINE:
+                    self.malformed += 1
+                    buffer.clear()
+                else:
+                    break
+                continue
+
+            if len(buffer) < HEADER.size:
+                break
+            _, length = HEADER.unpack_from(buffer)
+            if not 0 < length <= MAX_PAYLOAD:
+                self._resync()
+                continue
+            frame_size = HEADER.size + length + CRC.size
+            if len(buffer) < frame_size:
+                break
+            body = bytes(buffer[2:HEADER.size + length])
+            if CRC.unpack_from(buffer, HEADER.size + length)[0] != crc16(body) or not self._parse_payload(body[2:], samples):
+                self._resync()
+                continue
+            self.protocol = 'binary'
+            self.frames += 1
+            del buffer[:frame_size]
+        return samples
+
+    def _resync(self):
+        # Bad header or CRC: skip the sync bytes and look for the next frame
+        self.malformed += 1
+        del self.buffer[:2]
+
+    def _parse_payload(self, payload, samples):
+        count = payload[0]
+        if len(payload) != 1 + count * SAMPLE.size:
+            return False
+        for offset in range(1, len(payload), SAMPLE.size):
+            pot_x, pot_y, switches, mode, mode2 = SAMPLE.unpack_from(payload, offset)
+            samples.append(Sample(pot_x, pot_y, (switches & 1, switches >> 1 & 1),
+                                  (switches >> 2 & 1, switches >> 3 & 1), mode, mode2))
+        return True
+
+    def _parse_line(self, line, samples):
+        line = line.strip()
+        if not line:
+            return
+        try:
+            values = [int(value) for value in line.split()]
+            pot_x, pot_y = (min(max(value, 0), POT_MAX) for value in values[:2])
+            samples.append(Sample(pot_x, pot_y, (values[2], values[3]), (values[6], values[7]),
+                                  values[4], values[5]))
+        except (ValueError, IndexError):
+            self.malformed += 1
+            logging.debug(f"Malformed serial line: {line!r}")
+            return
+        self.protocol = 'ascii'
+        self.frames += 1
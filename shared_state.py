@@ -0,0 +1,353 @@
+import os
+import fcntl
+import struct
+import time
+import logging
+import tempfile
+from multiprocessing import Lock, resource_tracker, shared_memory
+
+# main_script creates its shared memory blocks under fixed names (this one,
+# config_store.CONFIG_SHM_NAME, speed_map.SPEED_MAP_SHM_NAME and
+# metrics.METRICS_SHM_NAME), so tools outside its process tree can attach to
+# them by name
+STATE_SHM_NAME = 'motion_state'
+
+# Fixed layout of the shared state block. Every field is stored at an 8 byte
+# aligned offset after the sequence counter. Only append new fields at the end
+# so that processes built from an older layout keep reading the right bytes.
+STATE_FIELDS = [
+    ('pot_x', 'i'),
+    ('pot_y', 'i'),
+    ('X_speed', 'q'),
+    ('Y_speed', 'q'),
+    ('dir_x', '2b'),
+    ('dir_y', '2b'),
+    ('switch_x', '2b'),
+    ('switch_y', '2b'),
+    ('mode', 'i'),
+    ('mode2', 'i'),
+    ('steps_x', 'q'),
+    ('steps_y', 'q'),
+    ('total_steps_x', 'q'),
+    ('total_steps_y', 'q'),
+    ('calibrating_x', '?'),
+    ('calibrating_y', '?'),
+    ('MOVEMENT_BUFFER_LEFT', 'q'),
+    ('MOVEMENT_BUFFER_RIGHT', 'q'),
+    ('MOVEMENT_BUFFER_TOP', 'q'),
+    ('MOVEMENT_BUFFER_BOTTOM', 'q'),
+    ('ACCELERATION_BUFFER', 'q'),
+    ('CANVAS_FRAME_X', 'q'),
+    ('CANVAS_FRAME_Y', 'q'),
+    ('last_limit_x', '8s'),
+    ('last_limit_y', '8s'),
+    ('current_mode', '16s'),
+    ('buffer_version', 'q'),
+    ('broker_frames_received', 'q'),
+    ('broker_frames_dropped', 'q'),
+    ('broker_writes', 'q'),
+    ('broker_writes_suppressed', 'q'),
+    # Slots for a Z and a rotary A axis added through axes.load_axes
+    ('Z_speed', 'q'),
+    ('A_speed', 'q'),
+    ('dir_z', '2b'),
+    ('dir_a', '2b'),
+    ('steps_z', 'q'),
+    ('steps_a', 'q'),
+    ('total_steps_z', 'q'),
+    ('total_steps_a', 'q'),
+    ('calibrating_z', '?'),
+    ('calibrating_a', '?'),
+    ('last_limit_z', '8s'),
+    ('last_limit_a', '8s'),
+]
+
+_SEQ = struct.Struct('Q')
+_HEADER_SIZE = 8
+
+
+def _build_layout(fields):
+    layout = {}
+    offset = _HEADER_SIZE
+    for name, fmt in fields:
+        packer = struct.Struct('=' + fmt)
+        if fmt.endswith('s'):
+            kind = 'str'
+        elif packer.size and len(packer.unpack(bytes(packer.size))) > 1:
+            kind = 'tuple'
+        elif fmt == '?':
+            kind = 'bool'
+        else:
+            kind = 'scalar'
+        layout[name] = (offset, packer, kind)
+        offset += (packer.size + 7) // 8 * 8
+    return layout, offset
+
+
+STATE_LAYOUT, STATE_SIZE = _build_layout(STATE_FIELDS)
+
+
+# Lock files of the named blocks this process created, see create_block
+_owner_locks = {}
+
+
+def _owner_lock(name):
+    # Exclusive lock on the owner file of block ``name``, None while a running instance holds it
+    lock = open(os.path.join(tempfile.gettempdir(), f"{name}.owner"), 'w')
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock.close()
+        return None
+    return lock
+
+
+def _unlink(name):
+    # Remove block ``name``, False if there is none
+    try:
+        stale = shared_memory.SharedMemory(name=name)
+    except FileNotFoundError:
+        return False
+    stale.close()
+    stale.unlink()
+    return True
+
+
+def create_block(name, size):
+    """Create the named shared memory block ``name`` for this process to own.
+
+    The owner holds an exclusive lock on a file named after the block for as
+    long as it (or a child it forked) runs. A block of the same name is only
+    removed as left over when that lock is free; if a running instance holds
+    it, this raises RuntimeError instead of destroying its state.
+    """
+    lock = _owner_lock(name)
+    if lock is None:
+        raise RuntimeError(f"Shared memory block {name} belongs to a running instance")
+    try:
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+    except FileExistsError:
+        # Nobody holds the lock, so the run that created it is gone
+        logging.warning(f"Removing shared memory block {name} left behind by a previous run")
+        _unlink(name)
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+    except BaseException:
+        lock.close()
+        raise
+    _owner_locks[shm.name] = lock
+    return shm
+
+
+def remove_stale_block(name):
+    # Remove block ``name`` if the run that created it is gone, for tools
+    # that start or clean up after main_script. Raises RuntimeError while a
+    # running instance owns it. True if a block was removed.
+    lock = _owner_lock(name)
+    if lock is None:
+        raise RuntimeError(f"Shared memory block {name} belongs to a running instance")
+    with lock:
+        return _unlink(name)
+
+
+def release_block(shm):
+    # Close and unlink a block made by create_block, and give up its name
+    try:
+        shm.close()
+    except BufferError:
+        pass  # A view is still exported, the mapping goes when the process exits
+    try:
+        shm.unlink()
+    except FileNotFoundError:
+        logging.warning(f"Shared memory block {shm.name} already unlinked")
+    lock = _owner_locks.pop(shm.name, None)
+    if lock is not None:
+        lock.close()
+
+
+def attach_untracked(name):
+    # Attach from a process outside main_script's process tree (a CLI tool).
+    # Before Python 3.13 this process's resource tracker would otherwise
+    # unlink the block when the tool exits.
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+
+def read_fields(shared_data, defaults):
+    # One consistent read of several fields from a SharedState, or one get
+    # per key from a proxy dict. ``defaults`` maps each key to the value used
+    # when the proxy dict does not have it.
+    if hasattr(shared_data, 'snapshot'):
+        return shared_data.snapshot(defaults)
+    return {key: shared_data.get(key, default) for key, default in defaults.items()}
+
+
+class SharedState:
+    """Dict-like view of the motion state kept in a shared memory block.
+
+    Readers never take a lock: every read runs under a seqlock and retries if a
+    writer was active. Writers are serialised by a single lock and bump the
+    sequence counter around each write so that ``snapshot()`` always returns a
+    consistent set of fields.
+    """
+
+    def __init__(self, shm, lock, owner=False):
+        self._shm = shm
+        self._buf = shm.buf
+        self._lock = lock
+        self._owner = owner
+
+    @classmethod
+    def create(cls, initial=None, name=None):
+        if name is None:
+            shm = shared_memory.SharedMemory(create=True, size=STATE_SIZE)
+        else:
+            shm = create_block(name, STATE_SIZE)
+        shm.buf[:STATE_SIZE] = bytes(STATE_SIZE)
+        state = cls(shm, Lock(), owner=True)
+        if initial:
+            state.update({key: value for key, value in initial.items() if key in STATE_LAYOUT})
+        return state
+
+    @classmethod
+    def attach(cls, name, lock):
+        return cls(attach_untracked(name), lock)
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    def __reduce__(self):
+        return (SharedState.attach, (self._shm.name, self._lock))
+
+    # -- low level access -------------------------------------------------
+
+    def _decode(self, name):
+        offset, packer, kind = STATE_LAYOUT[name]
+        values = packer.unpack_from(self._buf, offset)
+        if kind == 'tuple':
+            return values
+        if kind == 'str':
+            return values[0].rstrip(b'\0').decode('utf-8', 'replace')
+        return values[0]
+
+    def _encode(self, name, value):
+        offset, packer, kind = STATE_LAYOUT[name]
+        if kind == 'tuple':
+            packer.pack_into(self._buf, offset, *value)
+        elif kind == 'str':
+            packer.pack_into(self._buf, offset, str(value).encode('utf-8'))
+        elif kind == 'bool':
+            packer.pack_into(self._buf, offset, bool(value))
+        else:
+            packer.pack_into(self._buf, offset, int(value))
+
+    def _read(self, names):
+        buf = self._buf
+        spins = 0
+        while True:
+            seq = _SEQ.unpack_from(buf, 0)[0]
+            if not seq & 1:
+                values = [self._decode(name) for name in names]
+                if _SEQ.unpack_from(buf, 0)[0] == seq:
+                    return values
+            spins += 1
+            if spins > 100:
+                # A writer got descheduled in the middle of a write, let it finish
+                time.sleep(0)
+
+    def _read_one(self, name):
+        buf = self._buf
+        while True:
+            seq = _SEQ.unpack_from(buf, 0)[0]
+            if not seq & 1:
+                value = self._decode(name)
+                if _SEQ.unpack_from(buf, 0)[0] == seq:
+                    return value
+            time.sleep(0)
+
+    def _write(self, items):
+        buf = self._buf
+        with self._lock:
+            seq = _SEQ.unpack_from(buf, 0)[0]
+            _SEQ.pack_into(buf, 0, seq + 1)
+            try:
+                for name, value in items:
+                    self._encode(name, value)
+            finally:
+                _SEQ.pack_into(buf, 0, seq + 2)
+
+    # -- dict interface -----------------------------------------------------
+
+    def __getitem__(self, key):
+        if key not in STATE_LAYOUT:
+            raise KeyError(key)
+        return self._read_one(key)
+
+    def __setitem__(self, key, value):
+        if key not in STATE_LAYOUT:
+            raise KeyError(key)
+        self._write(((key, value),))
+
+    def __contains__(self, key):
+        return key in STATE_LAYOUT
+
+    def __iter__(self):
+        return iter(STATE_LAYOUT)
+
+    def __len__(self):
+        return len(STATE_LAYOUT)
+
+    def get(self, key, default=None):
+        if key not in STATE_LAYOUT:
+            return default
+        return self._read_one(key)
+
+    def keys(self):
+        return list(STATE_LAYOUT)
+
+    def items(self):
+        return self.snapshot().items()
+
+    def update(self, values=(), **kwargs):
+        items = dict(values, **kwargs)
+        for key in items:
+            if key not in STATE_LAYOUT:
+                raise KeyError(key)
+        self._write(items.items())
+
+    def add(self, key, delta):
+        # Atomic read-modify-write, unlike ``state[key] += delta``
+        if key not in STATE_LAYOUT:
+            raise KeyError(key)
+        with self._lock:
+            buf = self._buf
+            seq = _SEQ.unpack_from(buf, 0)[0]
+            _SEQ.pack_into(buf, 0, seq + 1)
+            try:
+                value = self._decode(key) + delta
+                self._encode(key, value)
+            finally:
+                _SEQ.pack_into(buf, 0, seq + 2)
+        return value
+
+    def snapshot(self, keys=None):
+        names = list(STATE_LAYOUT) if keys is None else list(keys)
+        return dict(zip(names, self._read(names)))
+
+    # Same name as DictProxy.copy() so callers can take one snapshot per frame
+    # without caring which backend they were handed.
+    copy = snapshot
+
+    def __repr__(self):
+        return f"SharedState({self.snapshot()})"
+
+    def close(self):
+        self._buf = None
+        if self._owner:
+            release_block(self._shm)
+        else:
+            self._shm.close()
@@ -0,0 +1,484 @@
+import os
+import sys
+import time
+import runpy
+import tempfile
+import types
+import signal
+import logging
+import threading
+import multiprocessing
+from multiprocessing.sharedctypes import RawArray
+
+import calibration_cache
+from fake_controller import FakeController
+from fake_i2c import FakeI2C, FakeSSD1306
+from serial_protocol import FrameParser, Sample
+from shared_state import SharedState, STATE_SHM_NAME, attach_untracked, remove_stale_block
+from metrics import Metrics, METRICS_SHM_NAME
+from config_store import CONFIG_SHM_NAME
+from speed_map import SPEED_MAP_SHM_NAME
+
+# Blocks main_script creates. They are only removed when no running instance
+# owns them, so the simulator refuses to start next to a live controller.
+MAIN_SCRIPT_BLOCKS = (STATE_SHM_NAME, METRICS_SHM_NAME, CONFIG_SHM_NAME, SPEED_MAP_SHM_NAME)
+
+MAIN_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main_script.py')
+
+# Simulated travel between the two limit switches of each axis, in steps
+SIM_TRAVEL = {
+    "X": 600,
+    "Y": 450,
+}
+
+# How often the fake controller repeats its current sample, like the real one
+SAMPLE_INTERVAL = 0.01
+
+# Counters of a simulated axis, shared with the process that owns the carriage
+_POSITION, _STEPS, _ARMED, _FIRST_STEP_NS = range(4)
+
+
+class SimulatedAxis:
+    """Carriage of one axis, moved by the pulses on its STEP pin.
+
+    The limit switches close (read LOW, they are pulled up) once the carriage
+    reaches either end of ``travel``; past that the carriage stalls like it
+    would against the frame. The counters live in shared memory so the
+    process running the benchmark sees the steps made in the motion process.
+    """
+
+    def __init__(self, name, dir_pin, step_pin, limit_neg, limit_pos, travel, start=None):
+        self.name = name
+        self.dir_pin = dir_pin
+        self.step_pin = step_pin
+        self.limit_neg = limit_neg
+        self.limit_pos = limit_pos
+        self.travel = travel
+        self.direction = 1
+        self.counters = RawArray('q', 4)
+        self.counters[_POSITION] = travel // 2 if start is None else start
+
+    @property
+    def position(self):
+        return self.counters[_POSITION]
+
+    @property
+    def steps(self):
+        # Pulses received, including the ones lost against an end stop
+        return self.counters[_STEPS]
+
+    def step(self):
+        counters = self.counters
+        counters[_POSITION] = max(0, min(self.travel, counters[_POSITION] + self.direction))
+        counters[_STEPS] += 1
+        if counters[_ARMED]:
+            counters[_FIRST_STEP_NS] = time.monotonic_ns()
+            counters[_ARMED] = 0
+
+    def arm(self):
+        # Catch the time of the next step pulse, see first_step_ns
+        self.counters[_FIRST_STEP_NS] = 0
+        self.counters[_ARMED] = 1
+
+    @property
+    def first_step_ns(self):
+        return self.counters[_FIRST_STEP_NS]
+
+    def slip(self, steps):
+        # Move the carriage without pulses, like lost steps. It stops short of
+        # the switches, the next pulses toward one trip it.
+        self.counters[_POSITION] = max(1, min(self.travel - 1, self.counters[_POSITION] + steps))
+
+    def switch_level(self, pin):
+        if pin == self.limit_neg:
+            return 0 if self.counters[_POSITION] <= 0 else 1
+        return 0 if self.counters[_POSITION] >= self.travel else 1
+
+
+class SimulatedGPIO:
+    """RPi.GPIO stand-in that drives SimulatedAxis carriages.
+
+    Edge callbacks on the limit switches run in the thread that made the
+    step, before ``output`` returns, so a trip is seen by the next step.
+    """
+
+    BCM = 11
+    BOARD = 10
+    OUT = 0
+    IN = 1
+    LOW = 0
+    HIGH = 1
+    PUD_OFF = 20
+    PUD_DOWN = 21
+    PUD_UP = 22
+    RISING = 31
+    FALLING = 32
+    BOTH = 33
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.levels = {}
+        self._step_pins = {}
+        self._dir_pins = {}
+        self._switch_pins = {}
+        self._edge_callbacks = {}
+
+    def add_axis(self, axis):
+        self._step_pins[axis.step_pin] = axis
+        self._dir_pins[axis.dir_pin] = axis
+        self._switch_pins[axis.limit_neg] = axis
+        self._switch_pins[axis.limit_pos] = axis
+
+    def setmode(self, mode):
+        pass
+
+    def setwarnings(self, flag):
+        pass
+
+    def setup(self, pins, direction, pull_up_down=PUD_OFF, initial=None):
+        for pin in pins if isinstance(pins, (list, tuple)) else (pins,):
+            if direction == self.OUT:
+                self.levels[pin] = initial or self.LOW
+            else:
+                self.levels.setdefault(pin, self.HIGH if pull_up_down == self.PUD_UP else self.LOW)
+
+    def output(self, pins, values):
+        if not isinstance(pins, (list, tuple)):
+            pins = (pins,)
+        if not isinstance(values, (list, tuple)):
+            values = (values,) * len(pins)
+        levels = self.levels
+        for pin, value in zip(pins, values):
+            value = self.HIGH if value else self.LOW
+            previous = levels.get(pin, self.LOW)
+            levels[pin] = value
+            axis = self._step_pins.get(pin)
+            if axis is not None:
+                if value and not previous:
+                    self._step(axis)
+            elif pin in self._dir_pins:
+                self._dir_pins[pin].direction = 1 if value else -1
+
+    def _step(self, axis):
+        if not self._edge_callbacks:
+            axis.step()
+            return
+        pins = (axis.limit_neg, axis.limit_pos)
+        before = [axis.switch_level(pin) for pin in pins]
+        axis.step()
+        for pin, level in zip(pins, before):
+            edge, callback = self._edge_callbacks.get(pin, (None, None))
+            if callback is None or axis.switch_level(pin) == level:
+                continue
+            if edge == self.BOTH or edge == (self.FALLING if level else self.RISING):
+                callback(pin)
+
+    def add_event_detect(self, pin, edge, callback=None, bouncetime=None):
+        self._edge_callbacks[pin] = (edge, callback)
+
+    def remove_event_detect(self, pin):
+        self._edge_callbacks.pop(pin, None)
+
+    def input(self, pin):
+        axis = self._switch_pins.get(pin)
+        if axis is not None:
+            return axis.switch_level(pin)
+        return self.levels.get(pin, self.HIGH)
+
+    def cleanup(self, *pins):
+        pass
+
+
+class FakeRotaryEncoder:
+    # gpiozero.RotaryEncoder with the callbacks fired by the simulation
+    instances = []
+
+    def __init__(self, a, b, **kwargs):
+        self.pins = (a, b)
+        self.when_rotated_clockwise = None
+        self.when_rotated_counter_clockwise = None
+        FakeRotaryEncoder.instances.append(self)
+
+
+class FakeButton:
+    instances = []
+
+    def __init__(self, pin, **kwargs):
+        self.pin = pin
+        self.when_pressed = None
+        self.when_released = None
+        FakeButton.instances.append(self)
+
+
+def fire_encoder_event(index, event):
+    # Same callbacks gpiozero calls from its pin thread. ``index`` is the
+    # encoder's creation order, so 0 is the buffer encoder in main_script.
+    if event in ('RIGHT', 'LEFT'):
+        encoder = FakeRotaryEncoder.instances[index]
+        callback = encoder.when_rotated_clockwise if event == 'RIGHT' else encoder.when_rotated_counter_clockwise
+    else:
+        button = FakeButton.instances[index]
+        callback = button.when_pressed if event == 'PRESS' else button.when_released
+    if callback is not None:
+        callback()
+
+
+def install():
+    """Put the fakes where main_script and its modules import the hardware from.
+
+    Modules keep the GPIO object they imported, so later calls hand back the
+    installed SimulatedGPIO with its axes removed instead of a new one.
+    """
+    gpio = sys.modules.get('RPi.GPIO')
+    if isinstance(gpio, SimulatedGPIO):
+        gpio.reset()
+        return gpio
+    gpio = SimulatedGPIO()
+    rpi = types.ModuleType('RPi')
+    rpi.GPIO = gpio
+    sys.modules['RPi'] = rpi
+    sys.modules['RPi.GPIO'] = gpio
+
+    gpiozero = types.ModuleType('gpiozero')
+    gpiozero.RotaryEncoder = FakeRotaryEncoder
+    gpiozero.Button = FakeButton
+    sys.modules['gpiozero'] = gpiozero
+
+    for name in ('luma', 'luma.core', 'luma.core.interface', 'luma.core.interface.serial',
+                 'luma.oled', 'luma.oled.device'):
+        sys.modules.setdefault(name, types.ModuleType(name))
+    sys.modules['luma.core.interface.serial'].i2c = FakeI2C
+    sys.modules['luma.oled.device'].ssd1306 = FakeSSD1306
+    return gpio
+
+
+def simulated_axes(travel=SIM_TRAVEL, start=None):
+    # One carriage per axis, on the pins stepper_motor_control drives
+    from stepper_motor_control import axis_settings
+    axes = {}
+    for name, length in travel.items():
+        settings = axis_settings(name)
+        axes[name] = SimulatedAxis(name, settings['dir_pin'], settings['step_pin'],
+                                   settings['limit_neg'], settings['limit_pos'], length,
+                                   (start or {}).get(name))
+    return axes
+
+
+def load_script(path):
+    # Controller script: one sample per line, "seconds" followed by the fields
+    # of the controller's ASCII line (pot_x pot_y sx0 sx1 mode mode2 sy0 sy1)
+    script = []
+    parser = FrameParser()
+    with open(path) as f:
+        for line in f:
+            line = line.split('#', 1)[0].strip()
+            if not line:
+                continue
+            at, fields = line.split(None, 1)
+            samples = parser.feed((fields + '\n').encode('ascii'))
+            if samples:
+                script.append((float(at), samples[-1]))
+    return script
+
+
+class SerialReplay(FakeController):
+    """Fake controller that streams its current sample and replays a script.
+
+    The current sample is resent every SAMPLE_INTERVAL like the real
+    controller does; ``set`` changes fields of it and sends it right away.
+    """
+
+    def __init__(self, sample=None, script=(), binary=True):
+        super().__init__()
+        self.sample = sample or Sample(0, 0, (0, 0), (0, 0), 0, 1)
+        self.script = list(script)
+        self.binary = binary
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="SerialReplay", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def set(self, **fields):
+        with self._lock:
+            self.sample = self.sample._replace(**fields)
+            self.send([self.sample], binary=self.binary)
+
+    def _run(self):
+        start = time.monotonic()
+        script = iter(self.script)
+        pending = next(script, None)
+        while not self._stop.wait(SAMPLE_INTERVAL):
+            now = time.monotonic() - start
+            while pending is not None and pending[0] <= now:
+                with self._lock:
+                    self.sample = pending[1]
+                pending = next(script, None)
+            with self._lock:
+                self.send([self.sample], binary=self.binary)
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+        super().close()
+
+
+def _encoder_events(event_queue):
+    while True:
+        item = event_queue.get()
+        if item is None:
+            return
+        fire_encoder_event(*item)
+
+
+def _run_main_script(main_script, env, event_queue, log_path, calibration_file):
+    # Own process group, so stop() reaches every process main_script starts
+    os.setpgrp()
+    calibration_cache.CALIBRATION_CACHE_FILE = calibration_file
+    if log_path:
+        log_fd = os.open(log_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        os.dup2(log_fd, 1)
+        os.dup2(log_fd, 2)
+        os.close(log_fd)
+    os.environ.update(env)
+    threading.Thread(target=_encoder_events, args=(event_queue,), name="EncoderEvents", daemon=True).start()
+    runpy.run_path(main_script, run_name='__main__')
+
+
+class Simulation:
+    """main_script.py with its full process topology on simulated hardware.
+
+    ``start`` installs the fakes, starts the serial replay on a pty and runs
+    main_script in a child process group. The benchmark side reads the
+    shared state and metrics blocks like any other tool, sees the carriages
+    through ``axes`` and drives the inputs with ``set_inputs`` and
+    ``encoder``.
+    """
+
+    def __init__(self, travel=SIM_TRAVEL, motion_mode='bounce', script=(), sample=None, log_path=None,
+                 main_script=MAIN_SCRIPT, start=None, calibration_file=None):
+        self.gpio = install()
+        self.axes = simulated_axes(travel, start)
+        # A fresh calibration cache unless one is given, never the machine's own
+        self.calibration_file = calibration_file or os.path.join(tempfile.mkdtemp(prefix='sim-'), 'calibration.json')
+        for axis in self.axes.values():
+            self.gpio.add_axis(axis)
+        self.motion_mode = motion_mode
+        self.log_path = log_path
+        self.main_script = main_script
+        self.replay = SerialReplay(sample=sample, script=script)
+        self._context = multiprocessing.get_context('fork')
+        self._events = self._context.Queue()
+        self._process = None
+        self._state = None
+        self._metrics = None
+        self.started = None
+
+    def start(self):
+        for name in MAIN_SCRIPT_BLOCKS:
+            remove_stale_block(name)
+        self.replay.start()
+        env = {'SERIAL_PORT': self.replay.port_name, 'MOTION_MODE': self.motion_mode}
+        self._process = self._context.Process(target=_run_main_script, name="MainScript",
+                                              args=(self.main_script, env, self._events, self.log_path,
+                                                    self.calibration_file))
+        self.started = time.monotonic()
+        self._process.start()
+        return self
+
+    def _attach(self, name, timeout):
+        # Untracked, stop removes whatever a killed run left behind
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                return attach_untracked(name)
+            except FileNotFoundError:
+                if time.monotonic() > deadline or not self._process.is_alive():
+                    raise
+                time.sleep(0.01)
+
+    def state(self, timeout=10.0):
+        # Read-only view of main_script's shared state (no writer lock)
+        if self._state is None:
+            self._state = SharedState(self._attach(STATE_SHM_NAME, timeout), None)
+        return self._state
+
+    def metrics(self, timeout=10.0):
+        if self._metrics is None:
+            self._metrics = Metrics(self._attach(METRICS_SHM_NAME, timeout))
+        return self._metrics
+
+    def set_inputs(self, **fields):
+        self.replay.set(**fields)
+
+    def encoder(self, index, event):
+        # 'RIGHT', 'LEFT', 'PRESS' or 'RELEASE' on encoder ``index``
+        self._events.put((index, event))
+
+    def wait_for(self, predicate, timeout, poll=0.0002):
+        # Seconds until ``predicate()`` held, None on timeout
+        start = time.monotonic()
+        while time.monotonic() - start < timeout:
+            if predicate():
+                return time.monotonic() - start
+            time.sleep(poll)
+        return None
+
+    def stop(self, timeout=5.0):
+        if self._process is not None and self._process.pid is not None:
+            self._events.put(None)
+            group = self._process.pid
+            try:
+                # Ctrl+C for every process, as on the real machine
+                os.killpg(group, signal.SIGINT)
+                self._process.join(timeout)
+                deadline = time.monotonic() + timeout
+                while time.monotonic() < deadline:
+                    os.killpg(group, 0)
+                    time.sleep(0.05)
+                # Whatever ignored the interrupt
+                os.killpg(group, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            self._process.join()
+        for view in (self._state, self._metrics):
+            if view is not None:
+                try:
+                    view.close()
+                except BufferError:
+                    pass  # A caller still holds a value, the mapping goes when this process exits
+        self._state = self._metrics = None
+        if self._process is not None and not self._process.is_alive():
+            for name in MAIN_SCRIPT_BLOCKS:
+                remove_stale_block(name)
+        self.replay.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    script = load_script(sys.argv[1]) if len(sys.argv) > 1 else ()
+    sim = Simulation(script=script, sample=Sample(40000, 40000, (1, 0), (1, 0), 0, 1))
+    sim.start()
+    print(f"main_script running on simulated hardware, controller on {sim.replay.port_name}. Ctrl+C to stop.")
+    try:
+        state = sim.state()
+        while True:
+            time.sleep(1.0)
+            values = state.snapshot(['steps_x', 'steps_y', 'calibrating_x', 'calibrating_y'])
+            positions = ' '.join(f"{name}={axis.position}" for name, axis in sim.axes.items())
+            print(f"{values}  carriage {positions}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sim.stop()
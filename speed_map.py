@@ -0,0 +1,248 @@
+import struct
+import argparse
+from collections import namedtuple
+
+import numpy as np
+
+from motion_profiles import POT_MIN, SLOW_INTERVAL_US, FAST_INTERVAL_US
+from shared_state import create_block, release_block, attach_untracked
+
+# Fixed block name, see shared_state.STATE_SHM_NAME
+SPEED_MAP_SHM_NAME = 'motion_speed_map'
+
+# Every raw pot value has its own table entry
+POT_VALUES = 65536
+
+MOTORS = ('X', 'Y')
+
+# Table each pot channel of the shared state goes through. An axis uses the
+# table of the pot it follows (axes.AXES 'pot').
+POT_TABLES = {'pot_x': 'X', 'pot_y': 'Y'}
+
+# Response curves, stored in the config as their index:
+# - period: step interval linear in pot travel (the original map_value), almost
+#   all of the travel is spent at the slowest speeds
+# - frequency: speed linear in pot travel
+# - exponential: equal speed ratio per unit of pot travel
+# - piecewise: speed linear in two pieces, the lower half of the travel covers
+#   the first PIECEWISE_KNEE of the speed range for fine control
+SPEED_CURVES = ('period', 'frequency', 'exponential', 'piecewise')
+PIECEWISE_KNEE = 0.25
+
+# Config fields the tables are built from (see config_store). The pot is
+# ignored within POT_DEADZONE_LOW of 0 and POT_DEADZONE_HIGH of the top.
+CURVE_KEYS = ('SLOW_INTERVAL_US', 'FAST_INTERVAL_US', 'SPEED_CURVE_X', 'SPEED_CURVE_Y', 'POT_DEADZONE_LOW',
+              'POT_DEADZONE_HIGH')
+
+DEFAULT_CURVE = {
+    'SLOW_INTERVAL_US': SLOW_INTERVAL_US,
+    'FAST_INTERVAL_US': FAST_INTERVAL_US,
+    'SPEED_CURVE_X': SPEED_CURVES.index('exponential'),
+    'SPEED_CURVE_Y': SPEED_CURVES.index('exponential'),
+    'POT_DEADZONE_LOW': POT_MIN,
+    'POT_DEADZONE_HIGH': 0,
+}
+
+SpeedCurve = namedtuple('SpeedCurve', CURVE_KEYS)
+
+# Layout: published version, two slots of curve fields, then two slots of
+# tables (uint32 intervals in us, one row per motor). Version n lives in slot
+# n % 2, as in config_store. The version and tables are in native byte order.
+_VERSION = struct.Struct('<Q')
+_CURVE = struct.Struct('<' + 'q' * len(CURVE_KEYS))
+_TABLES_OFFSET = (_VERSION.size + 2 * _CURVE.size + 7) // 8 * 8
+_TABLE_SHAPE = (len(MOTORS), POT_VALUES)
+_TABLE_BYTES = len(MOTORS) * POT_VALUES * 4
+_SIZE = _TABLES_OFFSET + 2 * _TABLE_BYTES
+
+
+def curve_table(curve, slow_interval, fast_interval, deadzone_low=POT_MIN, deadzone_high=0):
+    """Step interval (us, uint32) for every pot value, for one of SPEED_CURVES.
+
+    The interval is the base (start/stop) interval of a bounce segment, and
+    the 'period' curve is the original map_value mapping.
+    """
+    if curve not in SPEED_CURVES:
+        raise ValueError(f"Invalid speed curve {curve!r}. Use one of {SPEED_CURVES}.")
+    low = max(int(deadzone_low), 0)
+    high = max(POT_VALUES - 1 - int(deadzone_high), low + 1)
+    pot = np.arange(POT_VALUES, dtype=np.float64)
+    travel = np.clip((pot - low) / (high - low), 0.0, 1.0)
+    slow_speed, fast_speed = 1.0 / slow_interval, 1.0 / fast_interval
+    if curve == 'period':
+        intervals = slow_interval + (fast_interval - slow_interval) * travel
+    elif curve == 'exponential':
+        intervals = slow_interval * (fast_interval / slow_interval) ** travel
+    else:
+        if curve == 'piecewise':
+            travel = np.where(travel < 0.5, travel * 2 * PIECEWISE_KNEE,
+                              PIECEWISE_KNEE + (travel - 0.5) * 2 * (1 - PIECEWISE_KNEE))
+        intervals = 1.0 / (slow_speed + (fast_speed - slow_speed) * travel)
+    return np.maximum(np.rint(intervals), 1).astype(np.uint32)
+
+
+class SpeedTables(namedtuple('SpeedTables', 'version curve intervals')):
+    """One published version of the tables, ``intervals`` maps motor to its table.
+
+    The tables are uint32 memoryviews, indexing one gives a plain int. A
+    slot is rebuilt two publishes later, so a reader holding one checks the
+    version after reading (SpeedMap.lookup does for the step loops).
+    """
+
+    def table(self, motor):
+        # Indexed by pot values 0..POT_VALUES-1, as the serial samples carry them
+        return self.intervals[motor]
+
+    def interval(self, motor, pot_value):
+        if not 0 <= pot_value < POT_VALUES:
+            pot_value = 0 if pot_value < 0 else POT_VALUES - 1
+        return self.intervals[motor][pot_value]
+
+    def fraction(self, motor, pot_value):
+        # 0..1 position of the pot's speed between the slowest and fastest
+        # interval on a log scale, for speed bars
+        slow, fast = self.curve.SLOW_INTERVAL_US, self.curve.FAST_INTERVAL_US
+        if slow <= fast:
+            return 1.0
+        return float(np.log(slow / self.interval(motor, pot_value)) / np.log(slow / fast))
+
+
+class SpeedMap:
+    """Pot value to step interval tables for every axis, in shared memory.
+
+    The process owning the ConfigStore rebuilds the tables in ``sync``
+    (registered as a config listener) whenever a publish changes one of
+    CURVE_KEYS, into the slot readers are not using, and publishes them with a
+    version. Every other process only reads: ``current`` costs one integer
+    compare unless a new version was published, and ``lookup`` is one index
+    between two reads of the version.
+    """
+
+    def __init__(self, shm, owner=False, buf=None):
+        self._shm = shm
+        self._owner = owner
+        self._buf = buf if buf is not None else shm.buf
+        self._tables = np.ndarray((2,) + _TABLE_SHAPE, dtype=np.uint32, buffer=self._buf, offset=_TABLES_OFFSET)
+        # Read side of the same memory: the version and one memoryview per
+        # slot and motor, indexing them is cheaper than unpacking
+        self._version = memoryview(self._buf)[:_VERSION.size].cast('Q')
+        tables = memoryview(self._buf)[_TABLES_OFFSET:_SIZE].cast('I')
+        self._views = [{motor: tables[(slot * len(MOTORS) + axis) * POT_VALUES:(slot * len(MOTORS) + axis + 1) * POT_VALUES]
+                        for axis, motor in enumerate(MOTORS)} for slot in range(2)]
+        self._current = None
+        # Of self._current, as plain attributes for lookup
+        self._current_version = None
+        self._current_intervals = None
+        self.rebuilds = 0
+
+    @classmethod
+    def create(cls, config=None, name=SPEED_MAP_SHM_NAME):
+        shm = create_block(name, _SIZE)
+        shm.buf[:_TABLES_OFFSET] = bytes(_TABLES_OFFSET)
+        speed_map = cls(shm, owner=True)
+        speed_map.sync(config)
+        return speed_map
+
+    @classmethod
+    def attach(cls, name=SPEED_MAP_SHM_NAME):
+        shm = attach_untracked(name)
+        return cls(shm)
+
+    @classmethod
+    def local(cls, config=None):
+        # Process-private tables, for benchmarks and running a module on its own
+        speed_map = cls(None, buf=bytearray(_SIZE))
+        speed_map.sync(config)
+        return speed_map
+
+    def __reduce__(self):
+        return (SpeedMap.attach, (self._shm.name,))
+
+    @property
+    def version(self):
+        return self._version[0]
+
+    def current(self):
+        current = self._current
+        version = self._version[0]
+        if current is not None and current.version == version:
+            return current
+        slot = version % 2
+        curve = SpeedCurve(*_CURVE.unpack_from(self._buf, _VERSION.size + slot * _CURVE.size))
+        self._current = SpeedTables(version, curve, self._views[slot])
+        self._current_version, self._current_intervals = version, self._views[slot]
+        return self._current
+
+    def lookup(self, motor, pot_value):
+        # Interval for ``pot_value`` (0..POT_VALUES-1) in the current table of
+        # ``motor``, for the step loops once per block
+        version = self._version[0]
+        if version != self._current_version:
+            self.current()
+        interval = self._current_intervals[motor][pot_value]
+        # Rewriting a slot takes a publish into the other one first, so an
+        # unchanged version means the entry came from an untouched table
+        if self._version[0] != version:
+            return self.lookup(motor, pot_value)
+        return interval
+
+    def sync(self, config=None):
+        # Rebuild from ``config`` (a MotionConfig or dict with CURVE_KEYS) if
+        # its curve fields differ from the published tables. Owner only.
+        if config is None:
+            curve = SpeedCurve(**DEFAULT_CURVE)
+        elif isinstance(config, dict):
+            curve = SpeedCurve(*(config[key] for key in CURVE_KEYS))
+        else:
+            curve = SpeedCurve(*(getattr(config, key) for key in CURVE_KEYS))
+        version = self.version
+        if version and self.current().curve == curve:
+            return False
+        version += 1
+        slot = version % 2
+        for axis, motor in enumerate(MOTORS):
+            self._tables[slot, axis] = curve_table(SPEED_CURVES[getattr(curve, f'SPEED_CURVE_{motor}')],
+                                                   curve.SLOW_INTERVAL_US, curve.FAST_INTERVAL_US,
+                                                   curve.POT_DEADZONE_LOW, curve.POT_DEADZONE_HIGH)
+        _CURVE.pack_into(self._buf, _VERSION.size + slot * _CURVE.size, *curve)
+        self._version[0] = version
+        self.rebuilds += 1
+        return True
+
+    def close(self):
+        if self._shm is None:
+            return
+        # Drop the views before the buffer goes away
+        for views in self._views:
+            for view in views.values():
+                view.release()
+        self._version.release()
+        self._tables = self._current = self._current_intervals = self._views = self._version = None
+        self._buf = None
+        if self._owner:
+            release_block(self._shm)
+            return
+        try:
+            self._shm.close()
+        except BufferError:
+            pass  # A caller still holds a table
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pot to step interval tables of the running machine, or of a curve")
+    parser.add_argument('--curve', choices=SPEED_CURVES, help="show this curve instead of the shared tables")
+    parser.add_argument('--points', type=int, default=9, help="pot values to show")
+    args = parser.parse_args()
+
+    if args.curve:
+        speed_map = SpeedMap.local(dict(DEFAULT_CURVE, SPEED_CURVE_X=SPEED_CURVES.index(args.curve),
+                                        SPEED_CURVE_Y=SPEED_CURVES.index(args.curve)))
+    else:
+        speed_map = SpeedMap.attach()
+    tables = speed_map.current()
+    print(f"version {tables.version}: " + ", ".join(f"{key}={value}" for key, value in tables.curve._asdict().items()))
+    for pot_value in np.linspace(0, POT_VALUES - 1, args.points).astype(int).tolist():
+        print(f"pot {pot_value:5d}  " + "  ".join(
+            f"{motor} {tables.interval(motor, pot_value):6d} us ({500_000 / tables.interval(motor, pot_value):7.1f} steps/s)"
+            for motor in MOTORS))
+    speed_map.close()
@@ -0,0 +1,110 @@
+import time
+from array import array
+
+# Default length of the final busy-spin before each deadline. time.sleep
+# overshoots by 50-100 us on a stock Linux kernel, so the sleep is cut short by
+# this much and the rest is spun on perf_counter_ns.
+DEFAULT_SPIN_THRESHOLD_US = 200
+
+# Being later than this re-anchors the timeline instead of catching up with a
+# burst of back-to-back steps
+DEFAULT_RESYNC_US = 2000
+
+LATENESS_WINDOW = 4096
+
+
+def precise_sleep_ns(duration_ns, spin_threshold_ns=DEFAULT_SPIN_THRESHOLD_US * 1000):
+    deadline = time.perf_counter_ns() + duration_ns
+    coarse = duration_ns - spin_threshold_ns
+    if coarse > 0:
+        time.sleep(coarse / 1_000_000_000)
+    while time.perf_counter_ns() < deadline:
+        pass
+
+
+class StepScheduler:
+    """Waits for absolute step deadlines with a hybrid sleep/spin.
+
+    Deadlines are advanced from the previous deadline rather than from the
+    time the wait returned, so oversleeping on one step does not make every
+    later step late. Lateness of every deadline is recorded for ``stats()``,
+    and into the metrics histograms when they are set: the lateness itself and
+    how far each achieved interval was off the commanded one.
+    """
+
+    def __init__(self, spin_threshold_us=DEFAULT_SPIN_THRESHOLD_US, resync_us=DEFAULT_RESYNC_US,
+                 window=LATENESS_WINDOW, lateness_histogram=None, interval_error_histogram=None):
+        self.spin_threshold_ns = int(spin_threshold_us * 1000)
+        self.resync_ns = int(resync_us * 1000)
+        self.deadline_ns = None
+        self.resyncs = 0
+        self.lateness_histogram = lateness_histogram
+        self.interval_error_histogram = interval_error_histogram
+        self._last_lateness = None
+        self.reset_stats(window)
+
+    def reset_stats(self, window=None):
+        window = window or len(self._recent)
+        # Recent lateness samples in ns for the p99, kept in a fixed ring
+        self._recent = array('q', bytes(8 * window))
+        self._recent_index = 0
+        self.count = 0
+        self.total_lateness_ns = 0
+        self.max_lateness_ns = 0
+
+    def start(self):
+        self.deadline_ns = time.perf_counter_ns()
+        self._last_lateness = None
+
+    def wait_us(self, interval_us):
+        # Wait until ``interval_us`` after the previous deadline
+        if self.deadline_ns is None:
+            self.start()
+        self.wait_until_ns(self.deadline_ns + int(interval_us * 1000))
+
+    def wait_until_ns(self, deadline_ns):
+        remaining = deadline_ns - time.perf_counter_ns()
+        if remaining > self.spin_threshold_ns:
+            time.sleep((remaining - self.spin_threshold_ns) / 1_000_000_000)
+        now = time.perf_counter_ns()
+        while now < deadline_ns:
+            now = time.perf_counter_ns()
+
+        lateness = now - deadline_ns
+        self._record(lateness)
+        if self.lateness_histogram is not None:
+            self.lateness_histogram.record(lateness)
+        if self.interval_error_histogram is not None and self._last_lateness is not None:
+            # Achieved minus commanded interval is the change in lateness
+            self.interval_error_histogram.record(abs(lateness - self._last_lateness))
+        if lateness > self.resync_ns:
+            # We were descheduled or the caller was idle, start a new timeline
+            self.resyncs += 1
+            self.deadline_ns = now
+            self._last_lateness = None
+        else:
+            self.deadline_ns = deadline_ns
+            self._last_lateness = lateness
+        return lateness
+
+    def _record(self, lateness_ns):
+        self._recent[self._recent_index] = lateness_ns
+        self._recent_index = (self._recent_index + 1) % len(self._recent)
+        self.count += 1
+        self.total_lateness_ns += lateness_ns
+        if lateness_ns > self.max_lateness_ns:
+            self.max_lateness_ns = lateness_ns
+
+    def stats(self):
+        # Lateness in us: max and mean over all deadlines, p99 over the recent window
+        if not self.count:
+            return {'count': 0, 'max_us': 0.0, 'p99_us': 0.0, 'mean_us': 0.0, 'resyncs': self.resyncs}
+        recent = sorted(self._recent[:min(self.count, len(self._recent))])
+        p99 = recent[min(len(recent) - 1, int(len(recent) * 0.99))]
+        return {
+            'count': self.count,
+            'max_us': self.max_lateness_ns / 1000,
+            'p99_us': p99 / 1000,
+            'mean_us': self.total_lateness_ns / self.count / 1000,
+            'resyncs': self.resyncs,
+        }
@@ -0,0 +1,220 @@
+import sys
+import struct
+import argparse
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from shared_state import attach_untracked
+
+# Axes with their own ring, and steps kept per ring before the oldest are overwritten
+TRACE_AXES = ("X", "Y")
+TRACE_CAPACITY = 1 << 18
+
+# One record per step: scheduled time of the step (time.monotonic_ns clock),
+# axis position after the step, the step's half-period interval in us and the
+# direction (+1/-1)
+TRACE_RECORD = np.dtype([
+    ('time_ns', '<i8'),
+    ('position', '<i8'),
+    ('interval_us', '<u4'),
+    ('direction', 'i1'),
+], align=True)
+
+# Header: magic, capacity, axis count, then per axis its name and write count
+_MAGIC = b'STEPTRC1'
+_HEADER = struct.Struct('<8sQQ')
+_AXIS_NAME = struct.Struct('<8s')
+
+
+def step_times(start_ns, intervals):
+    # Scheduled time of each step of a block emitted from start_ns on
+    periods_ns = np.asarray(intervals, dtype=np.int64) * 2000
+    return start_ns + np.cumsum(periods_ns) - periods_ns
+
+
+def _header_size(axis_count):
+    return _HEADER.size + axis_count * (_AXIS_NAME.size + 8)
+
+
+class StepTrace:
+    """Per-step binary trace, one ring buffer per axis in shared memory.
+
+    Each axis ring has a single writer (its motion process). ``record`` takes
+    a whole block of steps as arrays and stores them with a few vectorised
+    writes, so the step loop never formats anything. ``records`` returns the
+    ring of an axis in time order, ``save`` writes the whole block to a file
+    that ``load`` (or ``python step_trace.py decode``) reads back.
+    """
+
+    def __init__(self, buf, shm=None, owner=False):
+        self._shm = shm
+        self._owner = owner
+        magic, self.capacity, axis_count = _HEADER.unpack_from(buf, 0)
+        if magic != _MAGIC:
+            raise ValueError("Not a step trace")
+        self.axes = tuple(_AXIS_NAME.unpack_from(buf, _HEADER.size + 8 * i)[0].rstrip(b'\0').decode()
+                          for i in range(axis_count))
+        heads_offset = _HEADER.size + _AXIS_NAME.size * axis_count
+        self._heads = np.ndarray((axis_count,), dtype='<u8', buffer=buf, offset=heads_offset)
+        self._rings = np.ndarray((axis_count, self.capacity), dtype=TRACE_RECORD, buffer=buf,
+                                 offset=_header_size(axis_count))
+        self._index = {axis: i for i, axis in enumerate(self.axes)}
+        self._buf = buf
+
+    @staticmethod
+    def size(axes=TRACE_AXES, capacity=TRACE_CAPACITY):
+        return _header_size(len(axes)) + len(axes) * capacity * TRACE_RECORD.itemsize
+
+    @classmethod
+    def create(cls, axes=TRACE_AXES, capacity=TRACE_CAPACITY, name=None):
+        size = cls.size(axes, capacity)
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        shm.buf[:_header_size(len(axes))] = bytes(_header_size(len(axes)))
+        _HEADER.pack_into(shm.buf, 0, _MAGIC, capacity, len(axes))
+        for i, axis in enumerate(axes):
+            _AXIS_NAME.pack_into(shm.buf, _HEADER.size + 8 * i, axis.encode())
+        return cls(shm.buf, shm, owner=True)
+
+    @classmethod
+    def attach(cls, name):
+        shm = attach_untracked(name)
+        return cls(shm.buf, shm)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            return cls(bytearray(f.read()))
+
+    @property
+    def name(self):
+        return self._shm.name if self._shm is not None else None
+
+    def __reduce__(self):
+        return (StepTrace.attach, (self._shm.name,))
+
+    def record(self, axis, start_ns, intervals, start_position, direction):
+        # Steps of one block: ``intervals`` (half periods, us) emitted from
+        # start_ns on, moving ``direction`` (+1/-1) away from start_position
+        count = len(intervals)
+        if not count:
+            return
+        index = self._index[axis]
+        times = step_times(start_ns, intervals)
+        positions = start_position + direction * np.arange(1, count + 1, dtype=np.int64)
+        self._store(index, times, positions, intervals, direction)
+
+    def record_ticks(self, start_ns, mask, intervals, axes):
+        # Multi-axis tick block as emitted by PulseOutput.emit_ticks. ``axes``
+        # lists (axis, start_position, direction) per mask column.
+        tick_times = step_times(start_ns, intervals)
+        for column, (axis, start_position, direction) in enumerate(axes):
+            ticks = np.flatnonzero(mask[:, column])
+            if not len(ticks):
+                continue
+            positions = start_position + direction * np.arange(1, len(ticks) + 1, dtype=np.int64)
+            self._store(self._index[axis], tick_times[ticks], positions, np.asarray(intervals)[ticks], direction)
+
+    def _store(self, index, times, positions, intervals, direction):
+        ring = self._rings[index]
+        head = int(self._heads[index])
+        count = len(times)
+        if count > self.capacity:
+            times, positions, intervals = times[-self.capacity:], positions[-self.capacity:], intervals[-self.capacity:]
+            head += count - self.capacity
+            count = self.capacity
+        slots = (head + np.arange(count)) % self.capacity
+        ring['time_ns'][slots] = times
+        ring['position'][slots] = positions
+        ring['interval_us'][slots] = intervals
+        ring['direction'][slots] = direction
+        # Publish after the records are in place
+        self._heads[index] = head + count
+
+    def written(self, axis):
+        return int(self._heads[self._index[axis]])
+
+    def records(self, axis):
+        index = self._index[axis]
+        head = int(self._heads[index])
+        ring = self._rings[index]
+        if head <= self.capacity:
+            return ring[:head].copy()
+        start = head % self.capacity
+        return np.concatenate((ring[start:], ring[:start]))
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            f.write(bytes(self._buf))
+
+    def close(self):
+        if self._shm is None:
+            return
+        # Drop the views before the buffer goes away
+        self._heads = self._rings = self._buf = None
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+
+def decode(trace, axes=None, out=sys.stdout, limit=None):
+    # CSV of the trace, merged across axes in time order
+    axes = axes or trace.axes
+    out.write("time_ns,axis,position,interval_us,direction\n")
+    rows = []
+    for axis in axes:
+        records = trace.records(axis)
+        if limit:
+            records = records[-limit:]
+        rows.extend((int(r['time_ns']), axis, int(r['position']), int(r['interval_us']), int(r['direction']))
+                    for r in records)
+    rows.sort()
+    for row in rows:
+        out.write(",".join(str(value) for value in row) + "\n")
+
+
+def summary(trace, out=sys.stdout):
+    for axis in trace.axes:
+        records = trace.records(axis)
+        written = trace.written(axis)
+        if not len(records):
+            out.write(f"{axis}: no steps\n")
+            continue
+        span_s = (records['time_ns'][-1] - records['time_ns'][0]) / 1e9
+        out.write(f"{axis}: {written} steps written, {len(records)} kept, "
+                  f"{span_s:.3f} s, position {records['position'][0]}..{records['position'][-1]}, "
+                  f"interval {records['interval_us'].min()}..{records['interval_us'].max()} us\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Dump or decode the binary step trace")
+    commands = parser.add_subparsers(dest='command', required=True)
+    dump = commands.add_parser('dump', help="copy a live trace from shared memory to a file")
+    dump.add_argument('name', help="shared memory name of the trace")
+    dump.add_argument('path')
+    for command in ('decode', 'summary'):
+        sub = commands.add_parser(command, help=f"{command} a saved trace file")
+        sub.add_argument('path')
+        sub.add_argument('--live', action='store_true', help="path is a shared memory name")
+        if command == 'decode':
+            sub.add_argument('--axis', action='append', help="only these axes")
+            sub.add_argument('--limit', type=int, help="last N steps per axis")
+    args = parser.parse_args(argv)
+
+    if args.command == 'dump':
+        shm = attach_untracked(args.name)
+        StepTrace(shm.buf, shm).save(args.path)
+        return
+    if args.live:
+        shm = attach_untracked(args.path)
+        trace = StepTrace(shm.buf, shm)
+    else:
+        trace = StepTrace.load(args.path)
+    if args.command == 'decode':
+        decode(trace, args.axis, limit=args.limit)
+    else:
+        summary(trace)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,218 +1,510 @@
 import threading
 import time
-import RPi.GPIO as GPIO
+import numpy as np
 import logging
 from multiprocessing import Process, Manager, Event
-
+from axes import AXIS_DEFAULTS, axis_config, direction_label
+from axis_state import AxisState, HOME
+from motion_profiles import ProfileCache, build_profile
+import calibration_cache
+from calibration_cache import load_axis, store_axis, park, unpark
+from config_store import ConfigStore, DEFAULT_CONFIG
+from hardware import gpio, setup_inputs, setup_outputs
+from limit_switches import LimitSwitches
+from motion_recording import MotionRecorder, MotionRecording, TraceSinks, PAUSE_THRESHOLD_NS
+from pulse_output import create_pulse_output
+from speed_map import SpeedMap, POT_TABLES
+from step_scheduler import precise_sleep_ns
+
+# Records go to whatever the process configured, see log_service
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.INFO)
-formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-
-ch = logging.StreamHandler()
-ch.setLevel(logging.INFO)
-ch.setFormatter(formatter)
-logger.addHandler(ch)
-
-# Suppress GPIO warnings
-GPIO.setwarnings(False)
-GPIO.setmode(GPIO.BCM)
-
-motor_pins = {
-    "X_Dir": 23,
-    "X_Step": 24,
-    "Y_Dir": 27,
-    "Y_Step": 22,
-}
-
-limit_switch_pins = {
-    "X_Left": 10, "X_Right": 9,
-    "Y_Top": 11, "Y_Bottom": 0
-}
-
-direction_descriptions = {
-    "X": {(1, 0): "Right", (0, 1): "Left"},
-    "Y": {(1, 0): "Up", (0, 1): "Down"}
-}
-
-for pin in motor_pins.values():
-    GPIO.setup(pin, GPIO.OUT)
-    GPIO.output(pin, GPIO.LOW)
-for pin in limit_switch_pins.values():
-    GPIO.setup(pin, GPIO.IN, pull_up_down=GPIO.PUD_UP)
-
-def map_value(value, from_low, from_high, to_low, to_high):
-    return to_low + (to_high - to_low) * (value - from_low) / (from_high - from_low)
-
-def sleep(time_value, unit='us'):
-    if unit == 'us':
-        seconds = time_value / 1_000_000.0
-    elif unit == 'ms':
-        seconds = time_value / 1_000.0
-    else:
-        raise ValueError("Invalid unit. Use 'us' for microseconds or 'ms'.")
-    time.sleep(seconds)
+
+# Pins, switches and directions of every axis are in axes.AXES
+
+# Shape of the acceleration ramps used in bounce mode ('trapezoid' or 'scurve')
+PROFILE_SHAPE = 'scurve'
+
+# Pulse output used for stepping ('gpio', 'pigpio' or 'recording')
+PULSE_BACKEND = 'gpio'
+
+# Bounce mode hands the pulse output blocks of at most this much motion: short
+# enough to react to pot and switch changes, long enough to keep it busy
+BLOCK_DURATION_US = 20000
+BLOCK_MAX_STEPS = 2000
+
+# Homing: fast approach until the switch trips, back off, then re-approach at
+# the slow calibration speed so the switch trips at the same point every time
+HOMING_RAMP_STEPS = 50
+HOMING_BACKOFF_STEPS = 40
+
+# Steps handed to the pulse output at a time while homing, the limit switch
+# flag ends a block as soon as the switch trips
+HOMING_BLOCK_STEPS = 200
+
+# Largest difference (in steps) between the touch-off and the parked position
+# in the calibration cache for the cached travel to be used
+TOUCH_OFF_TOLERANCE = 4
 
 def stop_motor(step_pin):
+    GPIO = gpio()
     GPIO.output(step_pin, GPIO.LOW)
 
-def move_motor(dir_pin, step_pin, direction, speed):
-    GPIO.output(dir_pin, GPIO.HIGH if direction[0] else GPIO.LOW)
-    GPIO.output(step_pin, GPIO.HIGH)
-    sleep(speed, 'us')
-    GPIO.output(step_pin, GPIO.LOW)
-    sleep(speed, 'us')
-
-def check_and_correct_position(motor, shared_data):
-    steps = shared_data[f'steps_{motor.lower()}']
-    total_steps = shared_data[f'total_steps_{motor.lower()}']
-    if motor == "X":
-        movement_buffer_left = shared_data.get('MOVEMENT_BUFFER_LEFT', 100)
-        movement_buffer_right = shared_data.get('MOVEMENT_BUFFER_RIGHT', 200)
-        if steps < movement_buffer_left:
-            steps = movement_buffer_left
-            shared_data[f'steps_{motor.lower()}'] = steps
-            logger.info(f"Adjusted {motor} steps to movement_buffer_left: {movement_buffer_left}")
-        elif steps > total_steps - movement_buffer_right:
-            steps = total_steps - movement_buffer_right
-            shared_data[f'steps_{motor.lower()}'] = steps
-            logger.info(f"Adjusted {motor} steps to movement_buffer_right: {total_steps - movement_buffer_right}")
-    elif motor == "Y":
-        movement_buffer_bottom = shared_data.get('MOVEMENT_BUFFER_BOTTOM', 100)
-        movement_buffer_top = shared_data.get('MOVEMENT_BUFFER_TOP', 100)
-        if steps < movement_buffer_bottom:
-            steps = movement_buffer_bottom
-            shared_data[f'steps_{motor.lower()}'] = steps
-            logger.info(f"Adjusted {motor} steps to movement_buffer_bottom: {movement_buffer_bottom}")
-        elif steps > total_steps - movement_buffer_top:
-            steps = total_steps - movement_buffer_top
-            shared_data[f'steps_{motor.lower()}'] = steps
-            logger.info(f"Adjusted {motor} steps to movement_buffer_top: {total_steps - movement_buffer_top}")
-
-def motor_control_thread(motor, shared_data, calibration_event, all_done_event):
-    dir_pin = motor_pins[f"{motor}_Dir"]
-    step_pin = motor_pins[f"{motor}_Step"]
-
-    if motor == "X":
-        limit_pos = limit_switch_pins["X_Right"]
-        limit_neg = limit_switch_pins["X_Left"]
-        calibration_speed = 1000  # Calibration speed for X motor
-    elif motor == "Y":
-        limit_pos = limit_switch_pins["Y_Top"]
-        limit_neg = limit_switch_pins["Y_Bottom"]
-        calibration_speed = 1500  # Calibration speed for Y motor
-
-    def get_acceleration_speed(steps, total_steps, base_speed, max_speed):
-        buffer_distance = shared_data.get('ACCELERATION_BUFFER', 20)  # Default to 20 if not set
-        if steps < buffer_distance:
-            # Accelerate
-            speed = base_speed + ((max_speed - base_speed) * (steps / buffer_distance))
-        elif steps > total_steps - buffer_distance:
-            # Decelerate
-            speed = base_speed + ((max_speed - base_speed) * ((total_steps - steps) / buffer_distance))
-        else:
-            # Maintain max speed
-            speed = max_speed
-        return int(speed)
+def check_and_correct_position(motor, axis, config):
+    # Only ``axis``, the loop's own position, is corrected; it is published
+    # with the next block
+    buffer_low, buffer_high = axis_buffers(axis_settings(motor), config)
+    if axis.steps < buffer_low:
+        axis.steps = buffer_low
+        logger.info(f"Adjusted {motor} steps to the {direction_label(motor, (0, 1))} buffer: {buffer_low}")
+    elif axis.steps > axis.total_steps - buffer_high:
+        axis.steps = axis.total_steps - buffer_high
+        logger.info(f"Adjusted {motor} steps to the {direction_label(motor, (1, 0))} buffer: {axis.steps}")
+
+def plan_block(profile, steps, buffer_low, buffer_high, total_steps, direction):
+    # Intervals for the next block of steps from the current position, stopping
+    # at the buffer limit in the direction of travel
+    index = steps - buffer_low
+    if direction == (1, 0):
+        remaining = min(total_steps - buffer_high - steps, BLOCK_MAX_STEPS)
+        block = profile[index:index + max(remaining, 0)]
+    else:
+        remaining = min(steps - buffer_low, BLOCK_MAX_STEPS)
+        block = profile[index - remaining + 1:index + 1][::-1] if remaining > 0 else profile[:0]
+    if len(block):
+        block_time = np.cumsum(block) * 2
+        block = block[:int(np.searchsorted(block_time, BLOCK_DURATION_US)) + 1]
+    return block
+
+def axis_settings(motor, config=None):
+    # Pins, limit switches, speeds and buffer keys of one axis from the axis
+    # table. The speeds the config store has come from ``config`` (a
+    # MotionConfig snapshot) or its defaults.
+    settings = dict(AXIS_DEFAULTS, **axis_config(motor))
+    speeds = DEFAULT_CONFIG if config is None else config._asdict()
+    settings['calibration_speed'] = speeds.get(f'CALIBRATION_SPEED_{motor}', settings['calibration_speed'])
+    settings['homing_speed'] = speeds.get(f'HOMING_SPEED_{motor}', settings['homing_speed'])
+    return settings
+
+def axis_buffers(settings, config):
+    # (low, high) buffer of an axis in steps, from ``config`` where it has keys for them
+    low_key, high_key = settings['buffer_low_key'], settings['buffer_high_key']
+    return (getattr(config, low_key) if low_key else settings['buffer_low'],
+            getattr(config, high_key) if high_key else settings['buffer_high'])
+
+def init_axis_hardware(motor, on_trip=None):
+    # Pins of one axis, set up by the process that drives it. Returns the
+    # axis' LimitSwitches, whose flags the step loops hand to the pulse output.
+    settings = axis_settings(motor)
+    setup_outputs(settings['dir_pin'], settings['step_pin'])
+    setup_inputs(settings['limit_neg'], settings['limit_pos'])
+    return LimitSwitches(settings['limit_neg'], settings['limit_pos'], on_trip=on_trip)
+
+def step_until_switch(limits, pulse_output, dir_pin, step_pin, direction, ramp, interval):
+    # Step toward the switch ahead until its flag trips, through ``ramp``
+    # first and then at ``interval``. Returns the number of steps made.
+    stop = limits.stop_flag(direction)
+    # Outputs that clock the pulses out on their own (pigpio) cannot tell how
+    # many steps were made before a trip, they get one step at a time
+    chunk = HOMING_BLOCK_STEPS if pulse_output.software_timed else 1
+    steps = 0
+    while not stop[0]:
+        block = list(ramp[steps:steps + chunk])
+        block += [interval] * (chunk - len(block))
+        steps += pulse_output.emit(dir_pin, step_pin, direction, block, stop)
+        pulse_output.wait()
+    return steps
+
+def home_to_switch(motor, limits, toward, pulse_output, config=None):
+    """Fast approach, back-off and slow re-approach of one limit switch.
+
+    Returns the distance in steps from the starting point to where the switch
+    trips on the slow approach.
+    """
+    settings = axis_settings(motor, config)
+    dir_pin = settings['dir_pin']
+    step_pin = settings['step_pin']
+    slow = settings['calibration_speed']
+    away = (0, 1) if toward == (1, 0) else (1, 0)
+    ramp = build_profile(2 * HOMING_RAMP_STEPS, slow, settings['homing_speed'], HOMING_RAMP_STEPS)[:HOMING_RAMP_STEPS]
+
+    fast_steps = step_until_switch(limits, pulse_output, dir_pin, step_pin, toward, ramp, settings['homing_speed'])
+
+    # Back off until the switch has opened again. The other switch can still
+    # be latched from homing against it, so these steps take no stop flag.
+    released = 0
+    backoff = [slow] * HOMING_BACKOFF_STEPS
+    while True:
+        released += pulse_output.emit(dir_pin, step_pin, away, backoff)
+        pulse_output.wait()
+        if limits.clear(limits.side(toward)):
+            break
+
+    slow_steps = step_until_switch(limits, pulse_output, dir_pin, step_pin, toward, (), slow)
+    return fast_steps - released + slow_steps
+
+def move_steps(motor, pulse_output, direction, steps, stop=None, config=None):
+    # Ramped move of ``steps`` between the calibration and homing speeds,
+    # returns the number of steps made before ``stop`` tripped
+    if steps <= 0:
+        return 0
+    settings = axis_settings(motor, config)
+    profile = build_profile(steps, settings['calibration_speed'], settings['homing_speed'], HOMING_RAMP_STEPS)
+    moved = pulse_output.emit(settings['dir_pin'], settings['step_pin'], direction, profile[1:], stop)
+    pulse_output.wait()
+    return moved
+
+def replay_axis(motor, axis, pulse_output, limits, recording, speed=1.0, config=None, step_trace=None):
+    """Step ``motor`` through its steps in ``recording`` (a MotionRecording).
+
+    The axis first moves to where the recording starts. Runs of steps in one
+    direction are emitted with their recorded intervals divided by ``speed``,
+    and a gap of more than PAUSE_THRESHOLD_NS between two steps is waited out
+    as a pause. The recording is read one block at a time from its mapping.
+    A limit switch trip ends the replay. Returns the number of steps replayed.
+    """
+    if motor not in recording.axes:
+        logger.warning(f"{recording.path} has no steps of {motor}")
+        return 0
+    settings = axis_settings(motor, config)
+    replayed = 0
+    previous_ns = previous_direction = None
+    previous_period = 0
+    for columns in recording.blocks(motor):
+        times = columns['time_ns']
+        if not len(times):
+            continue
+        directions = columns['direction']
+        if previous_ns is None:
+            start = int(columns['position'][0]) - int(directions[0])
+            toward = (1, 0) if start > axis.steps else (0, 1)
+            limits.leaving(toward)
+            moved = move_steps(motor, pulse_output, toward, abs(start - axis.steps), limits.stop_flag(toward), config)
+            axis.advance(moved if toward == (1, 0) else -moved, 0, toward)
+            if limits.tripped(toward):
+                recover_from_switch(motor, axis, pulse_output, limits, toward, config)
+                return replayed
+            previous_ns, previous_direction = int(times[0]), int(directions[0])
+
+        recorded = columns['interval_us'].astype(np.int64)
+        intervals = np.maximum(np.rint(recorded / speed), 1).astype(np.int64)
+        # Time between two steps beyond the step period before it
+        periods = np.concatenate(([previous_period], recorded[:-1] * 2000))
+        pauses = np.diff(times, prepend=previous_ns) - periods
+        turns = directions != np.concatenate(([previous_direction], directions[:-1]))
+        starts = np.flatnonzero(turns | (pauses > PAUSE_THRESHOLD_NS)).tolist()
+        previous_ns, previous_direction, previous_period = int(times[-1]), int(directions[-1]), int(recorded[-1]) * 2000
+
+        for run_start, run_end in zip([0] + starts, starts + [len(times)]):
+            if run_start == run_end:
+                continue
+            if pauses[run_start] > PAUSE_THRESHOLD_NS:
+                pulse_output.wait()
+                precise_sleep_ns(int(pauses[run_start] / speed))
+            sign = int(directions[run_start])
+            direction = (1, 0) if sign > 0 else (0, 1)
+            limits.leaving(direction)
+            stop = limits.stop_flag(direction)
+            for block_start in range(run_start, run_end, BLOCK_MAX_STEPS):
+                block = intervals[block_start:min(block_start + BLOCK_MAX_STEPS, run_end)]
+                start_ns = time.monotonic_ns()
+                emitted = pulse_output.emit(settings['dir_pin'], settings['step_pin'], direction, block, stop)
+                if step_trace is not None:
+                    step_trace.record(motor, start_ns, block[:emitted], axis.steps, sign)
+                axis.advance(sign * emitted, int(block[-1]), direction)
+                replayed += emitted
+                if stop[0]:
+                    logger.warning(f"{motor} replay ended by the limit switch after {replayed} steps")
+                    recover_from_switch(motor, axis, pulse_output, limits, direction, config)
+                    return replayed
+    pulse_output.wait()
+    return replayed
+
+def rezero_at_switch(motor, shared_data, direction, steps):
+    # A limit switch tripped at ``steps`` while moving ``direction``. The
+    # switch is where calibration put 0 (negative) or total_steps (positive),
+    # so the position is known again on the spot. Returns that position.
+    key = motor.lower()
+    position = shared_data[f'total_steps_{key}'] if direction == (1, 0) else 0
+    side = direction_label(motor, direction)
+    logger.warning(f"{motor} {side} limit switch tripped at step {steps}. Re-zeroing at {position}.")
+    shared_data.update({f'steps_{key}': position, f'last_limit_{key}': side})
+    return position
+
+def recover_from_switch(motor, axis, pulse_output, limits, direction, config):
+    """Re-zero after a trip in bounce mode and move back to the buffer edge.
+
+    Returns the new direction of travel, away from the switch.
+    """
+    settings = axis_settings(motor, config)
+    pulse_output.wait()
+    position = rezero_at_switch(motor, axis.shared_data, direction, axis.steps)
+    axis.reset(position, axis.total_steps)
+    buffer_low, buffer_high = axis_buffers(settings, config)
+    if direction == (1, 0):
+        away, target = (0, 1), position - buffer_high
+    else:
+        away, target = (1, 0), buffer_low
+    axis.reverse(away)
+    moved = move_steps(motor, pulse_output, away, abs(target - position), limits.stop_flag(away), config)
+    axis.steps += moved if away == (1, 0) else -moved
+    axis.publish(force=True)
+    return away
+
+def calibrate_axis(motor, shared_data, pulse_output, limits, cache_file=None, config=None):
+    key = motor.lower()
+
+    logger.info(f"Calibrating {motor} motor...")
+    shared_data[f'calibrating_{key}'] = True
+    # A park/unpark still queued would land after this calibration's entry
+    calibration_cache.flush()
+    cached = load_axis(motor, cache_file)
+
+    # Touch off against the negative limit switch, this is the zero either way
+    shared_data[f'dir_{key}'] = (0, 1)
+    distance = home_to_switch(motor, limits, (0, 1), pulse_output, config)
+    shared_data[f'steps_{key}'] = 0
+
+    parked = cached.get('position') if cached else None
+    if parked is not None and cached.get('total_steps') and abs(distance - parked) <= TOUCH_OFF_TOLERANCE:
+        # The axis was where the cache left it, so the travel is still valid
+        total_steps = cached['total_steps']
+        position = 0
+        logger.info(f"{motor} touch-off at {distance} steps matches the calibration cache ({parked})")
+    else:
+        if cached:
+            logger.info(f"{motor} touch-off at {distance} steps, cache expected {parked}. Measuring the travel.")
+        # Measure the travel up to the positive limit switch
+        shared_data[f'dir_{key}'] = (1, 0)
+        total_steps = home_to_switch(motor, limits, (1, 0), pulse_output, config)
+        position = total_steps
+        shared_data[f'steps_{key}'] = total_steps
+    shared_data[f'total_steps_{key}'] = total_steps
+
+    # Move to the center position
+    half_steps = total_steps // 2
+    if position > half_steps:
+        shared_data[f'dir_{key}'] = (0, 1)
+        move_steps(motor, pulse_output, (0, 1), position - half_steps, config=config)
+    else:
+        shared_data[f'dir_{key}'] = (1, 0)
+        move_steps(motor, pulse_output, (1, 0), half_steps - position, config=config)
+    shared_data[f'steps_{key}'] = half_steps
+    limits.rearm()
+    store_axis(motor, cache_file, total_steps=total_steps, position=half_steps)
+
+    logger.info(f"{motor} motor calibration complete. Total steps: {total_steps}")
+
+    # Set canvas frame after calibration
+    canvas_key = axis_settings(motor)['canvas_key']
+    if canvas_key:
+        shared_data[canvas_key] = total_steps
+    return total_steps
+
+class BounceAxis:
+    """Bounce mode of one axis, one block at a time.
+
+    ``next_block`` applies pending commands, follows the axis' switch and pot
+    and returns the next block as (direction, intervals, stop flag), or None
+    while the axis holds still. Whoever emits the block reports the steps it
+    made with ``block_done``: motor_control_thread through its own pulse
+    output, multi_axis interleaved with the other axes on one deadline heap.
+    ``pulse_output`` only makes the blocking moves (homing, trip recovery).
+    """
+
+    def __init__(self, motor, shared_data, axis, pulse_output, limits, config_store, speed_map, step_trace=None,
+                 state_access=None):
+        self.motor = motor
+        self.shared_data = shared_data
+        self.axis = axis
+        self.pulse_output = pulse_output
+        self.limits = limits
+        self.config_store = config_store
+        self.speed_map = speed_map
+        self.step_trace = step_trace
+        self.state_access = state_access
+        self.settings = axis_settings(motor)
+        self.speed_table = POT_TABLES[self.settings['pot']]
+        self.scheduler = getattr(pulse_output, 'scheduler', None)
+        # Speed profiles are built once per bounce segment and only indexed per step
+        self.profile_cache = ProfileCache(shape=PROFILE_SHAPE)
+        self.direction = (1, 0)
+        self.initial_direction_set = False  # Flag to indicate if the initial direction has been set
+        self.parked = True  # calibrate_axis cached the center position
+        self.config = None
+        self.buffer_low = self.buffer_high = 0
+        self.block = None
+        self.stop = bytes(1)  # Stop flag of the current block, this one never trips
+        self.steps = 0
+        self.start_ns = 0
+        self.access_ns = 0
+
+    def next_block(self):
+        motor, axis = self.motor, self.axis
+        # Commands are applied here, between two blocks
+        for command in axis.pending_commands():
+            if command == HOME:
+                self.pulse_output.wait()
+                total_steps = calibrate_axis(motor, self.shared_data, self.pulse_output, self.limits,
+                                             config=self.config_store.current())
+                axis.reset(total_steps // 2, total_steps)
+                self.shared_data[f'calibrating_{motor.lower()}'] = False
+                self.initial_direction_set = False
+                self.parked = True
+            else:
+                logger.warning(f"{motor} ignoring unknown command {command!r}")
+
+        switch_state = self.shared_data[self.settings['switch']]
+        if switch_state == (0, 0):  # Middle position, stop the motor
+            self.pulse_output.wait()
+            stop_motor(self.settings['step_pin'])
+            axis.stop()
+            self.initial_direction_set = False  # Reset the flag if in the middle position
+            if not self.parked:
+                # At rest, the next boot can touch off against this position
+                park(motor, axis.steps)
+                self.parked = True
+            return None
+        if self.parked:
+            unpark(motor)
+            self.parked = False
+        if not self.initial_direction_set:
+            if switch_state == (0, 1):  # Move left/down
+                self.direction = (0, 1)
+            elif switch_state == (1, 0):  # Move right/up
+                self.direction = (1, 0)
+            self.initial_direction_set = True  # Set the flag to indicate the initial direction has been set
+
+        # Settings are decoded again only when a new version was published
+        config = self.config_store.current()
+        if self.config is None or config.version != self.config.version:
+            self.profile_cache.check_version(config.version)
+            self.buffer_low, self.buffer_high = axis_buffers(self.settings, config)
+        self.config = config
+
+        check_and_correct_position(motor, axis, config)
+        block = self._plan()
+        if not len(block):
+            self.direction = (0, 1) if self.direction == (1, 0) else (1, 0)
+            side = "positive" if self.direction == (0, 1) else "negative"
+            logger.info(f"{motor} motor near {side} limit. Reversing direction.")
+            axis.reverse(self.direction)
+            if self.scheduler is not None and logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"{motor} step lateness: {self.scheduler.stats()}")
+            if axis.total_steps - self.buffer_high <= self.buffer_low:
+                return None  # No room to move between the buffers
+            block = self._plan()
+            if not len(block):
+                return None
+
+        # The switch ahead ends the block within one step if it trips
+        self.limits.leaving(self.direction)
+        self.block = block
+        self.stop = self.limits.stop_flag(self.direction)
+        self.steps = axis.steps
+        self.start_ns = time.monotonic_ns()
+        return self.direction, block, self.stop
+
+    def _plan(self):
+        access_start = time.perf_counter_ns()
+        pot_value = self.shared_data[self.settings['pot']]
+        self.access_ns = time.perf_counter_ns() - access_start
+        base_interval = self.speed_map.lookup(self.speed_table, pot_value)
+        profile = self.profile_cache.get(self.axis.total_steps, self.buffer_low, self.buffer_high, base_interval,
+                                         self.config.ACCELERATION_BUFFER)
+        return plan_block(profile, self.axis.steps, self.buffer_low, self.buffer_high, self.axis.total_steps,
+                          self.direction)
+
+    def block_done(self, emitted):
+        block, direction = self.block, self.direction
+        if block is None:
+            return  # No block was handed out yet
+        sign = 1 if direction == (1, 0) else -1
+        access_start = time.perf_counter_ns()
+        self.axis.advance(sign * emitted, int(block[-1]), direction)
+        if self.state_access is not None:
+            self.state_access.record(self.access_ns + time.perf_counter_ns() - access_start)
+        # Per-step record of the block, binary only, nothing is formatted here
+        if self.step_trace is not None:
+            self.step_trace.record(self.motor, self.start_ns, block[:emitted], self.steps, sign)
+        if self.stop[0]:
+            # Steps were lost somewhere, the switch says where the axis is
+            self.direction = recover_from_switch(self.motor, self.axis, self.pulse_output, self.limits, direction,
+                                                 self.config)
+
+def motor_control_thread(motor, shared_data, calibration_event, all_done_event, pulse_backend=PULSE_BACKEND,
+                         step_trace=None, metrics=None, config=None, commands=None, record_path=None,
+                         replay_path=None, replay_speed=1.0, speed_map=None):
+    # ``config`` is the ConfigStore main_script publishes settings through,
+    # ``speed_map`` its pot to interval tables and ``commands`` the Queue
+    # other processes send this axis commands on.
+    # Steps are recorded to ``record_path``, and ``replay_path`` is a
+    # recording replayed at ``replay_speed`` before bounce mode starts.
+    config_store = config if config is not None else ConfigStore.local()
+    speed_map = speed_map if speed_map is not None else SpeedMap.local(config_store.current())
+    axis = AxisState(motor, shared_data, commands)
+    recorder = MotionRecorder(record_path, axes=(motor,)) if record_path else None
+    if recorder is not None:
+        step_trace = TraceSinks(step_trace, recorder)
+    settings = axis_settings(motor)
+    dir_pin = settings['dir_pin']
+    step_pin = settings['step_pin']
+
+    pulse_output = create_pulse_output(pulse_backend, spin_threshold_us=settings['spin_threshold_us'])
+    limits = init_axis_hardware(motor, on_trip=pulse_output.halt)
+    scheduler = getattr(pulse_output, 'scheduler', None)
+    state_access = None
+    if metrics is not None:
+        state_access = metrics.get(f'state_access_motor_{motor.lower()}')
+        if scheduler is not None:
+            scheduler.lateness_histogram = metrics.get(f'step_lateness_{motor.lower()}')
+            scheduler.interval_error_histogram = metrics.get(f'step_interval_error_{motor.lower()}')
 
     try:
-        logger.info(f"Calibrating {motor} motor...")
-        shared_data[f'calibrating_{motor.lower()}'] = True
-
-        # Calibrate to negative limit switch
-        while GPIO.input(limit_neg):
-            move_motor(dir_pin, step_pin, (0, 1), calibration_speed)
-            shared_data[f'dir_{motor.lower()}'] = (0, 1)
-
-        shared_data[f'steps_{motor.lower()}'] = 0
-        
-        # Calibrate to positive limit switch and count steps
-        while GPIO.input(limit_pos):
-            move_motor(dir_pin, step_pin, (1, 0), calibration_speed)
-            shared_data[f'dir_{motor.lower()}'] = (1, 0)
-            shared_data[f'steps_{motor.lower()}'] += 1
-        
-        total_steps = shared_data[f'steps_{motor.lower()}']
-        shared_data[f'total_steps_{motor.lower()}'] = total_steps
-
-        # Move to the center position
-        half_steps = total_steps // 2
-        for _ in range(half_steps):
-            move_motor(dir_pin, step_pin, (0, 1), calibration_speed)
-            shared_data[f'dir_{motor.lower()}'] = (0, 1)
-            shared_data[f'steps_{motor.lower()}'] -= 1
-        
-        logger.info(f"{motor} motor calibration complete. Total steps: {total_steps}")
-
-        # Set canvas frame after calibration
-        if motor == "X":
-            shared_data['CANVAS_FRAME_X'] = total_steps
-        elif motor == "Y":
-            shared_data['CANVAS_FRAME_Y'] = total_steps
+        total_steps = calibrate_axis(motor, shared_data, pulse_output, limits, config=config_store.current())
+        axis.reset(total_steps // 2, total_steps)
 
         shared_data[f'calibrating_{motor.lower()}'] = False
         calibration_event.set()
         all_done_event.wait()
 
         # Bounce mode using memory and buffer
-        direction = (1, 0)
-        initial_direction_set = False  # Flag to indicate if the initial direction has been set
+        bounce = BounceAxis(motor, shared_data, axis, pulse_output, limits, config_store, speed_map, step_trace,
+                            state_access)
+
+        if replay_path:
+            unpark(motor)
+            bounce.parked = False
+            recording = MotionRecording(replay_path)
+            logger.info(f"{motor} replaying {replay_path} at {replay_speed}x")
+            replayed = replay_axis(motor, axis, pulse_output, limits, recording, replay_speed,
+                                   config_store.current(), step_trace)
+            recording.close()
+            axis.stop()
+            logger.info(f"{motor} replayed {replayed} steps")
 
         while True:
-            switch_state = shared_data[f'switch_{motor.lower()}']
-            if switch_state == (0, 0):  # Middle position, stop the motor
-                stop_motor(step_pin)
-                shared_data[f'{motor}_speed'] = 0
-                shared_data[f'dir_{motor.lower()}'] = (0, 0)
-                initial_direction_set = False  # Reset the flag if in the middle position
-            else:
-                if not initial_direction_set:
-                    if switch_state == (0, 1):  # Move left/down
-                        direction = (0, 1)
-                    elif switch_state == (1, 0):  # Move right/up
-                        direction = (1, 0)
-                    initial_direction_set = True  # Set the flag to indicate the initial direction has been set
-
-                pot_value = shared_data[f'pot_{motor.lower()}']
-                base_speed = map_value(pot_value, 300, 65535, 500000, 250)  # Example base speed range
-                max_speed = base_speed / 2  # Example max speed range
-                steps = shared_data[f'steps_{motor.lower()}']
-                total_steps = shared_data[f'total_steps_{motor.lower()}']
-
-                check_and_correct_position(motor, shared_data)
-
-                speed = get_acceleration_speed(steps, total_steps, base_speed, max_speed)
-                shared_data[f'{motor}_speed'] = speed  # Update shared data with the current speed
-
-                if direction == (1, 0) and steps >= total_steps - shared_data.get('MOVEMENT_BUFFER_RIGHT', 200):
-                    logger.info(f"{motor} motor near positive limit. Reversing direction.")
-                    direction = (0, 1)
-                    shared_data[f'dir_{motor.lower()}'] = direction
-                elif direction == (0, 1) and steps <= shared_data.get('MOVEMENT_BUFFER_LEFT', 100):
-                    logger.info(f"{motor} motor near negative limit. Reversing direction.")
-                    direction = (1, 0)
-                    shared_data[f'dir_{motor.lower()}'] = direction
-
-                move_motor(dir_pin, step_pin, direction, speed)
-
-                if direction == (1, 0):
-                    shared_data[f'steps_{motor.lower()}'] += 1
-                else:
-                    shared_data[f'steps_{motor.lower()}'] -= 1
-
-                # Update the direction in the shared data
-                shared_data[f'dir_{motor.lower()}'] = direction
-
-                logger.info(f"{motor} motor direction after move: {direction}, steps after move: {shared_data[f'steps_{motor.lower()}']}")
-
-            # Reduce sleep time to improve response time
-            time.sleep(0.01)  # Adjust as necessary
+            block = bounce.next_block()
+            if block is None:
+                time.sleep(0.01)
+                continue
+            direction, intervals, stop = block
+            bounce.block_done(pulse_output.emit(dir_pin, step_pin, direction, intervals, stop))
 
     except KeyboardInterrupt:
         logger.info(f"Motor control thread for {motor} interrupted")
     except Exception as e:
         logger.error(f"Error in motor_control_thread for motor {motor}: {e}")
+    finally:
+        if scheduler is not None:
+            logger.info(f"{motor} step lateness: {scheduler.stats()}")
+        limits.close()
+        pulse_output.close()
+        if recorder is not None:
+            recorder.close()
+        calibration_cache.flush()
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
     manager = Manager()
     shared_data = manager.dict({
         'pot_x': 0,
@@ -231,10 +523,6 @@ if __name__ == "__main__":
         'calibrating_x': False,
         'calibrating_y': False,
         'mode2': 0,
-        'MOVEMENT_BUFFER_LEFT': 0,
-        'MOVEMENT_BUFFER_RIGHT': 0,
-        'MOVEMENT_BUFFER_TOP': 0,
-        'MOVEMENT_BUFFER_BOTTOM': 160,
         'current_mode': 'y_scale',
         'switch_x': (0, 0),
         'switch_y': (0, 0),
@@ -242,11 +530,22 @@ if __name__ == "__main__":
         'CANVAS_FRAME_Y': 0
     })
 
+    config = ConfigStore.local({
+        'MOVEMENT_BUFFER_LEFT': 0,
+        'MOVEMENT_BUFFER_RIGHT': 0,
+        'MOVEMENT_BUFFER_TOP': 0,
+        'MOVEMENT_BUFFER_BOTTOM': 160,
+    }, mirror=shared_data)
+    speed_map = SpeedMap.local(config.current())
+    config.listeners.append(speed_map.sync)
+
     calibration_event = Event()
     all_done_event = Event()
 
-    x_motor_thread = threading.Thread(target=motor_control_thread, args=("X", shared_data, calibration_event, all_done_event))
-    y_motor_thread = threading.Thread(target=motor_control_thread, args=("Y", shared_data, calibration_event, all_done_event))
+    x_motor_thread = threading.Thread(target=motor_control_thread, args=("X", shared_data, calibration_event, all_done_event),
+                                      kwargs={'config': config, 'speed_map': speed_map})
+    y_motor_thread = threading.Thread(target=motor_control_thread, args=("Y", shared_data, calibration_event, all_done_event),
+                                      kwargs={'config': config, 'speed_map': speed_map})
 
     x_motor_thread.start()
     y_motor_thread.start()
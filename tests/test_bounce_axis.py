@@ -0,0 +1,13 @@
+from axis_state import AxisState
+from config_store import ConfigStore
+from speed_map import SpeedMap
+from stepper_motor_control import BounceAxis
+
+
+def test_block_done_before_the_first_block():
+    config = ConfigStore.local()
+    axis = AxisState('X', {}, None)
+    bounce = BounceAxis('X', {}, axis, None, None, config, SpeedMap.local(config.current()))
+    assert bounce.stop[0] == 0
+    bounce.block_done(0)
+    assert axis.steps == 0
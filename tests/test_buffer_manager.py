@@ -0,0 +1,109 @@
+import time
+from multiprocessing import Pipe, Process
+
+from axis_state import HOME
+from buffer_manager import BufferManager, HOME_HOLD_TIME
+from config_store import ConfigStore
+from shared_state import SharedState
+from step_scheduler import precise_sleep_ns
+
+# Far from total_steps_x, so no detent is clamped and LEFT + RIGHT stays constant
+BUFFERS = {'MOVEMENT_BUFFER_LEFT': 1_000_000, 'MOVEMENT_BUFFER_RIGHT': 1_000_000}
+DETENT_STEPS = 20
+
+
+def count_torn(config, conn, stop):
+    # Stand-in for the motor loop, counts snapshots whose LEFT/RIGHT pair does not add up
+    total = sum(BUFFERS.values())
+    torn = reads = 0
+    while not stop.poll():
+        current = config.current()
+        torn += current.MOVEMENT_BUFFER_LEFT + current.MOVEMENT_BUFFER_RIGHT != total
+        reads += 1
+    conn.send((torn, reads))
+
+
+def x_position_manager(state, config):
+    encoder_state = {}
+    manager = BufferManager(state, encoder_state, config)
+    for _ in range(2):  # 'none' -> 'x_scale' -> 'x_position'
+        encoder_state['last_press_time'] = 0
+        manager.encoder_callback("BUTTON", True)
+    return manager
+
+
+def applied(config):
+    return (config.current().MOVEMENT_BUFFER_LEFT - BUFFERS['MOVEMENT_BUFFER_LEFT']) // DETENT_STEPS
+
+
+def test_first_detent_is_applied_at_once():
+    config = ConfigStore.local(BUFFERS)
+    manager = x_position_manager({'total_steps_x': 10_000_000}, config)
+    manager.encoder_callback("RIGHT")
+    assert applied(config) == 1
+    # The next ones inside the window are merged and follow when it ends
+    for _ in range(5):
+        manager.encoder_callback("RIGHT")
+    assert applied(config) == 1
+    time.sleep(manager.adjust_interval + 0.05)
+    assert applied(config) == 6
+    assert manager.updates == 2
+
+
+def test_1000_detents_per_second_are_all_applied_without_torn_snapshots():
+    state = SharedState.create({'total_steps_x': 10_000_000, 'current_mode': 'none'})
+    config = ConfigStore.create(BUFFERS, name=None, mirror=state)
+    results_in, results_out = Pipe(duplex=False)
+    stop_in, stop_out = Pipe(duplex=False)
+    reader = Process(target=count_torn, args=(config, results_out, stop_in))
+    reader.start()
+    try:
+        manager = x_position_manager(state, config)
+        start_ns = time.monotonic_ns()
+        for i in range(1000):
+            delay = start_ns + i * 1_000_000 - time.monotonic_ns()
+            if delay > 0:
+                precise_sleep_ns(delay)
+            manager.encoder_callback("RIGHT")
+        time.sleep(manager.adjust_interval + 0.1)
+        stop_out.send(None)
+        torn, reads = results_in.recv()
+        reader.join()
+        assert applied(config) == 1000
+        assert torn == 0 and reads > 1000
+        # Merged, not one snapshot per detent
+        assert manager.updates < 200
+    finally:
+        if reader.is_alive():
+            reader.terminate()
+        config.close()
+        state.close()
+
+
+class FakeCommands(dict):
+    # Motor -> list standing in for its command Queue
+    def __init__(self):
+        super().__init__(X=self.Queue(), Y=self.Queue())
+
+    class Queue(list):
+        def put(self, command):
+            self.append(command)
+
+
+def test_only_a_long_press_of_encoder_2_rehomes():
+    commands = FakeCommands()
+    encoder_state = {}
+    manager = BufferManager({}, encoder_state, ConfigStore.local(BUFFERS), axis_commands=commands)
+
+    encoder_state['last_press_time_2'] = 0
+    manager.encoder_callback_2("BUTTON", True)
+    manager.encoder_callback_2("BUTTON", False)
+    manager.encoder_callback_2("RIGHT")
+    assert commands == {'X': [], 'Y': []}
+
+    encoder_state['last_press_time_2'] = 0
+    manager.encoder_callback_2("BUTTON", True)
+    # Pressed HOME_HOLD_TIME ago
+    encoder_state['last_press_time_2'] -= HOME_HOLD_TIME
+    manager.encoder_callback_2("BUTTON", False)
+    assert commands == {'X': [HOME], 'Y': [HOME]}
@@ -0,0 +1,29 @@
+import time
+
+import calibration_cache
+
+
+def test_park_returns_before_the_write_and_flush_lands_it(tmp_path, monkeypatch):
+    path = str(tmp_path / 'calibration.json')
+    writes = []
+    store_axis = calibration_cache.store_axis
+
+    def slow_store(axis, path=None, **fields):
+        time.sleep(0.2)
+        writes.append(fields)
+        store_axis(axis, path, **fields)
+
+    monkeypatch.setattr(calibration_cache, 'store_axis', slow_store)
+    start = time.perf_counter()
+    calibration_cache.park('X', 1234, path)
+    assert time.perf_counter() - start < 0.05
+    calibration_cache.flush()
+    assert calibration_cache.load_axis('X', path)['position'] == 1234
+
+    # A toggle queued behind a write still in progress is merged into one write
+    calibration_cache.unpark('X', path)
+    calibration_cache.park('X', 10, path)
+    calibration_cache.unpark('X', path)
+    calibration_cache.flush()
+    assert calibration_cache.load_axis('X', path)['position'] is None
+    assert len(writes) <= 3
@@ -0,0 +1,56 @@
+from config_store import ConfigStore
+from coordinated_motion import run_pattern, pot_feed, MOTORS
+from pulse_output import RecordingPulseOutput
+from speed_map import SpeedMap
+from stepper_motor_control import axis_settings
+
+STATE = {
+    'total_steps_x': 4000, 'total_steps_y': 4000,
+    'MOVEMENT_BUFFER_LEFT': 100, 'MOVEMENT_BUFFER_RIGHT': 100,
+    'MOVEMENT_BUFFER_TOP': 100, 'MOVEMENT_BUFFER_BOTTOM': 100,
+    'ACCELERATION_BUFFER': 20,
+}
+
+
+class SwitchesOffAfter(dict):
+    """Shared state stand-in whose switches go to the middle after ``reads`` snapshots."""
+
+    def __init__(self, reads, **fields):
+        super().__init__(**fields)
+        self.reads = reads
+
+    def copy(self):
+        self.reads -= 1
+        if self.reads <= 0:
+            self.update(switch_x=(0, 0), switch_y=(0, 0))
+        return dict(self)
+
+
+def pattern_tick_rate(pot_value):
+    # Ticks per second of the lissajous pattern with the pot at ``pot_value``
+    config = ConfigStore.local(STATE)
+    speed_map = SpeedMap.local(config.current())
+    shared_data = SwitchesOffAfter(40, mode=1, mode2=1, switch_x=(1, 0), switch_y=(1, 0), pot_x=pot_value,
+                                   total_steps_x=4000, total_steps_y=4000, steps_x=2000, steps_y=2000)
+    pulse_output = RecordingPulseOutput()
+    ticks = []
+    emit_ticks = pulse_output.emit_ticks
+
+    def counting(axes, step_mask, intervals, stops=None):
+        ticks.append(len(intervals))
+        return emit_ticks(axes, step_mask, intervals, stops)
+
+    pulse_output.emit_ticks = counting
+    settings = {motor: axis_settings(motor) for motor in MOTORS}
+    run_pattern('lissajous', 1, shared_data, config, speed_map, pulse_output, settings, [2000, 2000])
+    feed = pot_feed(speed_map.current().interval('X', pot_value))
+    return sum(ticks) / (pulse_output.total_time_us / 1e6), feed
+
+
+def test_slow_pot_gives_slow_pattern():
+    slow_rate, slow_feed = pattern_tick_rate(8000)
+    fast_rate, fast_feed = pattern_tick_rate(65535)
+    assert slow_feed < 50
+    # A tick moves one step on the major axis, at most the path length
+    assert slow_feed / 1.5 <= slow_rate <= slow_feed * 1.05
+    assert slow_rate < fast_rate / 50
@@ -0,0 +1,64 @@
+import time
+
+import pytest
+
+from config_store import ConfigStore
+from coordinated_motion import run_job, MOTORS
+from job_stream import GCodeParser, JobStreamer, DEFAULT_FEED, RING_MOVES
+from motion_planner import planner_limits
+from pulse_output import RecordingPulseOutput
+from stepper_motor_control import axis_settings
+
+STATE = {
+    'total_steps_x': 4000, 'total_steps_y': 4000,
+    'MOVEMENT_BUFFER_LEFT': 100, 'MOVEMENT_BUFFER_RIGHT': 100,
+    'MOVEMENT_BUFFER_TOP': 100, 'MOVEMENT_BUFFER_BOTTOM': 100,
+    'ACCELERATION_BUFFER': 20,
+}
+
+
+def run_gcode(tmp_path, gcode, start, realtime=False):
+    # (seconds of step time, run_job's result, streamer) for one G-code job
+    path = tmp_path / 'job.gcode'
+    path.write_text(gcode)
+    config = ConfigStore.local(STATE)
+    shared_data = {key: value for key, value in STATE.items() if key.startswith('total_steps')}
+    settings = {motor: axis_settings(motor) for motor in MOTORS}
+    pulse_output = RecordingPulseOutput(realtime=realtime, max_steps=1000)
+    streamer = JobStreamer(str(path)).start()
+    # As in coordinated_motion_process, a job is run once it is ready
+    while not streamer.ready():
+        time.sleep(0.01)
+    try:
+        result = run_job(streamer, shared_data, config, pulse_output, settings, list(start))
+    finally:
+        streamer.stop()
+    return pulse_output.total_time_us / 1e6, result, streamer
+
+
+@pytest.mark.parametrize('feed', [60, 600, 6000, 60000])
+def test_job_runs_at_its_feed(tmp_path, feed):
+    # 1000 steps at F steps/min, the ramps are a few steps at this acceleration
+    seconds, (moves, clamped, _), _ = run_gcode(tmp_path, f"G90\nG1 F{feed} X1500 Y500\nM2\n", (500, 500))
+    assert (moves, clamped) == (1, 0)
+    assert seconds == pytest.approx(1000 / (feed / 60), rel=0.02)
+
+
+def test_g1_before_the_first_feed_uses_the_default():
+    parser = GCodeParser()
+    rows = parser.parse(b"G1 X10\nF0 X20\nF120 X30\n")
+    assert [row[2] for row in rows] == [DEFAULT_FEED / 60, DEFAULT_FEED / 60, 2.0]
+
+
+def test_ring_keeps_up_at_the_top_feed(tmp_path):
+    # A second of 4-step moves at the top feed, there and back, with the step loop timed like hardware
+    _, _, max_speed = planner_limits(STATE)
+    chords = int(max_speed / 4)
+    xs = [500 + 4 * min(i, chords - i) for i in range(1, chords + 1)]
+    gcode = f"G90\nG1 F{max_speed * 60:.0f}\n" + "".join(f"X{x}\n" for x in xs) + "M2\n"
+    seconds, (moves, clamped, starved), streamer = run_gcode(tmp_path, gcode, (500, 500), realtime=True)
+    assert (moves, clamped) == (chords, 0)
+    assert starved == 0 and streamer.ring.underruns == 0
+    assert streamer.ring.low_water > 0
+    assert streamer.ring.count <= RING_MOVES
+    assert seconds == pytest.approx(1.0, rel=0.1)
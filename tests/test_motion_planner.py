@@ -0,0 +1,74 @@
+import math
+
+import pytest
+
+from motion_planner import MotionPlanner, planner_limits, movement_window
+
+STATE = {
+    'total_steps_x': 4000, 'total_steps_y': 4000,
+    'MOVEMENT_BUFFER_LEFT': 100, 'MOVEMENT_BUFFER_RIGHT': 100,
+    'MOVEMENT_BUFFER_TOP': 100, 'MOVEMENT_BUFFER_BOTTOM': 100,
+    'ACCELERATION_BUFFER': 20,
+}
+
+
+def circle(chords):
+    return [(2000 + 1500 * math.cos(2 * math.pi * i / chords), 2000 + 1500 * math.sin(2 * math.pi * i / chords))
+            for i in range(chords + 1)]
+
+
+def planner(lookahead=16, position=(100, 100)):
+    acceleration, min_speed, max_speed = planner_limits(STATE)
+    return MotionPlanner(acceleration, min_speed, max_speed, movement_window(STATE), position, lookahead=lookahead)
+
+
+def job_seconds(points, lookahead, feed=None):
+    motion = planner(lookahead, points[0])
+    feed = feed or motion.max_speed
+    total = 0
+    for x, y in points[1:]:
+        if motion.full:
+            total += motion.pop().duration_us()
+        motion.add_line(x, y, feed)
+    while len(motion):
+        total += motion.pop().duration_us()
+    return total / 1e6
+
+
+def test_slow_feed_runs_as_commanded():
+    motion = planner()
+    motion.add_line(1100, 100, 100)
+    assert motion.pop().duration_us() / 1e6 == pytest.approx(10.0, rel=0.01)
+
+
+def test_feed_is_capped_at_max_speed():
+    motion = planner()
+    motion.add_line(3100, 100, 10 * motion.max_speed)
+    seconds = motion.pop().duration_us() / 1e6
+    assert seconds >= 3000 / motion.max_speed
+    assert seconds == pytest.approx(3000 / motion.max_speed, rel=0.05)
+
+
+def test_feed_must_be_positive():
+    with pytest.raises(ValueError):
+        planner().add_line(200, 100, 0.0)
+
+
+def test_lookahead_beats_stopping_at_every_vertex():
+    points = circle(360)
+    assert job_seconds(points, 16) < 0.8 * job_seconds(points, 1)
+
+
+def test_lookahead_depth_changes_result():
+    # Chords short enough that stopping from the top speed spans several of them
+    points = circle(2000)
+    depth_2, depth_4, depth_16 = (job_seconds(points, depth) for depth in (2, 4, 16))
+    assert depth_4 < 0.95 * depth_2
+    assert depth_16 < 0.95 * depth_4
+
+
+def test_slow_job_keeps_its_feed():
+    # 100 steps/s along about 9425 steps of circle
+    points = circle(360)
+    path = sum(math.dist(a, b) for a, b in zip(points, points[1:]))
+    assert job_seconds(points, 16, feed=100) == pytest.approx(path / 100, rel=0.02)
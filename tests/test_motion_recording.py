@@ -0,0 +1,39 @@
+import os
+
+import numpy as np
+import pytest
+
+from motion_recording import MotionRecorder, MotionRecording, find_recording, recording_path
+
+
+def write_recording(path, steps):
+    recorder = MotionRecorder(path, axes=("X",))
+    recorder.record("X", 0, np.full(steps, 500, dtype=np.uint32), 0, 1)
+    recorder.close()
+
+
+def test_recording_never_replaces_an_older_one(tmp_path):
+    first = recording_path(str(tmp_path), ("X",))
+    write_recording(first, 10)
+    second = recording_path(str(tmp_path), ("X",))
+    assert second != first
+    write_recording(second, 20)
+    os.utime(first, (0, 0))
+    assert find_recording(str(tmp_path), "X") == second
+    assert len(MotionRecording(first)) == 10
+
+
+def test_recorder_refuses_the_replay_source(tmp_path):
+    path = recording_path(str(tmp_path), ("X",))
+    write_recording(path, 10)
+    replay = MotionRecording(find_recording(str(tmp_path), "X"))
+    with pytest.raises(FileExistsError):
+        MotionRecorder(replay.path, axes=("X",))
+    assert len(replay) == 10
+
+
+def test_axis_recording_before_the_one_of_both_axes(tmp_path):
+    write_recording(recording_path(str(tmp_path), ("X",)), 10)
+    write_recording(recording_path(str(tmp_path), ("X", "Y")), 10)
+    assert os.path.basename(find_recording(str(tmp_path), "X")).startswith("motion-X-")
+    assert os.path.basename(find_recording(str(tmp_path), "Y")).startswith("motion-XY-")
@@ -0,0 +1,104 @@
+import os
+import time
+import select
+from multiprocessing import Process
+
+import pytest
+
+from fake_controller import FakeController
+from serial_protocol import FrameParser, Sample, encode_frame, encode_line
+from shared_state import SharedState
+from speed_map import SpeedMap
+
+SAMPLES = [Sample(1000 * i, 65535 - 1000 * i, (1, 0), (0, 1), i % 3, 1) for i in range(6)]
+
+
+def corrupt(frame):
+    # Same frame with one payload bit flipped, the CRC no longer matches
+    frame = bytearray(frame)
+    frame[6] ^= 0x01
+    return bytes(frame)
+
+
+def read_samples(fd, parser, count, timeout=2.0):
+    samples = []
+    deadline = time.monotonic() + timeout
+    while len(samples) < count and time.monotonic() < deadline:
+        if select.select([fd], [], [], 0.05)[0]:
+            samples += parser.feed(os.read(fd, 4096))
+    return samples
+
+
+def wait_for(condition, timeout=3.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.02)
+    return True
+
+
+def test_pty_round_trip_with_corrupt_frame_and_ascii():
+    controller = FakeController()
+    parser = FrameParser()
+    try:
+        controller.send(SAMPLES[:2])
+        controller.write(corrupt(encode_frame([SAMPLES[2]])))
+        controller.send(SAMPLES[3:4])
+        controller.send(SAMPLES[4:], binary=False)
+        samples = read_samples(controller.slave_fd, parser, 5)
+    finally:
+        controller.close()
+    # The corrupted frame is dropped, everything around it comes through
+    assert samples == SAMPLES[:2] + SAMPLES[3:]
+    assert parser.malformed >= 1
+    assert parser.frames == 4  # Two binary frames and two lines
+    assert parser.protocol == 'ascii'
+
+
+def test_frame_split_across_reads():
+    data = encode_frame(SAMPLES[:3]) + encode_line(SAMPLES[3]) + encode_frame(SAMPLES[4:])
+    parser = FrameParser()
+    samples = []
+    for i in range(len(data)):
+        samples += parser.feed(data[i:i + 1])
+    assert samples == SAMPLES
+    assert parser.malformed == 0
+
+
+def test_out_of_range_ascii_pots_are_clamped():
+    parser = FrameParser()
+    samples = parser.feed(b"-5 70000 1 0 0 1 0 1\n")
+    assert [(sample.pot_x, sample.pot_y) for sample in samples] == [(0, 65535)]
+    # The step loops index the tables with the raw value
+    tables = SpeedMap.local().current()
+    assert tables.table('X')[samples[0].pot_x] == tables.interval('X', -5)
+    assert tables.table('Y')[samples[0].pot_y] == tables.interval('Y', 70000)
+
+
+def test_broker_publishes_over_pty():
+    pytest.importorskip('serial')
+    from data_broker import data_broker
+
+    controller = FakeController()
+    shared_data = SharedState.create()
+    broker = Process(target=data_broker, args=(shared_data, controller.port_name), daemon=True)
+    broker.start()
+    try:
+        # Opening the port flushes its input, so repeat until the broker is reading
+        ready = Sample(30000, 30000, (0, 0), (0, 0), 0, 5)
+        assert wait_for(lambda: controller.send([ready]) or shared_data['mode2'] == 5, timeout=5.0)
+        controller.write(corrupt(encode_frame([Sample(0, 0, (0, 0), (0, 0), 0, 7)])))
+        controller.send([Sample(30000, 30000, (1, 0), (0, 1), 2, 9)])
+        assert wait_for(lambda: shared_data['mode2'] == 9)
+        assert shared_data['switch_x'] == (1, 0) and shared_data['mode'] == 2
+        controller.send([Sample(30000, 30000, (0, 1), (1, 0), 3, 11)], binary=False)
+        assert wait_for(lambda: shared_data['mode2'] == 11)
+        assert shared_data['switch_y'] == (1, 0) and shared_data['mode'] == 3
+        # The counters are published once a second
+        assert wait_for(lambda: shared_data['broker_frames_dropped'] >= 1)
+    finally:
+        broker.terminate()
+        broker.join()
+        controller.close()
+        shared_data.close()
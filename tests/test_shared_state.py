@@ -0,0 +1,42 @@
+import os
+from multiprocessing import Event, Process
+
+import pytest
+
+from shared_state import create_block, release_block, remove_stale_block
+
+NAME = f"motion_test_{os.getpid()}"
+
+
+def own_block(created, done):
+    shm = create_block(NAME, 64)
+    created.set()
+    done.wait(5)
+    release_block(shm)
+
+
+def test_a_running_owners_block_is_never_removed():
+    created, done = Event(), Event()
+    owner = Process(target=own_block, args=(created, done))
+    owner.start()
+    try:
+        assert created.wait(5)
+        with pytest.raises(RuntimeError):
+            remove_stale_block(NAME)
+        with pytest.raises(RuntimeError):
+            create_block(NAME, 64)
+        assert os.path.exists(f"/dev/shm/{NAME}")
+    finally:
+        done.set()
+        owner.join()
+    assert not remove_stale_block(NAME)
+
+
+def test_a_block_left_by_a_dead_run_is_removed():
+    # Created by a process that exits without releasing it
+    created = Process(target=lambda: (create_block(NAME, 64), os._exit(0)))
+    created.start()
+    created.join()
+    assert os.path.exists(f"/dev/shm/{NAME}")
+    assert remove_stale_block(NAME)
+    assert not os.path.exists(f"/dev/shm/{NAME}")
@@ -0,0 +1,30 @@
+from speed_map import SpeedMap, SPEED_CURVES, DEFAULT_CURVE
+
+
+def curve(name):
+    return dict(DEFAULT_CURVE, SPEED_CURVE_X=SPEED_CURVES.index(name), SPEED_CURVE_Y=SPEED_CURVES.index(name))
+
+
+class RebuildDuringRead(dict):
+    """Tables of one slot, overwritten by the rebuilds published while a lookup reads them."""
+
+    def __init__(self, speed_map, views):
+        super().__init__(views)
+        self.speed_map = speed_map
+
+    def __getitem__(self, motor):
+        view = super().__getitem__(motor)
+        self.speed_map.sync(curve('frequency'))
+        self.speed_map.sync(curve('period'))  # Into the slot of ``view``
+        self.speed_map.sync(curve('piecewise'))
+        return view
+
+
+def test_lookup_rereads_a_table_rebuilt_meanwhile():
+    speed_map = SpeedMap.local(curve('exponential'))
+    speed_map.current()
+    speed_map._current_intervals = RebuildDuringRead(speed_map, speed_map._current_intervals)
+    pot = 40000
+    interval = speed_map.lookup('X', pot)
+    assert interval == speed_map.current().interval('X', pot)
+    assert speed_map.current().curve.SPEED_CURVE_X == SPEED_CURVES.index('piecewise')
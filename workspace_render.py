@@ -0,0 +1,174 @@
+import numpy as np
+from PIL import Image, ImageDraw
+
+# Trajectory preview: how far ahead (in steps) and one dot every N steps
+PREVIEW_STEPS = 200
+PREVIEW_SPACING = 4
+
+# Spacing of the dotted buffer outline, in pixels
+OUTLINE_SPACING = 4
+
+DOT_RADIUS = 2
+
+
+def workspace_geometry(width, height, total_steps_x, total_steps_y, buffer_left, buffer_right, buffer_top, buffer_bottom):
+    # Workspace frame on OLED2, its scale and the buffer outline inside it
+    rect_left = 10
+    rect_top = 20
+    rect_right = width - 10
+    rect_bottom = height - 10
+
+    scale_x = (rect_right - rect_left) / max(total_steps_x, 1)
+    scale_y = (rect_bottom - rect_top) / max(total_steps_y, 1)
+
+    rect_right = rect_left + int(total_steps_x * scale_x)
+    rect_bottom = rect_top + int(total_steps_y * scale_y)
+
+    new_left = rect_left + int(buffer_left * scale_x)
+    new_right = rect_right - int(buffer_right * scale_x)
+    new_top = rect_top + int(buffer_top * scale_y)
+    new_bottom = rect_bottom - int(buffer_bottom * scale_y)
+
+    new_left = max(rect_left, min(new_left, rect_right))
+    new_right = max(rect_left, min(new_right, rect_right))
+    new_top = max(rect_top, min(new_top, rect_bottom))
+    new_bottom = max(rect_top, min(new_bottom, rect_bottom))
+
+    return (rect_left, rect_top, rect_right, rect_bottom), (new_left, new_top, new_right, new_bottom), scale_x, scale_y
+
+
+def pil_mask(size, draw_fn):
+    # Bool array of a small bitmap drawn with PIL, so cached sprites match PIL output
+    image = Image.new("1", size)
+    draw_fn(ImageDraw.Draw(image))
+    return np.asarray(image, dtype=bool)
+
+
+def blit(framebuffer, mask, x, y):
+    # OR ``mask`` into ``framebuffer`` at (x, y), clipped to the framebuffer
+    height, width = framebuffer.shape
+    top, left = max(y, 0), max(x, 0)
+    bottom, right = min(y + mask.shape[0], height), min(x + mask.shape[1], width)
+    if top < bottom and left < right:
+        framebuffer[top:bottom, left:right] |= mask[top - y:bottom - y, left - x:right - x]
+
+
+class GlyphCache:
+    """Per-character bitmaps of one font, drawn by PIL once and blitted after that.
+
+    PIL places each glyph at the previous one's hinted advance plus the pair's
+    kerning, which ``getlength`` does not report. The distance between two
+    characters is measured once per pair from rendered mask widths instead,
+    with a trailing "|" so the string width ends on a known glyph.
+    """
+
+    def __init__(self, font):
+        self.font = font
+        self.glyphs = {}
+        self.pairs = {}
+
+    def glyph(self, char):
+        mask = self.glyphs.get(char)
+        if mask is None:
+            _, _, right, bottom = self.font.getbbox(char)
+            mask = self.glyphs[char] = pil_mask((max(right, 1), max(bottom, 1)),
+                                                lambda draw: draw.text((0, 0), char, fill="white", font=self.font))
+        return mask
+
+    def _width(self, text):
+        return self.font.getmask2(text, mode="1")[0].size[0]
+
+    def advance(self, previous, char):
+        # Pen movement from ``previous`` to ``char``, kerning included
+        pair = previous + char
+        advance = self.pairs.get(pair)
+        if advance is None:
+            advance = self.pairs[pair] = self._width(pair + "|") - self._width(char + "|")
+        return advance
+
+    def draw_text(self, framebuffer, x, y, text):
+        previous = None
+        for char in text:
+            if previous is not None:
+                x += self.advance(previous, char)
+            blit(framebuffer, self.glyph(char), x, y)
+            previous = char
+
+
+class WorkspaceRenderer:
+    """NumPy renderer of the OLED2 workspace map.
+
+    The frame, dotted buffer outline and trajectory offsets are built as index
+    arrays once per layout (total steps and buffers) and reused; each frame
+    only copies the background, sets the preview and position pixels and
+    blits the text from a glyph cache. The result is packed to 1 bit per pixel
+    and wrapped by ``Image.frombuffer`` without another copy.
+    """
+
+    def __init__(self, size, font):
+        self.width, self.height = size
+        self.text = GlyphCache(font)
+        self.dot = pil_mask((2 * DOT_RADIUS + 1,) * 2, lambda draw: draw.ellipse((0, 0, 2 * DOT_RADIUS, 2 * DOT_RADIUS), fill="white"))
+        self.framebuffer = np.zeros((self.height, self.width), dtype=bool)
+        self.layout = None
+        self.layout_builds = 0
+
+    def _prepare(self, layout):
+        if layout == self.layout:
+            return
+        rect, outline, scale_x, scale_y = workspace_geometry(self.width, self.height, *layout)
+        rect_left, rect_top, rect_right, rect_bottom = rect
+        new_left, new_top, new_right, new_bottom = outline
+
+        background = np.zeros((self.height, self.width), dtype=bool)
+        background[[rect_top, rect_bottom], rect_left:rect_right + 1] = True
+        background[rect_top:rect_bottom + 1, [rect_left, rect_right]] = True
+        dots_y = np.arange(rect_top, rect_bottom, OUTLINE_SPACING)
+        dots_x = np.arange(rect_left, rect_right, OUTLINE_SPACING)
+        background[dots_y, new_left] = True
+        background[dots_y, new_right] = True
+        background[new_top, dots_x] = True
+        background[new_bottom, dots_x] = True
+
+        self.background = background
+        self.rect = rect
+        # Pixel offset of every preview dot, truncated the same way as int(step * scale)
+        preview = np.arange(0, PREVIEW_STEPS, PREVIEW_SPACING)
+        self.preview_x = (preview * scale_x).astype(np.int64)
+        self.preview_y = (preview * scale_y).astype(np.int64)
+        self.layout = layout
+        self.layout_builds += 1
+
+    def render(self, layout, steps_x, steps_y, dir_x, dir_y, texts=()):
+        self._prepare(layout)
+        total_steps_x, total_steps_y = layout[0], layout[1]
+        rect_left, rect_top, rect_right, rect_bottom = self.rect
+        framebuffer = self.framebuffer
+        np.copyto(framebuffer, self.background)
+
+        pos_x = rect_left + int((steps_x / total_steps_x) * (rect_right - rect_left)) if total_steps_x > 0 else rect_left
+        pos_y = rect_bottom - int((steps_y / total_steps_y) * (rect_bottom - rect_top)) if total_steps_y > 0 else rect_bottom
+
+        if dir_x != (0, 0) or dir_y != (0, 0):
+            future_steps_x = min(PREVIEW_STEPS, total_steps_x - steps_x) if dir_x == (1, 0) else max(-PREVIEW_STEPS, -steps_x)
+            future_steps_y = min(PREVIEW_STEPS, total_steps_y - steps_y) if dir_y == (1, 0) else max(-PREVIEW_STEPS, -steps_y)
+            count = (max(abs(future_steps_x), abs(future_steps_y)) + PREVIEW_SPACING - 1) // PREVIEW_SPACING
+            if dir_x != (0, 0):
+                sign = 1 if dir_x == (1, 0) else -1
+                xs = np.clip(pos_x + sign * self.preview_x[:count], rect_left, rect_right)
+            else:
+                xs = np.full(count, pos_x)
+            if dir_y != (0, 0):
+                sign = 1 if dir_y == (1, 0) else -1
+                ys = np.clip(pos_y - sign * self.preview_y[:count], rect_top, rect_bottom)
+            else:
+                ys = np.full(count, pos_y)
+            inside = (xs >= 0) & (xs < self.width) & (ys >= 0) & (ys < self.height)
+            framebuffer[ys[inside], xs[inside]] = True
+
+        blit(framebuffer, self.dot, pos_x - DOT_RADIUS, pos_y - DOT_RADIUS)
+        for (x, y), text in texts:
+            self.text.draw_text(framebuffer, x, y, text)
+
+        packed = np.packbits(framebuffer, axis=1)
+        return Image.frombuffer("1", (self.width, self.height), packed, "raw", "1", 0, 1)